@@ -3,12 +3,14 @@ from homeassistant.core import HomeAssistant
 from homeassistant.helpers.typing import ConfigType
 from homeassistant.helpers import config_validation as cv
 from .const import DOMAIN
+from .services import async_setup_services
 
 # Config entry only (no YAML)
 CONFIG_SCHEMA = cv.config_entry_only_config_schema(DOMAIN)
 
 async def async_setup(hass: HomeAssistant, config: dict):
     """Set up Lepro LED integration (not via YAML)."""
+    async_setup_services(hass)
     return True
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
@@ -17,12 +19,24 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     hass.data[DOMAIN][entry.entry_id] = entry.data
 
     # THIS is the correct version
-    await hass.config_entries.async_forward_entry_setups(entry, ["light", "number"])
+    await hass.config_entries.async_forward_entry_setups(entry, ["light", "number", "sensor"])
+    entry.async_on_unload(entry.add_update_listener(async_reload_entry))
     return True
 
+async def async_reload_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Reload the entry when its options change."""
+    await hass.config_entries.async_reload(entry.entry_id)
+
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload a config entry."""
-    unload_ok = await hass.config_entries.async_unload_platforms(entry, ["light", "number"])
+    unload_ok = await hass.config_entries.async_unload_platforms(entry, ["light", "number", "sensor"])
     if unload_ok:
-        hass.data[DOMAIN].pop(entry.entry_id)
+        data = hass.data[DOMAIN].pop(entry.entry_id)
+        # stop the supervised MQTT loop, it would otherwise reconnect forever
+        if isinstance(data, dict) and data.get("ack_tracker"):
+            # pending retries would republish (and reconnect) after unload
+            data["ack_tracker"].cancel()
+        mqtt_client = data.get("mqtt_client") if isinstance(data, dict) else None
+        if mqtt_client:
+            await mqtt_client.disconnect()
     return unload_ok
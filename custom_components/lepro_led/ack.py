@@ -0,0 +1,197 @@
+"""Command acknowledgement tracking and round-trip latency per device."""
+
+from __future__ import annotations
+import asyncio
+import logging
+import time
+
+from .metrics import Histogram
+from .ratelimit import PRIORITY_EFFECT
+
+_LOGGER = logging.getLogger(__name__)
+
+# Seconds to wait for the device to report a command's values back
+ACK_DEADLINE = 5.0
+# Republishes of an unacknowledged command before it is flagged
+ACK_RETRIES = 1
+
+# dp keys compared between a command and the device's report
+ACK_KEYS = ("d1", "d2", "d50", "d52", "d60")
+
+
+class DeviceAckStats:
+    """Per-device command counters and latency histograms."""
+
+    def __init__(self):
+        self.sent = 0
+        self.acked = 0
+        self.retried = 0
+        self.timed_out = 0
+        self.superseded = 0
+        self.unresponsive = False
+        self.last_ack_ms = None
+        # our own set echoed back by the broker: cloud round trip
+        self.broker_latency = Histogram()
+        # device rpt/getr reflecting the command: full round trip
+        self.ack_latency = Histogram()
+
+    def as_dict(self):
+        return {
+            "sent": self.sent,
+            "acked": self.acked,
+            "retried": self.retried,
+            "timed_out": self.timed_out,
+            "superseded": self.superseded,
+            "unresponsive": self.unresponsive,
+            "last_ack_ms": self.last_ack_ms,
+            "broker_latency_ms": self.broker_latency.as_dict(),
+            "ack_latency_ms": self.ack_latency.as_dict(),
+        }
+
+
+class _InFlight:
+    __slots__ = ("did", "cmd_id", "topic", "raw", "data", "priority", "sent_at", "retries", "timer")
+
+    def __init__(self, did, cmd_id, topic, raw, data, priority):
+        self.did = did
+        self.cmd_id = cmd_id
+        self.topic = topic
+        self.raw = raw
+        self.data = data
+        self.priority = priority
+        self.sent_at = time.monotonic()
+        self.retries = 0
+        self.timer = None
+
+
+class CommandTracker:
+    """Match published prp/set commands with the device's follow-up reports.
+
+    A command is acknowledged by an rpt/getr from its device whose reported
+    dp values equal the commanded ones (or that carries the command id).
+    Our own set coming back through the broker only measures the cloud leg.
+    Commands without an ack within the deadline are republished, then flagged.
+    """
+
+    def __init__(self, publish, deadline=ACK_DEADLINE, retries=ACK_RETRIES):
+        self._publish = publish
+        self.deadline = deadline
+        self.retries = retries
+        self._in_flight = {}  # did -> {cmd_id: _InFlight}
+        self._retries = {}  # republish task -> did
+        self.devices = {}  # did -> DeviceAckStats
+
+    def stats(self, did):
+        stats = self.devices.get(did)
+        if stats is None:
+            stats = self.devices[did] = DeviceAckStats()
+        return stats
+
+    def track(self, did, cmd_id, topic, raw, data, priority=PRIORITY_EFFECT):
+        """Register a command that has actually gone out to the broker (in the given lane)."""
+        stats = self.stats(did)
+        stats.sent += 1
+        pending = self._in_flight.setdefault(did, {})
+        # an older command sharing a dp with this one can no longer be reported
+        # back as sent, and retrying it would undo this one
+        for old in list(pending.values()):
+            if old.data.keys() & data.keys():
+                self._drop(old)
+                stats.superseded += 1
+        cmd = _InFlight(did, cmd_id, topic, raw, data, priority)
+        cmd.timer = asyncio.get_running_loop().call_later(self.deadline, self._expire, cmd)
+        pending[cmd_id] = cmd
+
+    def on_message(self, did, message_type, payload):
+        """Feed every routed state message; returns the number of commands acknowledged."""
+        pending = self._in_flight.get(did)
+        if not pending:
+            return 0
+        now = time.monotonic()
+        cmd_id = payload.get("id")
+
+        if message_type == "set":
+            cmd = pending.get(cmd_id)
+            if cmd is not None and cmd.retries == 0:
+                self.stats(did).broker_latency.record((now - cmd.sent_at) * 1000)
+            return 0
+
+        data = payload.get("d") or {}
+        acked = 0
+        for cmd in list(pending.values()):
+            if cmd.cmd_id == cmd_id or self._reflects(cmd.data, data):
+                latency = (now - cmd.sent_at) * 1000
+                stats = self.stats(did)
+                stats.acked += 1
+                stats.last_ack_ms = round(latency, 1)
+                stats.ack_latency.record(latency)
+                if stats.unresponsive:
+                    _LOGGER.info("Lepro device %s is responding again", did)
+                stats.unresponsive = False
+                self._drop(cmd)
+                acked += 1
+        return acked
+
+    @staticmethod
+    def _reflects(command, reported):
+        """True if the report carries at least one commanded key and all of them match."""
+        matched = False
+        for key in ACK_KEYS:
+            if key in command and key in reported:
+                if command[key] != reported[key]:
+                    return False
+                matched = True
+        return matched
+
+    def _drop(self, cmd):
+        if cmd.timer:
+            cmd.timer.cancel()
+        pending = self._in_flight.get(cmd.did)
+        if pending:
+            pending.pop(cmd.cmd_id, None)
+
+    def _expire(self, cmd):
+        stats = self.stats(cmd.did)
+        if cmd.retries < self.retries:
+            cmd.retries += 1
+            stats.retried += 1
+            _LOGGER.debug("No ack from %s for command %s, republishing", cmd.did, cmd.cmd_id)
+            task = asyncio.create_task(self._retry(cmd))
+            self._retries[task] = cmd.did
+            task.add_done_callback(self._retries.pop)
+            cmd.timer = asyncio.get_running_loop().call_later(self.deadline, self._expire, cmd)
+            return
+        stats.timed_out += 1
+        if not stats.unresponsive:
+            _LOGGER.warning(
+                "Lepro device %s did not acknowledge command %s within %.0fs", cmd.did, cmd.cmd_id, self.deadline * (self.retries + 1)
+            )
+        stats.unresponsive = True
+        self._drop(cmd)
+
+    async def _retry(self, cmd):
+        try:
+            # same lane as the original: a retried turn-off must not queue behind colour updates
+            sent = await self._publish(cmd.topic, cmd.raw, cmd.priority)
+        except Exception as e:
+            _LOGGER.error("Failed to republish MQTT command: %s", e)
+            return
+        if not sent:
+            # queued while the broker is unreachable: that says nothing about the device
+            self._drop(cmd)
+
+    def cancel(self, did=None):
+        """Forget in-flight commands (of one device, or all) and stop their republishes."""
+        for task, task_did in list(self._retries.items()):
+            if did is None or task_did == did:
+                task.cancel()
+        for d in [did] if did is not None else list(self._in_flight):
+            for cmd in list(self._in_flight.get(d, {}).values()):
+                self._drop(cmd)
+            self._in_flight.pop(d, None)
+
+    def as_dict(self):
+        return {
+            "in_flight": sum(len(p) for p in self._in_flight.values()),
+            "devices": {did: stats.as_dict() for did, stats in self.devices.items()},
+        }
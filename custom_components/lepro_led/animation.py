@@ -0,0 +1,124 @@
+"""Client-side segment animations: parametric patterns rendered a whole cycle at a time.
+
+Rendering (NumPy, run in the executor) produces every frame of one cycle as a
+(frames, segments, 3) array, which is encoded to d50 strings up front; playback
+then only cycles through the precomputed strings.
+"""
+
+from __future__ import annotations
+import asyncio
+
+from . import codec
+
+PATTERN_CHASE = "chase"
+PATTERN_FIRE = "fire"
+PATTERN_COLOR_WHEEL = "color_wheel"
+PATTERN_TWINKLE = "twinkle"
+
+# Default palette per pattern (first colour is the main one)
+PATTERN_COLORS = {
+    PATTERN_CHASE: ((255, 255, 255), (0, 0, 0)),
+    PATTERN_FIRE: ((255, 40, 0), (255, 160, 0)),
+    PATTERN_COLOR_WHEEL: (),
+    PATTERN_TWINKLE: ((255, 255, 255), (0, 0, 60)),
+}
+PATTERNS = tuple(PATTERN_COLORS)
+
+# Segments lit behind the head of a chase
+CHASE_TAIL = 5
+# Fixed seed: the same pattern renders the same (looping) cycle every time
+RANDOM_SEED = 0x1E90
+
+
+def _palette(np, pattern, colors):
+    palette = list(colors or ()) + list(PATTERN_COLORS[pattern])[len(colors or ()):]
+    return np.asarray(palette, dtype=np.float32).reshape(-1, 3)
+
+
+def _chase(np, phase, pos, segments, palette):
+    # distance (in segments) behind the moving head, wrapping around the strip
+    dist = (phase[:, None] * segments - pos[None, :] * segments) % segments
+    level = np.clip(1 - dist / CHASE_TAIL, 0, 1)[..., None]
+    return palette[1] + (palette[0] - palette[1]) * level
+
+
+def _color_wheel(np, phase, pos, segments, palette):
+    hue = (pos[None, :] + phase[:, None]) % 1.0
+    # hsv -> rgb with s = v = 1
+    k = (np.array([5.0, 3.0, 1.0]) + hue[..., None] * 6) % 6
+    return 255 * (1 - np.clip(np.minimum(k, 4 - k), 0, 1))
+
+
+def _fire(np, phase, pos, segments, palette):
+    rng = np.random.default_rng(RANDOM_SEED)
+    frames = len(phase)
+    heat = rng.random((frames, segments))
+    # smooth over time (circularly, so the cycle loops without a jump) and space
+    for shift in (1, 2):
+        heat = (heat + np.roll(heat, shift, axis=0)) / 2
+    heat = (heat + np.roll(heat, 1, axis=1) + np.roll(heat, -1, axis=1)) / 3
+    heat = (heat - heat.min()) / max(float(np.ptp(heat)), 1e-6)
+    color = palette[0] + (palette[1] - palette[0]) * heat[..., None]
+    return color * (0.35 + 0.65 * heat[..., None])
+
+
+def _twinkle(np, phase, pos, segments, palette):
+    rng = np.random.default_rng(RANDOM_SEED)
+    # whole number of blinks per cycle keeps the loop seamless
+    rate = rng.integers(1, 4, segments)
+    offset = rng.random(segments)
+    wave = np.sin(2 * np.pi * (phase[:, None] * rate[None, :] + offset[None, :]))
+    level = (np.clip(wave, 0, 1) ** 4)[..., None]
+    return palette[1] + (palette[0] - palette[1]) * level
+
+
+_RENDERERS = {
+    PATTERN_CHASE: _chase,
+    PATTERN_FIRE: _fire,
+    PATTERN_COLOR_WHEEL: _color_wheel,
+    PATTERN_TWINKLE: _twinkle,
+}
+
+
+def render_cycle(pattern, segments, fps, period, colors=None, tolerance=0):
+    """Render one cycle of pattern as a list of d50 strings (blocking, imports NumPy)."""
+    import numpy as np
+
+    frames = max(1, round(period * fps))
+    phase = np.arange(frames, dtype=np.float32) / frames
+    pos = np.arange(segments, dtype=np.float32) / segments
+    rgb = _RENDERERS[pattern](np, phase, pos, segments, _palette(np, pattern, colors))
+    rgb = np.clip(np.rint(rgb), 0, 255).astype(np.uint8)
+    # each (segments, 3) uint8 frame is already packed RGB
+    return [codec.format_d50(frame.data, codec.EFFECT_SOLID, None, tolerance) for frame in rgb]
+
+
+class Animation:
+    """Loop precomputed d50 frames at fps until cancelled.
+
+    Frames are due on a fixed grid; frames that are already late when the
+    previous publish returns are skipped, so a slow publish path lowers the
+    frame rate instead of building a backlog.
+    """
+
+    def __init__(self, frames, fps):
+        self.frames = frames
+        self.fps = fps
+        self.frames_sent = 0
+        self.frames_dropped = 0
+
+    async def async_run(self, send_frame):
+        loop = asyncio.get_running_loop()
+        interval = 1 / self.fps
+        count = len(self.frames)
+        begin = loop.time()
+        step = 0
+        while True:
+            await send_frame(self.frames[step % count])
+            self.frames_sent += 1
+            step += 1
+            await asyncio.sleep(max(0.0, begin + step * interval - loop.time()))
+            due = int((loop.time() - begin) / interval)
+            if due > step:
+                self.frames_dropped += due - step
+                step = due
@@ -0,0 +1,266 @@
+"""Lepro cloud REST client and setup bootstrap."""
+
+from __future__ import annotations
+import asyncio
+import logging
+import ssl
+import time
+from dataclasses import dataclass, field
+
+import aiofiles
+
+from .const import LOGIN_URL, FAMILY_LIST_URL, USER_PROFILE_URL, DEVICE_LIST_URL
+
+_LOGGER = logging.getLogger(__name__)
+
+# Max device-list requests in flight at once when an account has several families
+DEVICE_LIST_CONCURRENCY = 8
+
+# "code" values of an HTTP 200 body that mean the token was rejected (0 is success)
+AUTH_ERROR_CODES = frozenset({401, 403})
+
+APP_HEADERS = {
+    "App-Version": "1.0.9.202",
+    "Device-Model": "custom_integration",
+    "Device-System": "custom",
+    "GMT": "+0",
+    "Host": "api-na-iot.lepro.com",
+    "Platform": "2",
+    "Screen-Size": "1536*2048",
+    "User-Agent": "LE/1.0.9.202 (Custom Integration)",
+}
+
+
+class LeproApiError(Exception):
+    """Raised when a Lepro cloud request fails."""
+
+
+async def async_login(session, account, password, mac, language="it", fcm_token=""):
+    """Perform login and return bearer token."""
+    timestamp = str(int(time.time()))
+    payload = {
+        "platform": "2",
+        "account": account,
+        "password": password,
+        "mac": mac,
+        "timestamp": timestamp,
+        "language": language,
+        "fcmToken": fcm_token,
+    }
+    headers = {
+        **APP_HEADERS,
+        "Content-Type": "application/json",
+        "Language": language,
+        "Slanguage": language,
+        "Timestamp": timestamp,
+    }
+
+    async with session.post(LOGIN_URL, json=payload, headers=headers) as resp:
+        if resp.status != 200:
+            _LOGGER.error("Login failed with status %s", resp.status)
+            return None
+        data = await resp.json()
+        if data.get("code") != 0:
+            _LOGGER.error("Login failed with message: %s", data.get("msg"))
+            return None
+        token = data.get("data", {}).get("token")
+        return token
+
+
+async def download_cert_file(session, url, path, headers):
+    """Download a certificate file asynchronously."""
+    async with session.get(url, headers=headers) as resp:
+        if resp.status != 200:
+            raise LeproApiError(f"Failed to download {url}: {resp.status}")
+        data = await resp.read()
+        async with aiofiles.open(path, 'wb') as f:
+            await f.write(data)
+
+
+def create_ssl_context(root_ca_path, client_cert_path, keyfile_path):
+    """Create SSL context in a thread-safe manner."""
+    context = ssl.create_default_context()
+    context.load_verify_locations(cafile=root_ca_path)
+    context.load_cert_chain(certfile=client_cert_path, keyfile=keyfile_path)
+    return context
+
+
+class LeproCloudApi:
+    """Authenticated requests against the Lepro cloud on a shared session."""
+
+    def __init__(self, session, account, password, mac, language="it", fcm_token=""):
+        self._session = session
+        self._account = account
+        self._password = password
+        self._mac = mac
+        self._language = language
+        self._fcm_token = fcm_token
+        self.token = None
+        # total HTTP requests issued, for diagnostics
+        self.request_count = 0
+        self._login_lock = asyncio.Lock()
+
+    async def async_login(self):
+        self.request_count += 1
+        self.token = await async_login(
+            self._session, self._account, self._password, self._mac, self._language, self._fcm_token
+        )
+        if self.token is None:
+            raise LeproApiError("Failed to login to Lepro API")
+        return self.token
+
+    async def _async_refresh_token(self, stale):
+        """Log in unless another request already replaced the stale token."""
+        async with self._login_lock:
+            if self.token == stale:
+                await self.async_login()
+
+    def headers(self):
+        """Request headers with a fresh timestamp."""
+        return {
+            **APP_HEADERS,
+            "Authorization": f"Bearer {self.token}",
+            "Accept-Encoding": "gzip",
+            "Language": self._language,
+            "Slanguage": self._language,
+            "Timestamp": str(int(time.time())),
+        }
+
+    async def _async_get_json(self, url, what, retry=True):
+        if self.token is None:
+            await self._async_refresh_token(None)
+        token = self.token
+        self.request_count += 1
+        async with self._session.get(url, headers=self.headers()) as resp:
+            status = resp.status
+            if status == 200:
+                data = await resp.json()
+                # errors can also come back as a 200 with a non-zero code in the body
+                code = data.get("code", 0) if isinstance(data, dict) else 0
+                if code == 0:
+                    return data
+                if code in AUTH_ERROR_CODES:
+                    status = 401
+                else:
+                    raise LeproApiError(f"Failed to get {what} from Lepro API: code {code} ({data.get('msg')})")
+        if status == 401 and retry:
+            # token (possibly restored from cache) expired: log in again once
+            await self._async_refresh_token(token)
+            return await self._async_get_json(url, what, retry=False)
+        raise LeproApiError(f"Failed to get {what} from Lepro API: {status}")
+
+    async def async_get_profile(self):
+        """Return the user profile (uid and MQTT broker/cert info)."""
+        user_data = await self._async_get_json(USER_PROFILE_URL, "user profile")
+        try:
+            user_data["data"]["uid"]
+            user_data["data"]["mqtt"]
+        except (KeyError, TypeError) as e:
+            raise LeproApiError(f"Failed to parse user profile response: {e}") from e
+        return user_data["data"]
+
+    async def async_get_families(self, timestamp=None):
+        family_url = FAMILY_LIST_URL.format(timestamp=timestamp or int(time.time()))
+        family_data = await self._async_get_json(family_url, "family list")
+        try:
+            return family_data["data"]["list"]
+        except (KeyError, TypeError) as e:
+            raise LeproApiError(f"Failed to parse family list response: {e}") from e
+
+    async def async_get_devices(self, fid, timestamp=None):
+        device_url = DEVICE_LIST_URL.format(fid=fid, timestamp=timestamp or int(time.time()))
+        device_data = await self._async_get_json(device_url, "device list")
+        # "data" may be null rather than an empty dict
+        return (device_data.get("data") or {}).get("list") or []
+
+    async def async_download(self, url, path):
+        self.request_count += 1
+        await download_cert_file(self._session, url, path, self.headers())
+
+
+async def async_get_all_devices(api, families, limit=DEVICE_LIST_CONCURRENCY, timestamp=None):
+    """Fetch the device lists of every family concurrently and merge them by did."""
+    semaphore = asyncio.Semaphore(limit)
+
+    async def fetch(family):
+        async with semaphore:
+            return await api.async_get_devices(family["fid"], timestamp)
+
+    families = [family for family in families if family.get("fid") is not None]
+    if not families:
+        raise LeproApiError("No family found in Lepro account")
+    lists = await _gather(*(fetch(family) for family in families))
+
+    devices = {}
+    for device_list in lists:
+        for device in device_list:
+            # a device shared between families is listed once
+            devices.setdefault(str(device["did"]), device)
+    return list(devices.values())
+
+
+@dataclass
+class BootstrapResult:
+    """Everything async_setup_entry needs from the cloud."""
+
+    mqtt_info: dict
+    devices: list
+    ssl_context: ssl.SSLContext
+    timings: dict = field(default_factory=dict)
+
+
+async def _timed(timings, stage, aw):
+    """Await aw and record its duration (ms) under stage."""
+    start = time.monotonic()
+    try:
+        return await aw
+    finally:
+        timings[stage] = round((time.monotonic() - start) * 1000, 1)
+
+
+async def _gather(*aws):
+    """asyncio.gather that cancels the remaining work on the first failure."""
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+
+async def async_bootstrap(hass, api, root_ca_path, client_cert_path, keyfile_path):
+    """Log in and fetch MQTT credentials and devices, running independent steps concurrently.
+
+    login -> profile -> (root CA | client cert) -> SSL context
+          -> family list -> device list of every family (concurrent)
+
+    Login is skipped when api already holds a token (e.g. from the cache).
+    """
+    timings = {}
+    start = time.monotonic()
+
+    if api.token is None:
+        await _timed(timings, "login", api.async_login())
+
+    async def certificates():
+        profile = await _timed(timings, "profile", api.async_get_profile())
+        mqtt_info = profile["mqtt"]
+        await _gather(
+            _timed(timings, "root_ca", api.async_download(mqtt_info["root"], root_ca_path)),
+            _timed(timings, "client_cert", api.async_download(mqtt_info["cert"], client_cert_path)),
+        )
+        ssl_context = await _timed(timings, "ssl_context", hass.async_add_executor_job(
+            create_ssl_context, root_ca_path, client_cert_path, keyfile_path
+        ))
+        return mqtt_info, ssl_context
+
+    async def devices():
+        families = await _timed(timings, "family_list", api.async_get_families())
+        return await _timed(timings, "device_list", async_get_all_devices(api, families))
+
+    (mqtt_info, ssl_context), device_list = await _gather(certificates(), devices())
+
+    timings["total"] = round((time.monotonic() - start) * 1000, 1)
+    _LOGGER.debug("Lepro bootstrap timings (ms): %s", timings)
+    return BootstrapResult(mqtt_info, device_list, ssl_context, timings)
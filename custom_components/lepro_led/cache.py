@@ -0,0 +1,108 @@
+"""On-disk warm-start cache of the cloud bootstrap (token, certificates, device list)."""
+
+from __future__ import annotations
+import datetime
+import hashlib
+import json
+import logging
+import os
+import time
+
+import aiofiles
+
+_LOGGER = logging.getLogger(__name__)
+
+CACHE_VERSION = 1
+
+# Certificates closer than this to expiry are treated as invalid
+CERT_MIN_REMAINING = datetime.timedelta(days=1)
+
+# Device fields that matter for entity creation; live state is ignored
+DEVICE_IDENTITY_KEYS = ("did", "fid", "name", "series")
+
+
+def cache_path(cert_dir, entry_id):
+    return os.path.join(cert_dir, f"{entry_id}_cache.json")
+
+
+def file_fingerprint(path):
+    """SHA-256 of a file, or None if it can't be read."""
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def _cert_valid(path, fingerprint):
+    """True if the PEM at path matches fingerprint and is not about to expire."""
+    from cryptography import x509
+
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return False
+    if hashlib.sha256(data).hexdigest() != fingerprint:
+        return False
+    try:
+        cert = x509.load_pem_x509_certificate(data)
+    except ValueError:
+        return False
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return cert.not_valid_after_utc - now > CERT_MIN_REMAINING
+
+
+def cache_is_valid(cache, root_ca_path, client_cert_path):
+    """Check a loaded cache against the certificate files on disk (blocking)."""
+    if not cache or cache.get("version") != CACHE_VERSION:
+        return False
+    if not cache.get("mqtt_info") or not cache.get("devices"):
+        return False
+    certs = cache.get("certs", {})
+    return _cert_valid(root_ca_path, certs.get("root_ca")) and _cert_valid(
+        client_cert_path, certs.get("client_cert")
+    )
+
+
+def build_cache(token, mqtt_info, devices, root_ca_path, client_cert_path):
+    """Build the cache document (blocking: fingerprints the cert files)."""
+    return {
+        "version": CACHE_VERSION,
+        "saved_at": int(time.time()),
+        "token": token,
+        "mqtt_info": mqtt_info,
+        "devices": devices,
+        "certs": {
+            "root_ca": file_fingerprint(root_ca_path),
+            "client_cert": file_fingerprint(client_cert_path),
+        },
+    }
+
+
+def device_identity(devices):
+    """Comparable view of a device list ignoring live state."""
+    return {
+        str(d.get("did")): tuple(d.get(k) for k in DEVICE_IDENTITY_KEYS)
+        for d in devices
+    }
+
+
+async def async_load_cache(path):
+    """Load the cache file; None if missing or unreadable."""
+    try:
+        async with aiofiles.open(path, "r") as f:
+            return json.loads(await f.read())
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        _LOGGER.warning("Ignoring unreadable Lepro cache %s: %s", path, e)
+        return None
+
+
+async def async_save_cache(path, cache):
+    try:
+        async with aiofiles.open(path, "w") as f:
+            await f.write(json.dumps(cache))
+    except OSError as e:
+        _LOGGER.warning("Failed to write Lepro cache %s: %s", path, e)
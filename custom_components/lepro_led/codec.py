@@ -0,0 +1,307 @@
+"""Encoder/decoder for the Lepro d50 (segment colours + effect) and d60 (special effect) strings.
+
+Pure functions with no Home Assistant dependency. Decoding is keyed on the
+wire string and encoding on (segments, effect, speed), both through a bounded
+LRU cache, so repeated rpt payloads and repeated commands cost a dict lookup.
+Segment colours travel as packed RGB bytes (3 per segment, see segments.py);
+the segment count is whatever the payload / buffer holds.
+"""
+
+from __future__ import annotations
+import math
+import re
+from functools import lru_cache
+from itertools import groupby
+from typing import NamedTuple
+
+SEGMENT_COUNT = 25  # default strip length, see segments.SERIES_SEGMENTS
+DEFAULT_COLOR = (255, 255, 255)
+DEFAULT_SPEED = 50
+DEFAULT_SENSITIVITY = 50
+CACHE_SIZE = 512
+
+# d50 effects (d2=2)
+EFFECT_SOLID = "solid"
+EFFECT_BREATH = "breath"
+EFFECT_GRADIENT = "gradient"
+EFFECT_CLOCKWISE = "clockwise"
+EFFECT_COUNTERCLOCKWISE = "counterclockwise"
+EFFECT_CIRCULAR = "circular"
+
+# d60 special effects (d2=3)
+EFFECT_FLASH = "flash"
+EFFECT_WAVE1 = "wave_1"
+EFFECT_WAVE2 = "wave_2"
+EFFECT_WAVE3 = "wave_3"
+EFFECT_WAVE4 = "wave_4"
+EFFECT_LASER1 = "laser_1"
+EFFECT_LASER2 = "laser_2"
+EFFECT_LASER3 = "laser_3"
+EFFECT_LASER4 = "laser_4"
+
+# Mapping effect -> d60 7-char prefix (first 7 digits)
+SPECIAL_EFFECT_TO_D60_PREFIX = {
+    EFFECT_FLASH: "2000064",
+    EFFECT_WAVE1: "2010064",
+    EFFECT_WAVE2: "2020064",
+    EFFECT_WAVE3: "2030064",
+    EFFECT_WAVE4: "2040064",
+    EFFECT_LASER1: "2050064",
+    EFFECT_LASER2: "2060064",
+    EFFECT_LASER3: "2070064",
+    EFFECT_LASER4: "2080064",
+}
+D60_PREFIX_TO_SPECIAL_EFFECT = {v: k for k, v in SPECIAL_EFFECT_TO_D60_PREFIX.items()}
+
+# d60 sensitivity is encoded 0..100 percent -> 0x00..0x63
+SENSITIVITY_MAX_HEX = 0x63
+
+# d50 effect tails; {s} is the 4-hex speed
+D50_EFFECT_TAILS = {
+    EFFECT_SOLID: "000640000E1",
+    EFFECT_BREATH: "000640000E4{s}0000{s}1664",
+    EFFECT_GRADIENT: "100640000E3{s}C2O6{s}",
+    EFFECT_CLOCKWISE: "00164{s}E1",
+    EFFECT_COUNTERCLOCKWISE: "00264{s}E1",
+    EFFECT_CIRCULAR: "100640000E1C2O6{s}",
+}
+
+# One alternation over all tails; the group name is the effect and, except
+# for solid, captures the speed hex.
+_D50_EFFECT_RE = re.compile(
+    r"(?P<solid>)000640000E1"
+    r"|000640000E4(?P<breath>[0-9A-F]{4})0000[0-9A-F]{4}1664"
+    r"|100640000E3(?P<gradient>[0-9A-F]{4})C2O6[0-9A-F]{4}"
+    r"|00164(?P<clockwise>[0-9A-F]{4})E1"
+    r"|00264(?P<counterclockwise>[0-9A-F]{4})E1"
+    r"|100640000E1C2O6(?P<circular>[0-9A-F]{4})"
+)
+
+_COLOR_MARKER = "P1000"
+_LENGTH_MARKER = "F21000"
+_EFFECT_MARKER = "U3V3"
+
+
+class D50State(NamedTuple):
+    """Decoded d50 payload."""
+
+    segments: bytes  # packed RGB, one triplet per segment the device reported
+    effect: str
+    speed: int | None  # None when the effect carries no speed
+
+
+@lru_cache(maxsize=None)
+def _speed_tables():
+    """Build the speed lookup tables once.
+
+    The firmware curve is raw = -117.41 * ln(speed + 1) + 597.75 on a 12-bit
+    raw value, with "1000" meaning speed 0. Returns (percent -> hex for
+    0..100, raw -> percent for 0..0xFFF); every hex produced by the first
+    table maps back to exactly the same percent.
+    """
+    to_hex = ["1000"]
+    for speed in range(1, 101):
+        raw = int(round(-117.41 * math.log(speed + 1) + 597.75))
+        to_hex.append(f"0{raw:03X}")
+
+    from_raw = [
+        max(0, min(100, round(math.exp((raw - 597.75) / -117.41) - 1)))
+        for raw in range(0x1000)
+    ]
+    for speed in range(1, 101):
+        from_raw[int(to_hex[speed][1:], 16)] = speed
+    return tuple(to_hex), tuple(from_raw)
+
+
+def hex_to_speed(hex_str):
+    """Convert 4-digit hex speed value to percentage (0-100)"""
+    code = hex_str.upper()
+    if code == "1000":
+        return 0
+    return _speed_tables()[1][int(code[1:], 16)]
+
+
+def speed_to_hex(speed):
+    """Convert percentage (0-100) to 4-digit hex speed value"""
+    return _speed_tables()[0][max(0, min(100, int(round(speed))))]
+
+
+def _runs(segments):
+    """Runs of identical colours in packed RGB bytes as [((r, g, b), length), ...]."""
+    data = iter(memoryview(segments).cast("B"))
+    return [(color, len(list(run))) for color, run in groupby(zip(data, data, data))]
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def decode_d50(d50_str: str) -> D50State:
+    """Decode a grouped d50 string.
+
+    N01:P1000{num_groups}{colors}F21000{num_groups}{lengths}U3V3{effect};
+    Raises ValueError on a malformed colour/length block. A string without a
+    colour block yields segments=None (colours unchanged).
+    """
+    segments = None
+    tail = 0
+
+    p_idx = d50_str.find(_COLOR_MARKER)
+    if p_idx != -1:
+        f_idx = d50_str.find(_LENGTH_MARKER, p_idx)
+        if f_idx == -1:
+            raise ValueError("Missing F21000 after P1000 block")
+
+        # block is ascii num_groups + 6 hex per group, so the digit count
+        # of num_groups is the block length modulo 6
+        start = p_idx + len(_COLOR_MARKER)
+        width = (f_idx - start) % 6
+        digits = d50_str[start:start + width]
+        if not 1 <= width <= 3 or not digits.isdigit():
+            raise ValueError("Could not deduce num_groups / colors length from d50")
+        num_groups = int(digits)
+        if f_idx - start - width != 6 * num_groups:
+            raise ValueError("Could not deduce num_groups / colors length from d50")
+
+        rgb = bytes.fromhex(d50_str[start + width:f_idx])
+
+        # lengths follow the repeated num_groups: 4 hex per group
+        pos = f_idx + len(_LENGTH_MARKER) + width
+        tail = pos + 4 * num_groups
+        lengths_hex = d50_str[pos:tail]
+        if len(lengths_hex) < num_groups * 4:
+            raise ValueError("Not enough length hex data in d50")
+
+        segs = bytearray()
+        for c, i in zip(range(0, len(rgb), 3), range(0, len(lengths_hex), 4)):
+            segs += rgb[c:c + 3] * int(lengths_hex[i:i + 4], 16)
+        segments = bytes(segs)
+
+        if d50_str.startswith(_EFFECT_MARKER, tail):
+            tail += len(_EFFECT_MARKER)
+
+    # effect tail is expected right after U3V3; fall back to a scan
+    match = _D50_EFFECT_RE.match(d50_str, tail) or _D50_EFFECT_RE.search(d50_str)
+    if not match:
+        return D50State(segments, EFFECT_SOLID, None)
+    effect = match.lastgroup
+    speed = None if effect == EFFECT_SOLID else hex_to_speed(match.group(effect))
+    return D50State(segments, effect, speed)
+
+
+def color_distance(a, b):
+    """Perceptual distance between two RGB colours ("redmean" weighted RGB, 0..~765)."""
+    rmean = (a[0] + b[0]) / 2
+    dr = a[0] - b[0]
+    dg = a[1] - b[1]
+    db = a[2] - b[2]
+    return math.sqrt((2 + rmean / 256) * dr * dr + 4 * dg * dg + (2 + (255 - rmean) / 256) * db * db)
+
+
+def quantize_segments(segments, tolerance):
+    """Split segments into the fewest runs whose members all lie within tolerance of the run colour.
+
+    Works on the runs of identical colours. The run colour is the rounded
+    (segment-weighted) mean of its members; each run is grown from its start
+    until it first exceeds the tolerance. A dynamic program over the cut points
+    then picks the fewest runs (least total error on ties).
+    Returns [(color, length), ...].
+    """
+    exact = _runs(segments)
+    count = len(exact)
+    # (start, end) -> (colour, error) of every admissible run exact[start:end]
+    runs = {}
+    for start in range(count):
+        sr = sg = sb = n = 0
+        for end in range(start + 1, count + 1):
+            (r, g, b), length = exact[end - 1]
+            sr += r * length
+            sg += g * length
+            sb += b * length
+            n += length
+            color = (round(sr / n), round(sg / n), round(sb / n))
+            error = max(color_distance(exact[i][0], color) for i in range(start, end))
+            if error > tolerance:
+                break
+            runs[start, end] = (color, error)
+
+    # best[end] = (runs, total error, start of the last run) for segments[:end]
+    best = [(0, 0.0, 0)] + [None] * count
+    for end in range(1, count + 1):
+        for start in range(end):
+            run = runs.get((start, end))
+            if run is None or best[start] is None:
+                continue
+            candidate = (best[start][0] + 1, best[start][1] + run[1], start)
+            if best[end] is None or candidate[:2] < best[end][:2]:
+                best[end] = candidate
+
+    groups = []
+    end = count
+    while end:
+        start = best[end][2]
+        groups.append((runs[start, end][0], sum(length for _, length in exact[start:end])))
+        end = start
+    groups.reverse()
+    return groups
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def encode_d50(segments: bytes, effect: str, speed, tolerance=0) -> str:
+    """Cached format_d50; segments must be hashable (bytes, e.g. SegmentBuffer.snapshot())."""
+    return format_d50(segments, effect, speed, tolerance)
+
+
+def format_d50(segments, effect: str, speed, tolerance=0) -> str:
+    """
+    Generate d50 string following the grouped-color format:
+    N01:P1000{num_groups}{colors}{F21000}{num_groups}{lengths}U3V3{effect};
+    - colors: each 6 hex (RGB)
+    - lengths: each 4 hex representing number of segments in that group (hex)
+    With a tolerance, adjacent segments within that colour distance are merged
+    (see quantize_segments); 0 merges only identical colours.
+    segments is packed RGB bytes; any bytes-like object works (e.g. a NumPy
+    animation frame, which is not copied).
+    Uncached: for one-off frames that would only churn the encode_d50 cache.
+    """
+    if tolerance:
+        groups = quantize_segments(segments, tolerance)
+    else:
+        # compress contiguous segment colors into groups
+        groups = _runs(segments)
+    num_groups = len(groups)
+
+    colors_str = b"".join(bytes(col) for col, _ in groups).hex().upper()
+    lengths_str = "".join(f"{count:04X}" for _, count in groups)
+
+    effect_tail = D50_EFFECT_TAILS.get(effect, "")
+    if "{s}" in effect_tail:
+        effect_tail = effect_tail.format(s=speed_to_hex(speed))
+
+    return f"N01:P1000{num_groups}{colors_str}F21000{num_groups}{lengths_str}U3V3{effect_tail};"
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def decode_d60(d60_str: str):
+    """
+    Parse d60 string for special-effects and sensitivity.
+    Expected d60: <7-char-effect-prefix><2-hex-sensitivity><0000>
+    Example: "2000064320000" -> prefix "2000064", sens_hex "32" -> sens_percent ~51
+
+    Returns: (sensitivity_percent_int, effect_name_or_None)
+    """
+    if not d60_str or len(d60_str) < 9:
+        return DEFAULT_SENSITIVITY, None
+    try:
+        sens_val = int(d60_str[7:9], 16)
+    except ValueError:
+        sens_val = 0x00
+    sens_percent = max(0, min(100, round(sens_val * 100 / SENSITIVITY_MAX_HEX)))
+    return sens_percent, D60_PREFIX_TO_SPECIAL_EFFECT.get(d60_str[0:7])
+
+
+def encode_d60(effect: str, sensitivity) -> str | None:
+    """Build the d60 string for a special effect, or None if unknown."""
+    prefix = SPECIAL_EFFECT_TO_D60_PREFIX.get(effect)
+    if not prefix:
+        return None
+    sens_percent = max(0, min(100, int(round(sensitivity))))
+    hex_val = max(0, min(SENSITIVITY_MAX_HEX, int(round(sens_percent * SENSITIVITY_MAX_HEX / 100))))
+    return f"{prefix}{hex_val:02X}0000"
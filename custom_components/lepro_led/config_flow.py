@@ -1,6 +1,20 @@
 from homeassistant import config_entries
+from homeassistant.core import callback
 import voluptuous as vol
-from .const import DOMAIN
+from .const import (
+    DOMAIN,
+    CONF_COLOR_TOLERANCE,
+    CONF_COMMAND_WINDOW,
+    CONF_SEGMENT_ENTITIES,
+    CONF_SYNC_INTERVAL,
+    CONF_TRANSITION_FPS,
+    CONF_WILDCARD_SUBSCRIBE,
+    DEFAULT_COLOR_TOLERANCE,
+    DEFAULT_COMMAND_WINDOW,
+    DEFAULT_SEGMENT_ENTITIES,
+    DEFAULT_SYNC_INTERVAL,
+    DEFAULT_TRANSITION_FPS,
+)
 
 DATA_SCHEMA = vol.Schema({
     vol.Required("account"): str,
@@ -11,6 +25,11 @@ DATA_SCHEMA = vol.Schema({
 class LeproLedConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     VERSION = 1
 
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry):
+        return LeproLedOptionsFlow(config_entry)
+
     async def async_step_user(self, user_input=None):
         errors = {}
 
@@ -23,4 +42,43 @@ class LeproLedConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
 
         return self.async_show_form(
             step_id="user", data_schema=DATA_SCHEMA, errors=errors
-        )
\ No newline at end of file
+        )
+
+class LeproLedOptionsFlow(config_entries.OptionsFlow):
+    """Per-entry tuning options."""
+
+    def __init__(self, config_entry):
+        self._config_entry = config_entry
+
+    async def async_step_init(self, user_input=None):
+        if user_input is not None:
+            return self.async_create_entry(title="", data=user_input)
+
+        options = self._config_entry.options
+        schema = vol.Schema({
+            vol.Optional(
+                CONF_COMMAND_WINDOW,
+                default=options.get(CONF_COMMAND_WINDOW, DEFAULT_COMMAND_WINDOW),
+            ): vol.All(vol.Coerce(int), vol.Range(min=0, max=2000)),
+            vol.Optional(
+                CONF_WILDCARD_SUBSCRIBE,
+                default=options.get(CONF_WILDCARD_SUBSCRIBE, False),
+            ): bool,
+            vol.Optional(
+                CONF_SYNC_INTERVAL,
+                default=options.get(CONF_SYNC_INTERVAL, DEFAULT_SYNC_INTERVAL),
+            ): vol.All(vol.Coerce(int), vol.Range(min=0, max=1440)),
+            vol.Optional(
+                CONF_TRANSITION_FPS,
+                default=options.get(CONF_TRANSITION_FPS, DEFAULT_TRANSITION_FPS),
+            ): vol.All(vol.Coerce(int), vol.Range(min=1, max=10)),
+            vol.Optional(
+                CONF_COLOR_TOLERANCE,
+                default=options.get(CONF_COLOR_TOLERANCE, DEFAULT_COLOR_TOLERANCE),
+            ): vol.All(vol.Coerce(int), vol.Range(min=0, max=100)),
+            vol.Optional(
+                CONF_SEGMENT_ENTITIES,
+                default=options.get(CONF_SEGMENT_ENTITIES, DEFAULT_SEGMENT_ENTITIES),
+            ): bool,
+        })
+        return self.async_show_form(step_id="init", data_schema=schema)
@@ -6,3 +6,26 @@ USER_PROFILE_URL = "https://api-na-iot.lepro.com/user/profile"
 DEVICE_LIST_URL = "https://api-na-iot.lepro.com/v3/device/list/fid/{fid}/timestamp/{timestamp}"
 SWITCH_API_URL = "https://api-na-iot.lepro.com/statistic/record"
 
+# Options
+CONF_COMMAND_WINDOW = "command_window"
+CONF_WILDCARD_SUBSCRIBE = "wildcard_subscribe"
+CONF_SYNC_INTERVAL = "sync_interval"
+CONF_TRANSITION_FPS = "transition_fps"
+CONF_COLOR_TOLERANCE = "color_tolerance"
+CONF_SEGMENT_ENTITIES = "segment_entities"
+
+# Window (ms) in which outbound changes for one device are merged into a single publish
+DEFAULT_COMMAND_WINDOW = 150
+
+# Minutes between background device-list syncs (0 disables)
+DEFAULT_SYNC_INTERVAL = 15
+
+# Max frames per second streamed to one device during a transition
+DEFAULT_TRANSITION_FPS = 5
+
+# Colour distance within which adjacent segments are sent as one d50 group (0 = exact colours only)
+DEFAULT_COLOR_TOLERANCE = 0
+
+# One light entity per segment; off: segments are an attribute of the strip's light
+# and segment entities are only created for the indices exposed with a service
+DEFAULT_SEGMENT_ENTITIES = True
@@ -0,0 +1,48 @@
+"""Diagnostics support for Lepro LED."""
+
+from __future__ import annotations
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .const import DOMAIN
+
+TO_REDACT = {"account", "password", "persistent_mac", "fcm_token"}
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigEntry) -> dict:
+    """Return diagnostics for a config entry."""
+    data = hass.data.get(DOMAIN, {}).get(entry.entry_id, {})
+    sync = data.get("sync")
+    api = data.get("api")
+    ack_tracker = data.get("ack_tracker")
+    metrics = data.get("metrics")
+    mqtt_client = data.get("mqtt_client")
+    reconciler = data.get("reconciler")
+    lights = data.get("devices", {}).values()
+    # outbound state changes requested vs publishes that actually went out
+    coalescing = {"requested": 0, "published": 0, "suppressed": 0}
+    for light in lights:
+        for key, count in light._coalescer.as_dict().items():
+            coalescing[key] += count
+    return {
+        "entry": async_redact_data(dict(entry.data), TO_REDACT),
+        "options": dict(entry.options),
+        "bootstrap_timings": data.get("bootstrap_timings"),
+        "devices": len(data.get("devices", {})),
+        "api_requests": api.request_count if api else None,
+        "device_sync": sync.as_dict() if sync else None,
+        "commands": ack_tracker.as_dict() if ack_tracker else None,
+        "command_coalescing": coalescing,
+        "state_writes": {light._did: light.write_stats() for light in lights},
+        "reconcile": reconciler.as_dict() if reconciler else None,
+        "mqtt": {
+            "connected": mqtt_client.connected,
+            "subscriptions": len(mqtt_client._subscriptions),
+            "published": mqtt_client.published,
+            "offline_queue": mqtt_client.offline.as_dict(),
+            "reconnects": mqtt_client.reconnects,
+            "rate_limiter": mqtt_client.limiter.as_dict(),
+        } if mqtt_client else None,
+        "pipeline": metrics.as_dict() if metrics else None,
+    }
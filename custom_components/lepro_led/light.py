@@ -1,17 +1,44 @@
 import asyncio
-import aiohttp
 import logging
 import time
 import json
 import random
-import ssl
 import os
 import hashlib
-import re
-import numpy as np
-from .const import DOMAIN, LOGIN_URL, FAMILY_LIST_URL, USER_PROFILE_URL, DEVICE_LIST_URL, SWITCH_API_URL
-from aiomqtt import Client, MqttError
-import aiofiles
+from datetime import timedelta
+from .const import (
+    DOMAIN,
+    CONF_COLOR_TOLERANCE,
+    CONF_COMMAND_WINDOW,
+    CONF_SEGMENT_ENTITIES,
+    CONF_SYNC_INTERVAL,
+    CONF_TRANSITION_FPS,
+    CONF_WILDCARD_SUBSCRIBE,
+    DEFAULT_COLOR_TOLERANCE,
+    DEFAULT_COMMAND_WINDOW,
+    DEFAULT_SEGMENT_ENTITIES,
+    DEFAULT_SYNC_INTERVAL,
+    DEFAULT_TRANSITION_FPS,
+)
+from . import animation, codec
+from .api import LeproApiError, LeproCloudApi, async_bootstrap, create_ssl_context
+from .cache import (
+    async_load_cache,
+    async_save_cache,
+    build_cache,
+    cache_is_valid,
+    cache_path,
+    device_identity,
+)
+from .mqtt import MQTTClientWrapper, select_subscription_topics
+from .ack import CommandTracker
+from .ratelimit import PRIORITY_BACKGROUND, PRIORITY_EFFECT, PRIORITY_INTERACTIVE
+from .metrics import PipelineMetrics
+from .reconcile import TICK_INTERVAL, StateReconciler
+from .router import MessageRouter
+from .segments import SegmentBuffer, series_segment_count
+from .sync import DeviceSync
+from .transition import Transition
 from homeassistant.core import callback
 
 from homeassistant.components.light import (
@@ -19,170 +46,138 @@ from homeassistant.components.light import (
     ATTR_RGB_COLOR,
     ATTR_EFFECT,
     ATTR_RGBW_COLOR,
+    ATTR_TRANSITION,
     LightEntity,
     ColorMode,
     LightEntityFeature,
 )
 
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers import entity_registry as er
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
+from homeassistant.helpers.event import async_track_time_interval
+from homeassistant.helpers.storage import Store
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.core import HomeAssistant
 
 _LOGGER = logging.getLogger(__name__)
 
-class MQTTClientWrapper:
-    def __init__(self, hass, host, port, ssl_context, client_id):
-        self.hass = hass
-        self.host = host
-        self.port = port
-        self.ssl_context = ssl_context
-        self.client_id = client_id
-        self.client = None
-        self._message_callback = None
-        self._loop_task = None
-        self._pending_subscriptions = []
-        self._pending_messages = []
-
-    async def _connect_and_run(self):
-        try:
-            async with Client(
-                hostname=self.host,
-                port=self.port,
-                identifier=self.client_id,
-                tls_context=self.ssl_context,
-                clean_session=True
-            ) as client:
-                self.client = client
-                
-                # Process pending subscriptions
-                for topic in self._pending_subscriptions:
-                    await client.subscribe(topic)
-                self._pending_subscriptions = []
-                
-                # Process pending messages
-                for topic, payload in self._pending_messages:
-                    await client.publish(topic, payload)
-                self._pending_messages = []
-                
-                # Start message loop
-                async for message in client.messages:
-                    if self._message_callback:
-                        await self._message_callback(message)
-        except MqttError as e:
-            _LOGGER.error("MQTT error: %s", e)
-        finally:
-            self.client = None
+# Storage version of the exposed-segments Store; bump when its layout changes
+EXPOSED_SEGMENTS_VERSION = 1
 
-    async def connect(self):
-        if self._loop_task and not self._loop_task.done():
-            return
-            
-        self._pending_subscriptions = []
-        self._pending_messages = []
-        self._loop_task = asyncio.create_task(self._connect_and_run())
+class CommandCoalescer:
+    """Merge bursts of state changes for one device into a single publish.
 
-    async def subscribe(self, topic):
-        if self.client:
-            await self.client.subscribe(topic)
-        else:
-            self._pending_subscriptions.append(topic)
-            if not self._loop_task or self._loop_task.done():
-                await self.connect()
+    Callers mark the device dirty with schedule(); after `window` seconds the
+    current (latest) state is sent once, no matter how many changes arrived in
+    between. Changes made while a publish is in flight trigger one more send.
+    """
 
-    async def publish(self, topic, payload):
-        if self.client:
-            await self.client.publish(topic, payload)
-        else:
-            self._pending_messages.append((topic, payload))
-            if not self._loop_task or self._loop_task.done():
-                await self.connect()
-
-    def set_message_callback(self, callback):
-        self._message_callback = callback
-
-    async def disconnect(self):
-        if self._loop_task:
-            self._loop_task.cancel()
-            try:
-                await self._loop_task
-            except asyncio.CancelledError:
-                pass
-
-async def async_login(session, account, password, mac, language="it", fcm_token=""):
-    """Perform login and return bearer token."""
-    timestamp = str(int(time.time()))
-    payload = {
-        "platform": "2",
-        "account": account,
-        "password": password,
-        "mac": mac,
-        "timestamp": timestamp,
-        "language": language,
-        "fcmToken": fcm_token,
-    }
-    headers = {
-        "Content-Type": "application/json",
-        "App-Version": "1.0.9.202",
-        "Device-Model": "custom_integration",
-        "Device-System": "custom",
-        "GMT": "+0",
-        "Host": "api-na-iot.lepro.com",
-        "Language": language,
-        "Platform": "2",
-        "Screen-Size": "1536*2048",
-        "Slanguage": language,
-        "Timestamp": timestamp,
-        "User-Agent": "LE/1.0.9.202 (Custom Integration)",
-    }
+    def __init__(self, send, window):
+        self._send = send
+        self.window = window
+        self._task = None
+        self._dirty = False
+        # counters
+        self.requested = 0
+        self.published = 0
+        self.suppressed = 0
 
-    async with session.post(LOGIN_URL, json=payload, headers=headers) as resp:
-        import json
-        if resp.status != 200:
-            _LOGGER.error("Login failed with status %s", resp.status)
-            return None
-        data = await resp.json()
-        if data.get("code") != 0:
-            _LOGGER.error("Login failed with message: %s", data.get("msg"))
-            return None
-        token = data.get("data", {}).get("token")
-        return token
+    @property
+    def pending(self):
+        return self._dirty
+
+    def schedule(self):
+        """Mark state as changed; publish it after the coalescing window."""
+        self.requested += 1
+        if self._dirty:
+            # an update is already waiting, it will carry this change too
+            self.suppressed += 1
+            return
+        self._dirty = True
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while self._dirty:
+            await asyncio.sleep(self.window)
+            self._dirty = False
+            await self._publish()
+
+    async def _publish(self, *args):
+        self.published += 1
+        try:
+            await self._send(*args)
+        except Exception as e:
+            _LOGGER.error("Failed to send coalesced command: %s", e)
+
+    def cancel(self):
+        """Drop any pending update without sending it."""
+        if self._dirty:
+            self.suppressed += 1
+        self._dirty = False
+        if self._task and not self._task.done():
+            self._task.cancel()
+        self._task = None
+
+    def take(self):
+        """Claim the send of the latest state for the caller, absorbing any pending update."""
+        if self._dirty:
+            # the pending update is carried by the caller's send
+            self.suppressed += 1
+        self._dirty = False
+        if self._task and not self._task.done():
+            self._task.cancel()
+        self._task = None
+        self.requested += 1
+
+    async def async_flush(self, *args):
+        """Send the latest state now, absorbing any pending update; args go to send."""
+        self.take()
+        await self._publish(*args)
+
+    def as_dict(self):
+        return {
+            "requested": self.requested,
+            "published": self.published,
+            "suppressed": self.suppressed,
+        }
 
 
 class LeproLedLight(LightEntity):
     # Effect constants
-    EFFECT_SOLID = "solid"
-    EFFECT_BREATH = "breath"
-    EFFECT_GRADIENT = "gradient"
-    EFFECT_CLOCKWISE = "clockwise"
-    EFFECT_COUNTERCLOCKWISE = "counterclockwise"
-    EFFECT_CIRCULAR = "circular"
-    EFFECT_FLASH = "flash"
-    EFFECT_WAVE1 = "wave_1"
-    EFFECT_WAVE2 = "wave_2"
-    EFFECT_WAVE3 = "wave_3"
-    EFFECT_WAVE4 = "wave_4"
-    EFFECT_LASER1 = "laser_1"
-    EFFECT_LASER2 = "laser_2"
-    EFFECT_LASER3 = "laser_3"
-    EFFECT_LASER4 = "laser_4"
+    EFFECT_SOLID = codec.EFFECT_SOLID
+    EFFECT_BREATH = codec.EFFECT_BREATH
+    EFFECT_GRADIENT = codec.EFFECT_GRADIENT
+    EFFECT_CLOCKWISE = codec.EFFECT_CLOCKWISE
+    EFFECT_COUNTERCLOCKWISE = codec.EFFECT_COUNTERCLOCKWISE
+    EFFECT_CIRCULAR = codec.EFFECT_CIRCULAR
+    EFFECT_FLASH = codec.EFFECT_FLASH
+    EFFECT_WAVE1 = codec.EFFECT_WAVE1
+    EFFECT_WAVE2 = codec.EFFECT_WAVE2
+    EFFECT_WAVE3 = codec.EFFECT_WAVE3
+    EFFECT_WAVE4 = codec.EFFECT_WAVE4
+    EFFECT_LASER1 = codec.EFFECT_LASER1
+    EFFECT_LASER2 = codec.EFFECT_LASER2
+    EFFECT_LASER3 = codec.EFFECT_LASER3
+    EFFECT_LASER4 = codec.EFFECT_LASER4
 
     # Mapping effect -> d60 7-char prefix (first 7 digits)
-    SPECIAL_EFFECT_TO_D60_PREFIX = {
-        EFFECT_FLASH: "2000064",
-        EFFECT_WAVE1: "2010064",
-        EFFECT_WAVE2: "2020064",
-        EFFECT_WAVE3: "2030064",
-        EFFECT_WAVE4: "2040064",
-        EFFECT_LASER1: "2050064",
-        EFFECT_LASER2: "2060064",
-        EFFECT_LASER3: "2070064",
-        EFFECT_LASER4: "2080064",
-    }
+    SPECIAL_EFFECT_TO_D60_PREFIX = codec.SPECIAL_EFFECT_TO_D60_PREFIX
 
     # Set of special effects for quick checks
     SPECIAL_EFFECTS = set(SPECIAL_EFFECT_TO_D60_PREFIX.keys())
     
-    def __init__(self, device, mqtt_client, entry_id):
+    def __init__(
+        self,
+        device,
+        mqtt_client,
+        entry_id,
+        command_window=DEFAULT_COMMAND_WINDOW / 1000,
+        transition_fps=DEFAULT_TRANSITION_FPS,
+        color_tolerance=DEFAULT_COLOR_TOLERANCE,
+    ):
         self._device = device
         # self._attr_name = device["name"]
         self._attr_unique_id = str(device["did"])
@@ -203,10 +198,34 @@ class LeproLedLight(LightEntity):
         self._mode = device.get("d2", 2)  # Default to static mode
         self._effect = self.EFFECT_SOLID
         self._speed = 50  # Default speed (0-100)
-        # store 25 segments internally; main light mirrors segment 0
-        self._segment_colors = [(255, 255, 255)] * 25  # Default all white
+        # packed segment colours, updated in place; main light mirrors segment 0
+        segment_count = series_segment_count(device.get("series"))
+        self._segment_colors = SegmentBuffer(segment_count or codec.SEGMENT_COUNT)
+        self._segmented = segment_count is not None
+        # set by setup: segment colours shown as an attribute instead of (all) segment entities
+        self._compact_segments = False
         self._sensitivity = 50  # For music mode
-        
+        # child entities refreshed on state changes (filled in by setup / number platform)
+        self._segments = []
+        self._numbers = {}
+        # set by setup: matches commands with the device's reports
+        self._ack_tracker = None
+        # set by setup: entry-wide PipelineMetrics (d50 codec timings)
+        self._metrics = None
+        # HA state writes issued / skipped because nothing changed
+        self.state_writes = 0
+        self.state_writes_skipped = 0
+        # change checks, and writes per entity (unique_id) of this light and its children
+        self.state_checks = 0
+        self.entity_writes = {}
+        # outbound d50/d60/d52 updates are merged per device
+        self._coalescer = CommandCoalescer(self._send_state_command, command_window)
+        # running transition or animation (task), cancelled by any newer command
+        self._transition_fps = transition_fps
+        # outbound d50: merge adjacent segments within this colour distance
+        self._color_tolerance = color_tolerance
+        self._stream = None
+
         # Initialize from device data
         if "d50" in device:
             self._parse_d50(device["d50"])
@@ -215,10 +234,10 @@ class LeproLedLight(LightEntity):
         else:
             self._brightness = 255
         if "d60" in device:
-            self._sensitivity = self._parse_d60(device["d60"])
+            self._sensitivity, _ = self._parse_d60(device["d60"])
         
         # Entity attributes
-        self._attr_supported_features = LightEntityFeature.EFFECT
+        self._attr_supported_features = LightEntityFeature.EFFECT | LightEntityFeature.TRANSITION
         self._attr_color_mode = ColorMode.RGB
         self._attr_supported_color_modes = {ColorMode.RGB}
         self._attr_effect_list = [
@@ -243,7 +262,7 @@ class LeproLedLight(LightEntity):
             
     def _map_device_brightness(self, device_brightness):
         """Map device brightness (100-1000) to HA brightness (0-255)"""
-        _LOGGER.info("device_brightness: %s", str(device_brightness))
+        _LOGGER.debug("device_brightness: %s", device_brightness)
         # return int((device_brightness - 100) * 255 / 900)
         return int((device_brightness - 0) * 255 / 1000)
     
@@ -253,39 +272,8 @@ class LeproLedLight(LightEntity):
         return 0 + int(ha_brightness * 1000 / 255)
     
     def _parse_d60(self, d60_str):
-        """
-        Parse d60 string for special-effects and sensitivity.
-        Expected d60: <7-char-effect-prefix><2-hex-sensitivity><0000>
-        Example: "2000064320000" -> prefix "2000064", sens_hex "32" -> sens_percent ~51
-
-        Returns: (sensitivity_percent_int, effect_name_or_None)
-        """
-        try:
-            if not d60_str or len(d60_str) < 9:
-                return 50, None
-
-            prefix = d60_str[0:7]
-            sens_hex = d60_str[7:9]
-
-            # parse hex sensitivity (0x00 .. 0x63)
-            try:
-                sens_val = int(sens_hex, 16)
-            except Exception:
-                sens_val = 0x00
-
-            # Map sens_val (0..0x63) -> percent 0..100
-            MAX_HEX = 0x63  # 99 decimal; spec: 100 -> 0x63
-            sens_percent = round(sens_val * 100 / MAX_HEX) if MAX_HEX > 0 else 0
-            # clamp
-            sens_percent = max(0, min(100, int(sens_percent)))
-
-            # map prefix to effect
-            prefix_map = {v: k for k, v in self.SPECIAL_EFFECT_TO_D60_PREFIX.items()}
-            effect = prefix_map.get(prefix)
-
-            return sens_percent, effect
-        except Exception:
-            return 50, None
+        """Parse d60 string; returns (sensitivity_percent_int, effect_name_or_None)."""
+        return codec.decode_d60(d60_str)
 
 
     async def async_turn_on(self, **kwargs):
@@ -294,8 +282,13 @@ class LeproLedLight(LightEntity):
         brightness = kwargs.get(ATTR_BRIGHTNESS, self._brightness)
         rgb_color = kwargs.get(ATTR_RGB_COLOR, self._attr_rgb_color)
         effect = kwargs.get(ATTR_EFFECT, self._effect)
-        
+        transition = kwargs.get(ATTR_TRANSITION)
+        self._cancel_stream()
+        # a light that is off fades in from black
+        start = (self._brightness if self._is_on else 0, self._segment_colors.snapshot())
+
         # Update state optimistically
+        old_state = self._state_snapshot()
         self._is_on = True
         self._brightness = brightness
         
@@ -303,230 +296,263 @@ class LeproLedLight(LightEntity):
         if ATTR_RGB_COLOR in kwargs:
             self._attr_rgb_color = rgb_color
             # set all segment colors to the main color
-            self._segment_colors = [tuple(int(c) for c in rgb_color)] * 25
+            self._segment_colors.fill(rgb_color)
         
         if ATTR_EFFECT in kwargs:
             self._effect = effect
         
-        # Send command based on effect
-        if effect in self.SPECIAL_EFFECTS:
-            # special effects use d2=3 (d60)
-            await self._send_special_effect_command(effect)
+        # Send now; this also absorbs any pending coalesced update.
+        # Plain on/brightness changes jump the queue ahead of colour/effect updates.
+        if ATTR_RGB_COLOR in kwargs or ATTR_EFFECT in kwargs:
+            priority = PRIORITY_EFFECT
         else:
-            # regular effects use d2=2 (d50)
-            await self._send_effect_command()
+            priority = PRIORITY_INTERACTIVE
+        if transition:
+            # HA shows the target right away; the frames only drive the device
+            self._coalescer.take()
+            end = (self._brightness, self._segment_colors.snapshot())
+            self._start_transition(
+                start, end, transition,
+                lambda brightness, colors: self._finish_transition(brightness, colors, priority),
+            )
+        else:
+            await self._coalescer.async_flush(priority)
 
-        
-        # update HA states: main + segments
-        self.async_write_ha_state()
-        # update segment entities attached to this device if present
+        # update HA states: main + changed segments
+        self._write_changed_states(old_state)
+
+    def _start_transition(self, start, end, duration, send_final):
+        transition = Transition(start, end, duration, self._transition_fps)
+        self._start_stream(self._run_transition(transition, send_final))
+
+    def _start_stream(self, coro):
+        """Run a transition or animation as this light's stream.
+
+        Its frames aren't tracked, and the device now follows them: a retry of an
+        earlier command would jump back to that state mid-stream, so tracking stops.
+        """
+        if self._ack_tracker:
+            self._ack_tracker.cancel(self._did)
+        self._stream = asyncio.create_task(coro)
+
+    async def _run_transition(self, transition, send_final):
         try:
-            segments = self.hass.data[DOMAIN][self._entry_id].get('segments', {}).get(self._did, [])
-            for seg in segments:
-                try:
-                    seg.async_write_ha_state()
-                except Exception:
-                    pass
-        except Exception:
-            pass
-
-
-    def _hex_to_speed(self, hex_str):
-        """Convert 4-digit hex speed value to percentage (0-100)"""
-        code = hex_str.upper()
-        if code == "1000":
-            return 0.0
-        raw = int(code[1:], 16)
-        percent = np.exp((raw - 597.75) / -117.41) - 1
-        return float(max(0, min(100, percent)))
-
-    def _speed_to_hex(self, speed):
-        """Convert percentage (0-100) to 4-digit hex speed value"""
-        if speed <= 0:
-            return "1000"
-        raw = int(round(-117.41 * np.log(speed + 1) + 597.75))
-        return f"0{raw:03X}"
-    
-    def _generate_d50_string(self):
+            await transition.async_run(self._send_frame, send_final)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            _LOGGER.error("Transition failed for %s: %s", self.name, e)
+        finally:
+            if self._metrics is not None:
+                self._metrics.transition_frames += transition.frames_sent
+                self._metrics.transition_frames_dropped += transition.frames_dropped
+
+    async def _finish_transition(self, brightness, colors, priority):
+        """Last step of a turn-on transition: put the target back in HA and send it exactly.
+
+        Frame echoes are ignored while streaming (see _streaming), but the
+        target is restored anyway so HA never ends on an intermediate frame.
+        """
+        old_state = self._state_snapshot()
+        self._is_on = True
+        self._brightness = brightness
+        self._segment_colors.load(colors)
+        self._attr_rgb_color = self._segment_colors[0]
+        self._write_changed_states(old_state)
+        await self._send_state_command(priority)
+
+    async def _finish_fade_out(self, brightness, payload):
+        """Last step of a turn-off transition: switch off, keeping the pre-fade brightness."""
+        old_state = self._state_snapshot()
+        self._is_on = False
+        self._brightness = brightness
+        self._write_changed_states(old_state)
+        await self._send_mqtt_command(payload, PRIORITY_INTERACTIVE)
+
+    @property
+    def _streaming(self):
+        """A transition or animation is driving the device; the router ignores its frame echoes."""
+        return self._stream is not None and not self._stream.done()
+
+    def _cancel_stream(self):
+        """Stop a running transition or animation; the caller's command replaces it."""
+        if self._stream and not self._stream.done():
+            self._stream.cancel()
+        self._stream = None
+
+    async def async_play_animation(self, pattern, fps, period, colors=None):
+        """Stream a client-side animation until the next command for this light."""
+        if not self._segmented:
+            raise HomeAssistantError(f"{self.name} has no segments to animate")
+        self._cancel_stream()
+        self._coalescer.cancel()
+        frames = await self.hass.async_add_executor_job(
+            animation.render_cycle, pattern, len(self._segment_colors), fps, period, colors, self._color_tolerance
+        )
+        # another command may have arrived while rendering
+        self._cancel_stream()
+        old_state = self._state_snapshot()
+        self._is_on = True
+        self._start_stream(self._run_animation(animation.Animation(frames, fps)))
+        self._write_changed_states(old_state)
+
+    async def _run_animation(self, anim):
+        try:
+            await anim.async_run(self._send_animation_frame)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            _LOGGER.error("Animation failed for %s: %s", self.name, e)
+        finally:
+            if self._metrics is not None:
+                self._metrics.animation_frames += anim.frames_sent
+                self._metrics.animation_frames_dropped += anim.frames_dropped
+
+    async def _send_animation_frame(self, d50_str):
+        payload = {"d1": 1, "d2": 2, "d50": d50_str, "d52": self._map_ha_brightness(self._brightness)}
+        await self._send_mqtt_command(payload, PRIORITY_EFFECT, track=False)
+
+    async def _send_frame(self, brightness, colors):
+        """Publish one intermediate transition frame (not ack-tracked)."""
+        payload = self._state_payload()
+        if payload is None:
+            return
+        payload["d52"] = self._map_ha_brightness(brightness)
+        if "d50" in payload:
+            # one-off colours: keep them out of the encode cache
+            payload["d50"] = codec.format_d50(colors, self._effect, self._speed, self._color_tolerance)
+        await self._send_mqtt_command(payload, PRIORITY_EFFECT, track=False)
+
+    def _state_snapshot(self):
+        """Values shown by this light and its child entities, for change detection.
+
+        _segment_colors is updated in place, so it is copied (a few dozen bytes).
         """
-        Generate d50 string following the grouped-color format:
-        N01:P1000{num_groups}{colors}{F21000}{num_groups}{lengths}U3V3{effect};
-        - colors: each 6 hex (RGB)
-        - lengths: each 4 hex representing number of segments in that group (hex)
+        return (
+            self._is_on,
+            self._brightness,
+            self._effect,
+            self._attr_rgb_color,
+            self._speed,
+            self._sensitivity,
+            self._segment_colors.snapshot(),
+        )
+
+    def _write_state(self, entity):
+        try:
+            entity.async_write_ha_state()
+        except Exception:
+            # not added to hass yet
+            return False
+        key = entity.unique_id
+        self.entity_writes[key] = self.entity_writes.get(key, 0) + 1
+        return True
+
+    def _write_changed_states(self, old_state):
+        """Write HA state only for the entities whose values changed since old_state."""
+        is_on, brightness, effect, rgb, speed, sensitivity, segment_colors = old_state
+        written = 0
+        possible = 1 + len(self._segments) + len(self._numbers)
+
+        # segments show the parent's on/brightness/effect plus their own colour
+        shared_changed = (is_on, brightness, effect) != (self._is_on, self._brightness, self._effect)
+        new_colors = self._segment_colors.data
+        colors_changed = segment_colors != new_colors
+        if shared_changed or rgb != self._attr_rgb_color or (self._compact_segments and colors_changed):
+            written += self._write_state(self)
+
+        if self._segments and (shared_changed or colors_changed):
+            for seg in self._segments:
+                i = 3 * seg._index
+                if shared_changed or segment_colors[i:i + 3] != new_colors[i:i + 3]:
+                    written += self._write_state(seg)
+
+        if speed != self._speed and "speed" in self._numbers:
+            written += self._write_state(self._numbers["speed"])
+        if sensitivity != self._sensitivity and "sensitivity" in self._numbers:
+            written += self._write_state(self._numbers["sensitivity"])
+
+        self.state_checks += 1
+        self.state_writes += written
+        self.state_writes_skipped += possible - written
+        if self._metrics is not None:
+            self._metrics.state_writes += written
+        return written
+
+    def write_stats(self):
+        """Per entity: HA state writes, and checks skipped because nothing it shows changed."""
+        stats = {}
+        for entity in (self, *self._segments, *self._numbers.values()):
+            written = self.entity_writes.get(entity.unique_id, 0)
+            stats[entity.unique_id] = {"written": written, "skipped": self.state_checks - written}
+        return stats
+
+    def _validate_segments(self, segments=None, effect=None):
+        if effect is not None and effect not in self._attr_effect_list:
+            raise HomeAssistantError(f"Unknown effect for {self.name}: {effect}")
+        count = len(self._segment_colors)
+        for index in segments or ():
+            if not 1 <= index <= count:
+                raise HomeAssistantError(f"Segment index out of range for {self.name}: {index}")
+
+    def _apply_segments(self, colors=None, segments=None, brightness=None, effect=None, speed=None):
+        """Paint several segments at once, optimistically; returns the previous state snapshot.
+
+        colors: list of RGB tuples applied from the first segment on; a shorter
+        list is repeated to fill the strip.
+        segments: mapping of 1-based segment index -> RGB tuple, applied after colors.
+        Arguments must have passed _validate_segments.
         """
-        # compress contiguous segment colors into groups
-        groups = []
-        for col in self._segment_colors:
-            if not groups:
-                groups.append([col, 1])
-            else:
-                if col == groups[-1][0]:
-                    groups[-1][1] += 1
-                else:
-                    groups.append([col, 1])
-
-        # normalize/truncate/extend to ensure 25 segments
-        total = sum(g[1] for g in groups)
-        if total != 25:
-            if total < 25:
-                groups[-1][1] += (25 - total)
-            else:
-                while sum(g[1] for g in groups) > 25:
-                    excess = sum(g[1] for g in groups) - 25
-                    if groups[-1][1] > excess:
-                        groups[-1][1] -= excess
-                    else:
-                        groups.pop()
-
-        num_groups = len(groups)
-
-        # build colors string (each color 6 hex)
-        colors_parts = []
-        for (r, g, b), cnt in groups:
-            colors_parts.append(f"{int(r):02X}{int(g):02X}{int(b):02X}")
-        colors_str = ''.join(colors_parts)
-
-        # build lengths string (each as 4-hex uppercase)
-        lengths_parts = []
-        for (_, count) in groups:
-            lengths_parts.append(f"{count:04X}")
-        lengths_str = ''.join(lengths_parts)
-
-        # build effect tail (reuse your existing logic)
-        effect = ""
-        if self._effect == self.EFFECT_SOLID:  # Solid effect
-            effect = "000640000E1"
-        elif self._effect == self.EFFECT_BREATH:  # Breath effect
-            effect = "000640000E4" + self._speed_to_hex(self._speed) + "0000" + self._speed_to_hex(self._speed) + "1664"
-        elif self._effect == self.EFFECT_GRADIENT:  # Gradient
-            effect = "100640000E3" + self._speed_to_hex(self._speed) + "C2O6" + self._speed_to_hex(self._speed)
-        elif self._effect == self.EFFECT_CLOCKWISE:  # Clockwise
-            effect = "00164" + self._speed_to_hex(self._speed) + "E1"
-        elif self._effect == self.EFFECT_COUNTERCLOCKWISE:  # Counterclockwise
-            effect = "00264" + self._speed_to_hex(self._speed) + "E1"
-        elif self._effect == self.EFFECT_CIRCULAR:  # Circular
-            effect = "100640000E1" + "C2O6" + self._speed_to_hex(self._speed)
-
-        # Compose the grouped d50
-        d50 = f"N01:P1000{num_groups}{colors_str}F21000{num_groups}{lengths_str}U3V3{effect};"
-        return d50
+        # Update state optimistically in one step
+        old_state = self._state_snapshot()
+        if colors:
+            self._segment_colors.paint(colors)
+        if segments:
+            for index, col in segments.items():
+                self._segment_colors[index - 1] = col
+        self._attr_rgb_color = self._segment_colors[0]
+        self._is_on = True
+        if brightness is not None:
+            self._brightness = brightness
+        if effect is not None:
+            self._effect = effect
+        if speed is not None:
+            self._speed = speed
+        return old_state
+
 
+    def _generate_d50_string(self):
+        """Generate the grouped d50 string for the current segments/effect/speed."""
+        segments = self._segment_colors.snapshot()
+        if self._metrics is None:
+            return codec.encode_d50(segments, self._effect, self._speed, self._color_tolerance)
+        start = time.perf_counter()
+        d50_str = codec.encode_d50(segments, self._effect, self._speed, self._color_tolerance)
+        self._metrics.d50_encode_time.record((time.perf_counter() - start) * 1000)
+        self._metrics.d50_size.record(len(d50_str))
+        return d50_str
 
     def _parse_d50(self, d50_str):
         """Parse grouped d50 string for effect and segment colours and primary color"""
         try:
-            # Reset to defaults
-            self._effect = self.EFFECT_SOLID
-            self._speed = 50
-
-            # Find P1000 block and F21000 marker
-            p_idx = d50_str.find('P1000')
-            if p_idx == -1:
-                # fallback: try single-color old format
-                match = re.search(r'P10001([0-9A-F]{6})', d50_str)
-                if match:
-                    hex_color = match.group(1)
-                    r = int(hex_color[0:2], 16)
-                    g = int(hex_color[2:4], 16)
-                    b = int(hex_color[4:6], 16)
-                    self._segment_colors = [(r, g, b)] * 25
-                    self._attr_rgb_color = (r, g, b)
-                # continue to parse effect below
-            else:
-                f_idx = d50_str.find('F21000', p_idx)
-                if f_idx == -1:
-                    raise ValueError("Missing F21000 after P1000 block")
-
-                # block contains ascii num_groups + colors_hex
-                block = d50_str[p_idx + len('P1000') : f_idx]
-
-                # we must determine how many ASCII digits form num_groups (k)
-                num_groups = None
-                k_used = None
-                for k in range(1, 4):  # try 1..3 digits for safety
-                    if len(block) >= k and block[:k].isdigit():
-                        candidate = int(block[:k])
-                        if len(block) - k == 6 * candidate:
-                            num_groups = candidate
-                            k_used = k
-                            break
-
-                if num_groups is None:
-                    raise ValueError("Could not deduce num_groups / colors length from d50")
-
-                colors_hex = block[k_used:]
-                colors = [colors_hex[i*6:(i+1)*6] for i in range(num_groups)]
-                colors_rgb = [(int(c[0:2], 16), int(c[2:4], 16), int(c[4:6], 16)) for c in colors]
-
-                # read second num_groups with the same digit-length k_used
-                num_groups2_str = d50_str[f_idx + 6 : f_idx + 6 + k_used]
-                num_groups2 = int(num_groups2_str) if num_groups2_str.isdigit() else None
-
-                # read lengths: next num_groups * 4 hex chars
-                lengths_hex = d50_str[f_idx + 6 + k_used : f_idx + 6 + k_used + num_groups * 4]
-                if len(lengths_hex) < num_groups * 4:
-                    raise ValueError("Not enough length hex data in d50")
-
-                lengths = [int(lengths_hex[i*4:(i+1)*4], 16) for i in range(num_groups)]
-
-                # expand to 25 segments
-                segs = []
-                for (col, cnt) in zip(colors_rgb, lengths):
-                    segs.extend([col] * cnt)
-
-                # normalize to 25 segments
-                if len(segs) < 25:
-                    if segs:
-                        segs.extend([segs[-1]] * (25 - len(segs)))
-                    else:
-                        segs = [(255,255,255)] * 25
-                elif len(segs) > 25:
-                    segs = segs[:25]
-
-                self._segment_colors = segs
+            start = time.perf_counter()
+            state = codec.decode_d50(d50_str)
+            if self._metrics is not None:
+                self._metrics.d50_parse_time.record((time.perf_counter() - start) * 1000)
+            if state.segments is not None:
+                # devices without segment entities take whatever length they report
+                self._segment_colors.load(state.segments, resize=not self._segmented)
                 self._attr_rgb_color = self._segment_colors[0]
-
-            # Parse effect and speed as before
-            if "000640000E1" in d50_str:
-                self._effect = self.EFFECT_SOLID
-            elif breath_match := re.search(r'000640000E4([0-9A-F]{4})0000[0-9A-F]{4}1664', d50_str):
-                self._effect = self.EFFECT_BREATH
-                speed_hex = breath_match.group(1)
-                self._speed = self._hex_to_speed(speed_hex)
-            elif gradient_match := re.search(r'100640000E3([0-9A-F]{4})C2O6[0-9A-F]{4}', d50_str):
-                self._effect = self.EFFECT_GRADIENT
-                speed_hex = gradient_match.group(1)
-                self._speed = self._hex_to_speed(speed_hex)
-            elif clockwise_match := re.search(r'00164([0-9A-F]{4})E1', d50_str):
-                self._effect = self.EFFECT_CLOCKWISE
-                speed_hex = clockwise_match.group(1)
-                self._speed = self._hex_to_speed(speed_hex)
-            elif counter_match := re.search(r'00264([0-9A-F]{4})E1', d50_str):
-                self._effect = self.EFFECT_COUNTERCLOCKWISE
-                speed_hex = counter_match.group(1)
-                self._speed = self._hex_to_speed(speed_hex)
-            elif circular_match := re.search(r'100640000E1C2O6([0-9A-F]{4})', d50_str):
-                self._effect = self.EFFECT_CIRCULAR
-                speed_hex = circular_match.group(1)
-                self._speed = self._hex_to_speed(speed_hex)
-
-            # Update segment entities if present
-            try:
-                segments = self.hass.data[DOMAIN][self._entry_id].get('segments', {}).get(self._did, [])
-                for seg in segments:
-                    try:
-                        seg.async_write_ha_state()
-                    except Exception:
-                        pass
-            except Exception:
-                pass
+            self._effect = state.effect
+            self._speed = codec.DEFAULT_SPEED if state.speed is None else state.speed
 
         except Exception as e:
             _LOGGER.error("Error parsing d50: %s", e)
             # fallback
-            self._segment_colors = [(255, 255, 255)] * 25
-            self._attr_rgb_color = (255, 255, 255)
-            self._speed = 50
+            self._segment_colors.fill(codec.DEFAULT_COLOR)
+            self._attr_rgb_color = codec.DEFAULT_COLOR
+            self._effect = self.EFFECT_SOLID
+            self._speed = codec.DEFAULT_SPEED
 
 
     @property
@@ -541,79 +567,138 @@ class LeproLedLight(LightEntity):
     def effect(self):
         return self._effect
 
-    async def _send_special_effect_command(self, effect):
-        """Send command for special (d2=3) effects using d60.
-           Uses self._sensitivity as 0..100 percent and encodes to 0x00..0x63.
-        """
+    @property
+    def extra_state_attributes(self):
+        if self._compact_segments:
+            return {"segments": self._segment_colors.compact()}
+        return None
+
+    def _schedule_state_command(self):
+        """Queue a publish of the current state through the coalescer."""
+        self._cancel_stream()
+        self._coalescer.schedule()
+
+    async def _send_state_command(self, priority=PRIORITY_EFFECT):
+        """Send the current state using d60 for special effects, d50 otherwise."""
+        payload = self._state_payload()
+        if payload is not None:
+            await self._send_mqtt_command(payload, priority)
+
+    def _state_payload(self):
+        """dp payload for the current state; None if it can't be encoded."""
         try:
-            prefix = self.SPECIAL_EFFECT_TO_D60_PREFIX.get(effect)
-            if not prefix:
-                _LOGGER.error("Unknown special effect: %s", effect)
-                return
-
-            # Read sensitivity as percent 0..100
-            sens_percent = int(round(getattr(self, "_sensitivity", 50)))
-            # clamp percent
-            sens_percent = max(0, min(100, sens_percent))
-
-            # Encode percent (0..100) -> hex_val (0..0x63)
-            MAX_HEX = 0x63
-            hex_val = int(round(sens_percent * MAX_HEX / 100))
-            hex_val = max(0, min(MAX_HEX, hex_val))
-
-            sens_hex = f"{hex_val:02X}"  # two hex digits
-            d60_value = f"{prefix}{sens_hex}0000"
-
-            payload = {
-                "d1": 1,
-                "d2": 3,
-                "d60": d60_value,
-                "d52": self._map_ha_brightness(self._brightness)
-            }
-            await self._send_mqtt_command(payload)
+            if self._effect in self.SPECIAL_EFFECTS:
+                # special effects use d2=3 (d60)
+                return self._special_effect_payload(self._effect)
+            # regular effects use d2=2 (d50)
+            return self._effect_payload()
         except Exception as e:
-            _LOGGER.error("Failed to send special effect command %s: %s", effect, e)
+            _LOGGER.error("Failed to build command for effect %s: %s", self._effect, e)
+            return None
 
+    def _special_effect_payload(self, effect):
+        """Payload for special (d2=3) effects using d60.
+           Uses self._sensitivity as 0..100 percent and encodes to 0x00..0x63.
+        """
+        d60_value = codec.encode_d60(effect, getattr(self, "_sensitivity", codec.DEFAULT_SENSITIVITY))
+        if not d60_value:
+            _LOGGER.error("Unknown special effect: %s", effect)
+            return None
+
+        return {
+            "d1": 1,
+            "d2": 3,
+            "d60": d60_value,
+            "d52": self._map_ha_brightness(self._brightness)
+        }
 
-    async def _send_effect_command(self):
-        """Send command for effect modes"""
+    def _effect_payload(self):
+        """Payload for effect modes"""
         # Generate d50 string with current colors/groups
         d50_str = self._generate_d50_string()
-        
-        payload = {
+
+        return {
             "d1": 1,
             "d2": 2,
             "d50": d50_str,
             "d52": self._map_ha_brightness(self._brightness)
         }
-        await self._send_mqtt_command(payload)
+
+    def _prepare_state_command(self):
+        """Build the prp/set message for the current state without publishing it.
+
+        Claims the send from the coalescer; the caller publishes the message and
+        then hands it to _track_command. Returns None if there's nothing to send.
+        """
+        payload = self._state_payload()
+        if payload is None:
+            return None
+        self._cancel_stream()
+        self._coalescer.take()
+        return self._build_command(payload)
 
     async def async_turn_off(self, **kwargs):
         """Turn off the light."""
+        # a pending update or transition would turn the light back on
+        self._cancel_stream()
+        self._coalescer.cancel()
+        old_state = self._state_snapshot()
         payload = {"d1": 0}
-        await self._send_mqtt_command(payload)
+        transition = kwargs.get(ATTR_TRANSITION)
+        if transition and self._is_on:
+            # fade to black, then switch off; the brightness is kept for the next turn on
+            colors = self._segment_colors.snapshot()
+            kept = self._brightness
+            self._start_transition(
+                (kept, colors), (0, colors), transition,
+                lambda brightness, colors: self._finish_fade_out(kept, payload),
+            )
+        else:
+            await self._send_mqtt_command(payload, PRIORITY_INTERACTIVE)
         self._is_on = False
-        self.async_write_ha_state()
+        # parent and segments (they show the parent's on state)
+        self._write_changed_states(old_state)
 
-    async def _send_mqtt_command(self, payload: dict):
-        """Send command via MQTT"""
-        topic = f"le/{self._did}/prp/set"
+    def _build_command(self, payload: dict):
+        """Wrap a dp payload into a prp/set message: (topic, raw json, command id, payload)."""
+        cmd_id = random.randint(0, 1000000000)
         full_payload = {
-            "id": random.randint(0, 1000000000),
+            "id": cmd_id,
             "t": int(time.time()),
             "d": payload
         }
+        return f"le/{self._did}/prp/set", json.dumps(full_payload), cmd_id, payload
+
+    def _track_command(self, command, sent=True, priority=PRIORITY_EFFECT):
+        """Record a command for acknowledgement tracking once it has gone out.
+
+        A command only queued offline isn't timed (the deadline would measure
+        the outage), but it supersedes whatever is still in flight for the device.
+        A retry goes out in the command's own priority lane.
+        """
+        topic, raw, cmd_id, payload = command
+        if not self._ack_tracker:
+            return
+        if not sent:
+            self._ack_tracker.cancel(self._did)
+            return
+        _LOGGER.debug("Sent MQTT command: %s - %s", topic, raw)
+        self._ack_tracker.track(self._did, cmd_id, topic, raw, payload, priority)
+
+    async def _send_mqtt_command(self, payload: dict, priority=PRIORITY_EFFECT, track=True):
+        """Send command via MQTT"""
+        command = self._build_command(payload)
         try:
-            await self._mqtt_client.publish(topic, json.dumps(full_payload))
-            _LOGGER.debug("Sent MQTT command: %s - %s", topic, full_payload)
+            sent = await self._mqtt_client.publish(command[0], command[1], priority)
+            if track:
+                self._track_command(command, sent, priority)
         except Exception as e:
             _LOGGER.error("Failed to send MQTT command: %s", e)
             
-    async def async_added_to_hass(self):
-        """Run when entity is added to hass."""
-        await super().async_added_to_hass()
-        # Request initial state
-        await self._request_state_update()
+    async def async_will_remove_from_hass(self):
+        """Stop any transition still streaming to the device."""
+        self._cancel_stream()
+        self._coalescer.cancel()
 
     async def _request_state_update(self):
         """Request current state from device."""
@@ -621,7 +706,7 @@ class LeproLedLight(LightEntity):
         # Request both switch state and brightness
         payload = json.dumps({"d": ["d1", "d2", "d3", "d4", "d5", "d30", "d50", "d52", "d60", "online"]})
         try:
-            await self._mqtt_client.publish(topic, payload)
+            await self._mqtt_client.publish(topic, payload, PRIORITY_BACKGROUND)
             _LOGGER.debug("Requested state update for %s", self.name)
         except Exception as e:
             _LOGGER.error("Failed to request state update: %s", e)
@@ -659,10 +744,10 @@ class LeproSegmentLight(LightEntity):
 
     @property
     def rgb_color(self):
-        segs = getattr(self._parent, "_segment_colors", [(255,255,255)]*25)
+        segs = self._parent._segment_colors
         if len(segs) > self._index:
             return segs[self._index]
-        return (255,255,255)
+        return codec.DEFAULT_COLOR
 
     # HA property used by UI (preferred attribute already in parent):
     @property
@@ -671,6 +756,7 @@ class LeproSegmentLight(LightEntity):
 
     async def async_turn_on(self, **kwargs):
         """Turn on (or change color) for this segment. Updating the parent triggers d50 send."""
+        old_state = self._parent._state_snapshot()
         # Update brightness if provided
         if ATTR_BRIGHTNESS in kwargs:
             new_brightness = kwargs[ATTR_BRIGHTNESS]
@@ -680,56 +766,23 @@ class LeproSegmentLight(LightEntity):
         if ATTR_RGB_COLOR in kwargs:            
             # read new color, default to current segment color
             new_color = kwargs.get(ATTR_RGB_COLOR, self.rgb_color)
-            # update parent's segment color
-            seg_colors = list(self._parent._segment_colors)
-            seg_colors[self._index] = tuple(int(c) for c in new_color)
-            self._parent._segment_colors = seg_colors
+            # update parent's segment color in place
+            self._parent._segment_colors[self._index] = new_color
             # If this is segment 0 (first) update parent's primary color too
             if self._index == 0:
                 self._parent._attr_rgb_color = tuple(int(c) for c in new_color)
-            # send updated d50 via parent
 
-        try:
-            if self._parent._effect in self._parent.SPECIAL_EFFECTS:
-                await self._parent._send_special_effect_command(self._parent._effect)
-            else:
-                await self._parent._send_effect_command()
-                
-        except Exception as e:
-            _LOGGER.error("Error sending d50 after segment change: %s", e)
-        # update states: parent + all segments
-        try:
-            self._parent.async_write_ha_state()
-            segments = self.hass.data[DOMAIN][self._parent._entry_id].get('segments', {}).get(self._parent._did, [])
-            for seg in segments:
-                try:
-                    seg.async_write_ha_state()
-                except Exception:
-                    pass
-        except Exception:
-            pass
+        # send updated d50 via parent; bursts of segment changes are coalesced
+        self._parent._is_on = True
+        self._parent._schedule_state_command()
+        # update states: parent and the segments that actually changed
+        self._parent._write_changed_states(old_state)
 
     async def async_turn_off(self, **kwargs):
         """Turning off a single segment maps to turning off the parent device."""
         await self._parent.async_turn_off(**kwargs)
 
 
-async def download_cert_file(session, url, path, headers):
-    """Download a certificate file asynchronously."""
-    async with session.get(url, headers=headers) as resp:
-        if resp.status != 200:
-            raise Exception(f"Failed to download {url}: {resp.status}")
-        data = await resp.read()
-        async with aiofiles.open(path, 'wb') as f:
-            await f.write(data)
-
-def create_ssl_context(root_ca_path, client_cert_path, keyfile_path):
-    """Create SSL context in a thread-safe manner."""
-    context = ssl.create_default_context()
-    context.load_verify_locations(cafile=root_ca_path)
-    context.load_cert_chain(certfile=client_cert_path, keyfile=keyfile_path)
-    return context
-
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_entities: AddEntitiesCallback):
     """Set up Lepro LED lights from config entry."""
     config = hass.data["lepro_led"][entry.entry_id]
@@ -768,95 +821,88 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_e
     client_cert_path = os.path.join(cert_dir, f"{entry.entry_id}_client_cert.pem")
     keyfile_path = os.path.join(os.path.dirname(__file__), "client_key.pem")
 
-    async with aiohttp.ClientSession() as session:
-        # 1) Login and get bearer token
-        bearer_token = await async_login(session, account, password, mac, language, fcm_token)
-        if bearer_token is None:
-            _LOGGER.error("Failed to login to Lepro API")
-            return
-
-        headers = {
-            "Authorization": f"Bearer {bearer_token}",
-            "Accept-Encoding": "gzip",
-            "App-Version": "1.0.9.202",
-            "Device-Model": "custom_integration",
-            "Device-System": "custom",
-            "GMT": "+0",
-            "Host": "api-na-iot.lepro.com",
-            "Language": language,
-            "Platform": "2",
-            "Screen-Size": "1536*2048",
-            "Slanguage": language,
-            "User-Agent": "LE/1.0.9.202 (Custom Integration)",
-        }
-
-        # 2) Get user profile to find uid and MQTT info
-        user_url = USER_PROFILE_URL
-        timestamp = str(int(time.time()))
-        headers["Timestamp"] = timestamp
-        
-        async with session.get(user_url, headers=headers) as resp:
-            if resp.status != 200:
-                _LOGGER.error("Failed to get user profile from Lepro API")
-                return
-            user_data = await resp.json()
-
-        try:
-            uid = user_data["data"]["uid"]
-            mqtt_info = user_data["data"]["mqtt"]
-        except KeyError as e:
-            _LOGGER.error("Failed to parse user profile response: %s", e)
-            return
+    api = LeproCloudApi(async_get_clientsession(hass), account, password, mac, language, fcm_token)
+    store_path = cache_path(cert_dir, entry.entry_id)
 
-        # 3) Download certificates within the same session
+    # 2) Warm start: reuse token, certificates and device list from the
+    # on-disk cache when the certificates are intact and not expiring
+    start = time.monotonic()
+    cache = await async_load_cache(store_path)
+    warm = await hass.async_add_executor_job(cache_is_valid, cache, root_ca_path, client_cert_path)
+    if warm:
         try:
-            await download_cert_file(session, mqtt_info["root"], root_ca_path, headers)
-            await download_cert_file(session, mqtt_info["cert"], client_cert_path, headers)
+            ssl_context = await hass.async_add_executor_job(
+                create_ssl_context, root_ca_path, client_cert_path, keyfile_path
+            )
         except Exception as e:
-            _LOGGER.error("Certificate download failed: %s", e)
-            return
-
-        # 4) Get family list to find fid
-        family_url = FAMILY_LIST_URL.format(timestamp=timestamp)
-        async with session.get(family_url, headers=headers) as resp:
-            if resp.status != 200:
-                _LOGGER.error("Failed to get family list from Lepro API")
-                return
-            family_data = await resp.json()
-
+            _LOGGER.warning("Cached Lepro certificates unusable, logging in again: %s", e)
+            warm = False
+
+    if warm:
+        api.token = cache["token"]
+        mqtt_info = cache["mqtt_info"]
+        devices = cache["devices"]
+        timings = {"cache": round((time.monotonic() - start) * 1000, 1)}
+        _LOGGER.debug("Lepro LED starting from cache for entry %s", entry.entry_id)
+    else:
+        # 3-6) Cold bootstrap from the cloud on HA's pooled session: login, profile,
+        # certificates, family and device list (independent steps run concurrently)
         try:
-            fid = family_data["data"]["list"][0]["fid"]
-        except (KeyError, IndexError) as e:
-            _LOGGER.error("Failed to parse fid from family list response: %s", e)
+            bootstrap = await async_bootstrap(hass, api, root_ca_path, client_cert_path, keyfile_path)
+        except LeproApiError as e:
+            _LOGGER.error("%s", e)
+            return
+        except Exception as e:
+            _LOGGER.error("Lepro cloud bootstrap failed: %s", e)
             return
 
-        # 5) Get device list by fid
-        timestamp = str(int(time.time()))
-        device_url = DEVICE_LIST_URL.format(fid=fid, timestamp=timestamp)
-        headers["Timestamp"] = timestamp
-
-        async with session.get(device_url, headers=headers) as resp:
-            if resp.status != 200:
-                _LOGGER.error("Failed to get device list from Lepro API")
-                return
-            device_data = await resp.json()
-
-        devices = device_data.get("data", {}).get("list", [])
+        mqtt_info = bootstrap.mqtt_info
+        devices = bootstrap.devices
+        ssl_context = bootstrap.ssl_context
+        timings = bootstrap.timings
         if not devices:
             _LOGGER.warning("No devices found in Lepro account")
             return
+        cache = await hass.async_add_executor_job(
+            build_cache, api.token, mqtt_info, devices, root_ca_path, client_cert_path
+        )
+        await async_save_cache(store_path, cache)
 
-    # 6) Create SSL context in executor thread
-    try:
-        ssl_context = await hass.async_add_executor_job(
-            create_ssl_context, 
-            root_ca_path, 
-            client_cert_path, 
-            keyfile_path
+    async def async_save_devices(device_list):
+        """Persist a changed device list into the warm-start cache."""
+        nonlocal cache
+        cache = {**cache, "devices": device_list, "token": api.token}
+        await async_save_cache(store_path, cache)
+
+    async def async_refresh_cache():
+        """Check the cloud copy behind a warm start and repair any drift."""
+        nonlocal cache
+        try:
+            fresh = await async_bootstrap(hass, api, root_ca_path, client_cert_path, keyfile_path)
+        except Exception as e:
+            _LOGGER.warning("Background Lepro cloud check failed, keeping cached data: %s", e)
+            return
+        if not fresh.devices:
+            # an empty listing is far more likely a cloud hiccup than an emptied account
+            _LOGGER.warning("Background Lepro cloud check returned no devices, keeping cached data")
+            return
+        new_cache = await hass.async_add_executor_job(
+            build_cache, api.token, fresh.mqtt_info, fresh.devices, root_ca_path, client_cert_path
         )
-    except Exception as e:
-        _LOGGER.error("Failed to create SSL context: %s", e)
-        return
+        await async_save_cache(store_path, new_cache)
+
+        drift = []
+        if new_cache["certs"] != cache["certs"]:
+            drift.append("certificates")
+        if (fresh.mqtt_info.get("host"), fresh.mqtt_info.get("port")) != (mqtt_info.get("host"), mqtt_info.get("port")):
+            drift.append("broker")
+        cache = new_cache
+        if drift:
+            _LOGGER.info("Lepro cloud data changed since cache (%s), reloading", ", ".join(drift))
+            hass.config_entries.async_schedule_reload(entry.entry_id)
+        elif device_identity(fresh.devices) != device_identity(devices):
+            # device changes are applied in place
+            await sync.async_apply(fresh.devices, full=True)
 
     # 7) Create MQTT client
     client_id_suffix = hashlib.sha256(entry.entry_id.encode()).hexdigest()[:32]
@@ -877,122 +923,138 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_e
         return
     
     # 8) Create entities
+    command_window = entry.options.get(CONF_COMMAND_WINDOW, DEFAULT_COMMAND_WINDOW) / 1000
+    transition_fps = entry.options.get(CONF_TRANSITION_FPS, DEFAULT_TRANSITION_FPS)
+    color_tolerance = entry.options.get(CONF_COLOR_TOLERANCE, DEFAULT_COLOR_TOLERANCE)
+    segment_entities = entry.options.get(CONF_SEGMENT_ENTITIES, DEFAULT_SEGMENT_ENTITIES)
+    ack_tracker = CommandTracker(mqtt_client.publish)
+    metrics = PipelineMetrics()
+
+    # did -> exposed 0-based segment indices, only used while segment entities are off
+    exposed_store = Store(hass, EXPOSED_SEGMENTS_VERSION, f"{DOMAIN}.{entry.entry_id}.segments")
+    exposed = {} if segment_entities else (await exposed_store.async_load() or {})
+
+    def create_device_entities(device):
+        """Create the light for a device plus its segment lights; parent first."""
+        entity = LeproLedLight(
+            device, mqtt_client, entry.entry_id, command_window, transition_fps, color_tolerance
+        )
+        entity._ack_tracker = ack_tracker
+        entity._metrics = metrics
+        created = [entity]
+
+        # Segmented series (see segments.SERIES_SEGMENTS) get one light per segment,
+        # or in compact mode only the exposed ones
+        if entity._segmented:
+            count = len(entity._segment_colors)
+            if segment_entities:
+                indices = range(count)
+            else:
+                entity._compact_segments = True
+                indices = [idx for idx in exposed.get(entity._did, ()) if idx < count]
+            entity._segments = [LeproSegmentLight(entity, idx) for idx in indices]
+            created.extend(entity._segments)
+        return created
+
+    @callback
+    def expose_segments(parent, indices):
+        """Create the missing segment entities of parent for 0-based indices; returns how many."""
+        have = {seg._index for seg in parent._segments}
+        new = [LeproSegmentLight(parent, idx) for idx in sorted(set(indices) - have)]
+        if not new:
+            return 0
+        parent._segments = sorted(parent._segments + new, key=lambda seg: seg._index)
+        store["entities"].extend(new)
+        store["segments"][parent._did] = parent._segments
+        if not segment_entities:
+            exposed[parent._did] = [seg._index for seg in parent._segments]
+            exposed_store.async_delay_save(lambda: exposed, 1)
+        async_add_entities(new)
+        return len(new)
+
     entities = []
     device_entity_map = {}
     segments_map = {}
     for device in devices:
-        entity = LeproLedLight(device, mqtt_client, entry.entry_id)
-        entities.append(entity)
-        device_entity_map[str(device['did'])] = entity
-
-        # If this is a segmented series (S1-5) create 25 segment lights
-        series = device.get("series", "") or ""
-        if "S1-5" in series:
-            segs = []
-            for idx in range(25):
-                seg_entity = LeproSegmentLight(entity, idx)
-                entities.append(seg_entity)
-                segs.append(seg_entity)
-            segments_map[str(device['did'])] = segs
+        created = create_device_entities(device)
+        entity = created[0]
+        entities.extend(created)
+        device_entity_map[entity._did] = entity
+        if entity._segments:
+            segments_map[entity._did] = entity._segments
+
+    if not segment_entities:
+        # segment entities that are no longer created would linger as unavailable
+        registry = er.async_get(hass)
+        wanted = {e.unique_id for e in entities}
+        stale = [
+            reg.entity_id
+            for reg in er.async_entries_for_config_entry(registry, entry.entry_id)
+            if reg.domain == "light" and "_segment_" in reg.unique_id and reg.unique_id not in wanted
+        ]
+        for entity_id in stale:
+            registry.async_remove(entity_id)
+        if stale:
+            _LOGGER.info("Lepro LED compact segments: removed %d segment entities", len(stale))
     
-    # 9) Message handler
-    # Update the message handler to process all relevant fields
-    async def handle_mqtt_message(message):
-        try:
-            topic = message.topic.value
-            payload = json.loads(message.payload.decode())
-            _LOGGER.debug("Received MQTT message: %s - %s", topic, payload)
-            
-            parts = topic.split('/')
-            if len(parts) < 4 or parts[0] != "le":
-                return
-                
-            did = parts[1]
-            message_type = parts[3]
-            entity = device_entity_map.get(did)
-            
-            if not entity:
-                return
-                
-            # Handle different message types
-            if message_type in ["rpt", "set", "getr"]:
-                data = payload.get('d', {})
-                
-                # Update basic state
-                if 'd1' in data:
-                    entity._is_on = bool(data['d1'])
-                
-                # Update mode
-                if 'd2' in data:
-                    entity._mode = data['d2']
-                
-                # Update brightness
-                if 'd52' in data:
-                    entity._brightness = entity._map_device_brightness(data['d52'])
-                    entity._attr_brightness = entity._brightness
-                
-                # Update effect and colors
-                if 'd50' in data:
-                    entity._parse_d50(data['d50'])
-                
-                # Update d60: special effects and sensitivity
-                if 'd60' in data:
-                    sens, parsed_effect = entity._parse_d60(data['d60'])
-                    # update sensitivity
-                    entity._sensitivity = sens
-                    # If parser recognizes a special effect code, set it
-                    if parsed_effect:
-                        entity._effect = parsed_effect
-
-                # Update effect based on mode (mode==3 indicates special effects)
-                if entity._mode == 3 and entity._effect not in entity.SPECIAL_EFFECTS:
-                    # If we have no parsed effect but mode says special, default to flash
-                    entity._effect = entity.EFFECT_FLASH
-
-                # update main + segments states
-                entity.async_write_ha_state()
-
-                # NEW: also refresh any number entities (speed / sensitivity) linked to this device
-                try:
-                    numbers_map = hass.data.get(DOMAIN, {}).get(entry.entry_id, {}).get("numbers", {})
-                    for num in numbers_map.get(did, []):
-                        try:
-                            num.async_write_ha_state()
-                        except Exception:
-                            pass
-                except Exception:
-                    pass
-
-                try:
-                    for seg in segments_map.get(did, []):
-                        seg.async_write_ha_state()
-                except Exception:
-                    pass
-
-                _LOGGER.debug("Updated state for %s: on=%s, mode=%s, effect=%s, brightness=%s, speed=%s, rgb=%s, sensitivity=%s", 
-                             entity.name, entity._is_on, entity._mode, entity._effect, entity._brightness, entity._speed, entity._segment_colors[0], entity._sensitivity)
-                    
-        except Exception as e:
-            _LOGGER.error("Error processing MQTT message: %s", e)
-   
-    mqtt_client.set_message_callback(handle_mqtt_message)
+    # 9) Message handler: topic -> entity dispatch table built once; state polls
+    # (prp/get) are staggered by the reconciler, at startup and after reconnects
+    reconciler = StateReconciler()
+    router = MessageRouter(ack_tracker, metrics, reconciler)
+    for did, entity in device_entity_map.items():
+        router.add_device(did, entity)
+        reconciler.add_device(did, entity)
+    reconciler.spread()
+    mqtt_client.set_message_callback(router.async_handle_message)
+    mqtt_client.set_reconnect_callback(reconciler.async_reschedule_all)
     
-    # 10) Subscribe and start
-    await mqtt_client.subscribe(f"le/{client_id_suffix}/act/app/exe")
-    for did in device_entity_map.keys():
-        await mqtt_client.subscribe(f"le/{did}/prp/#")
+    # 10) Subscribe and start: batched multi-topic SUBSCRIBEs, or one wildcard for large fleets
+    await mqtt_client.subscribe_many(select_subscription_topics(
+        device_entity_map.keys(),
+        client_id_suffix,
+        entry.options.get(CONF_WILDCARD_SUBSCRIBE, False),
+    ))
     
     # Store for cleanup
     if DOMAIN not in hass.data:
         hass.data[DOMAIN] = {}
-    hass.data[DOMAIN][entry.entry_id] = {
+    store = hass.data[DOMAIN][entry.entry_id] = {
         'mqtt_client': mqtt_client,
+        'api': api,
         'entities': entities,
-        'segments': segments_map
+        'devices': device_entity_map,
+        'segments': segments_map,
+        'router': router,
+        'ack_tracker': ack_tracker,
+        'reconciler': reconciler,
+        'metrics': metrics,
+        'bootstrap_timings': timings,
+        'expose_segments': expose_segments,
     }
     
     async_add_entities(entities)
 
+    # 11) Periodic incremental device sync, applied without reloading
+    sync = DeviceSync(
+        hass, entry, api, store, devices, create_device_entities, async_add_entities, async_save_devices
+    )
+    store['sync'] = sync
+    sync_interval = entry.options.get(CONF_SYNC_INTERVAL, DEFAULT_SYNC_INTERVAL)
+    if sync_interval:
+        sync.interval = sync_interval * 60
+        entry.async_on_unload(
+            async_track_time_interval(hass, sync.async_sync, timedelta(minutes=sync_interval))
+        )
+
+    entry.async_on_unload(
+        async_track_time_interval(hass, reconciler.async_tick, timedelta(seconds=TICK_INTERVAL))
+    )
+
+    if warm:
+        entry.async_create_background_task(
+            hass, async_refresh_cache(), f"lepro_led cache refresh {entry.entry_id}"
+        )
+
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload MQTT client and entities."""
     data = hass.data[DOMAIN].get(entry.entry_id)
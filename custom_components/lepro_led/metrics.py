@@ -0,0 +1,131 @@
+"""Cheap in-process metrics: fixed-bucket histograms."""
+
+from __future__ import annotations
+from bisect import bisect_left
+
+# Upper bounds (ms) of the latency buckets; a final bucket catches the rest
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class Histogram:
+    """Fixed-bucket histogram; recording a sample allocates nothing."""
+
+    __slots__ = ("bounds", "counts", "count", "total", "maximum")
+
+    def __init__(self, bounds=LATENCY_BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = None
+
+    def record(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+    def percentile(self, pct):
+        """Upper bound of the bucket holding the pct-th percentile (None if empty).
+
+        In the overflow bucket that is the largest sample seen, so a p95 sensor
+        keeps a (pessimistic) number exactly when things are slow.
+        """
+        if not self.count:
+            return None
+        rank = self.count * pct / 100
+        seen = 0
+        for bound, n in zip(self.bounds, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return round(self.maximum, 3)
+
+    def as_dict(self):
+        labels = [f"<={b}" for b in self.bounds] + [f">{self.bounds[-1]}"]
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 3) if self.count else None,
+            "max": round(self.maximum, 3) if self.count else None,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+# Buckets (ms) for in-process work (message handling, d50 codec): normally well under 1ms
+TIMING_BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# d50 payload size buckets (bytes): one group is 43, all 25 groups 285
+D50_SIZE_BUCKETS = (48, 64, 96, 128, 192, 256, 320)
+
+# Inbound message types counted by the router; anything unrouted is "other"
+MESSAGE_TYPES = ("rpt", "set", "getr", "other")
+
+
+class PipelineMetrics:
+    """Counters and timings of one entry's MQTT pipeline.
+
+    The hot paths only bump preallocated counters and histograms; rates are
+    derived in sample(), which runs on a timer and diffs against the last sample.
+    """
+
+    def __init__(self):
+        self.messages = dict.fromkeys(MESSAGE_TYPES, 0)
+        self.handler_time = Histogram(TIMING_BUCKETS_MS)
+        self.d50_parse_time = Histogram(TIMING_BUCKETS_MS)
+        self.d50_encode_time = Histogram(TIMING_BUCKETS_MS)
+        self.d50_size = Histogram(D50_SIZE_BUCKETS)
+        self.values = {}
+        self.transition_frames = 0
+        self.transition_frames_dropped = 0
+        self.animation_frames = 0
+        self.animation_frames_dropped = 0
+        # HA state writes of every light, kept here so removing a device doesn't lower it
+        self.state_writes = 0
+        # outcome of the last synchronized group publish
+        self.last_group_publish = None
+        self._last = None  # (monotonic time, counters)
+
+    def sample(self, now, mqtt_client):
+        """Refresh self.values from the counters; rates are per second since the previous sample."""
+        counters = {f"messages_{t}": n for t, n in self.messages.items()}
+        counters["state_writes"] = self.state_writes
+        values = {
+            "publishes": mqtt_client.published,
+            "pending_messages": len(mqtt_client.offline),
+            "offline_dropped": mqtt_client.offline.dropped,
+            "reconnects": mqtt_client.reconnects,
+            "publish_queue": mqtt_client.limiter.queued,
+            "interactive_wait_p95": mqtt_client.limiter.wait_time[0].percentile(95),
+            "handler_p50": self.handler_time.percentile(50),
+            "handler_p95": self.handler_time.percentile(95),
+            "d50_parse_p95": self.d50_parse_time.percentile(95),
+            "d50_encode_p95": self.d50_encode_time.percentile(95),
+            "d50_size_p95": self.d50_size.percentile(95),
+        }
+        if self._last is not None:
+            last_time, last = self._last
+            elapsed = now - last_time
+            for key, count in counters.items():
+                values[f"{key}_rate"] = round((count - last[key]) / elapsed, 2) if elapsed > 0 else None
+        self._last = (now, counters)
+        self.values = values
+        return values
+
+    def as_dict(self):
+        return {
+            "messages": dict(self.messages),
+            "handler_time_ms": self.handler_time.as_dict(),
+            "d50_parse_time_ms": self.d50_parse_time.as_dict(),
+            "d50_encode_time_ms": self.d50_encode_time.as_dict(),
+            "d50_size_bytes": self.d50_size.as_dict(),
+            "last_sample": self.values,
+            "last_group_publish": self.last_group_publish,
+            "transition_frames": self.transition_frames,
+            "transition_frames_dropped": self.transition_frames_dropped,
+            "animation_frames": self.animation_frames,
+            "animation_frames_dropped": self.animation_frames_dropped,
+            "state_writes": self.state_writes,
+        }
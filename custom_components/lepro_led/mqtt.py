@@ -0,0 +1,409 @@
+"""Supervised MQTT connection to the Lepro broker."""
+
+from __future__ import annotations
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import OrderedDict
+
+from aiomqtt import Client, MqttError
+
+from .ratelimit import PRIORITY_EFFECT, PublishLimiter
+
+_LOGGER = logging.getLogger(__name__)
+
+# Broker keepalive (s); a missed PINGRESP drops the connection and triggers a reconnect
+MQTT_KEEPALIVE = 60
+
+# Reconnect backoff (s): exponential from min to max, with full jitter on the upper half
+RECONNECT_MIN_DELAY = 1
+RECONNECT_MAX_DELAY = 300
+
+# Topics per SUBSCRIBE packet; AWS IoT style brokers reject more than 8
+SUBSCRIBE_BATCH_SIZE = 8
+
+# Fleet size from which the optional single wildcard subscription is used
+WILDCARD_MIN_DEVICES = 50
+WILDCARD_TOPIC = "le/+/prp/#"
+
+# Offline queue: topics kept while disconnected, and how long (s) an entry stays worth sending
+OFFLINE_QUEUE_SIZE = 500
+OFFLINE_TTL = 60
+
+
+def _topic_key(topic):
+    """Rate limit key of a topic: the did of le/{did}/..."""
+    return topic.split("/", 2)[1]
+
+
+def device_topic(did):
+    """Subscription topic covering all state messages of one device."""
+    return f"le/{did}/prp/#"
+
+
+def select_subscription_topics(dids, client_id_suffix, allow_wildcard=False):
+    """Pick the topics for a fleet: one le/{did}/prp/# per device, or a single
+    le/+/prp/# wildcard for large fleets when the broker is known to allow it."""
+    topics = [f"le/{client_id_suffix}/act/app/exe"]
+    dids = list(dids)
+    if allow_wildcard and len(dids) >= WILDCARD_MIN_DEVICES:
+        topics.append(WILDCARD_TOPIC)
+    else:
+        topics.extend(device_topic(did) for did in dids)
+    return topics
+
+
+def _merge_payloads(old, new):
+    """Fold two prp/set payloads into the newer one; newer data points win."""
+    try:
+        older = json.loads(old)
+        newer = json.loads(new)
+    except ValueError:
+        return new
+    if not isinstance(older.get("d"), dict) or not isinstance(newer.get("d"), dict):
+        return new
+    newer["d"] = {**older["d"], **newer["d"]}
+    return json.dumps(newer)
+
+
+class OfflineQueue:
+    """Outbound messages held while disconnected: latest per topic, bounded, expiring.
+
+    A message for a topic already queued replaces it (prp/set payloads are
+    merged so an earlier colour change survives a later partial command, and
+    repeated prp/get collapse into one). The oldest topic is dropped when
+    full, and entries older than the TTL are dropped at flush time.
+    """
+
+    def __init__(self, size=OFFLINE_QUEUE_SIZE, ttl=OFFLINE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._messages = OrderedDict()  # topic -> (payload, priority, queued at)
+        self.queued = 0
+        self.replaced = 0
+        self.overflow = 0
+        self.expired = 0
+        self.flushed = 0
+
+    def __len__(self):
+        return len(self._messages)
+
+    def __contains__(self, topic):
+        return topic in self._messages
+
+    @property
+    def dropped(self):
+        return self.replaced + self.overflow + self.expired
+
+    def put(self, topic, payload, priority):
+        self.queued += 1
+        old = self._messages.pop(topic, None)
+        if old is not None:
+            self.replaced += 1
+            if topic.endswith("/prp/set"):
+                payload = _merge_payloads(old[0], payload)
+            priority = min(priority, old[1])
+        elif len(self._messages) >= self.size:
+            self._messages.popitem(last=False)
+            self.overflow += 1
+        self._messages[topic] = (payload, priority, time.monotonic())
+
+    def take(self, topic):
+        """Remove and return the (payload, priority, queued at) queued for topic, or None."""
+        return self._messages.pop(topic, None)
+
+    def restore(self, topic, payload, priority, queued_at):
+        """Put back a drained message that didn't go out; it keeps its age and place.
+
+        If the topic was queued again meanwhile, that newer message wins (and
+        its age counts).
+        """
+        newer = self._messages.pop(topic, None)
+        if newer is not None:
+            if topic.endswith("/prp/set"):
+                payload = _merge_payloads(payload, newer[0])
+            else:
+                payload = newer[0]
+            priority = min(priority, newer[1])
+            queued_at = newer[2]
+        self._messages[topic] = (payload, priority, queued_at)
+        self._messages.move_to_end(topic, last=False)
+
+    def drain(self):
+        """Take every message still within the TTL, oldest first, as (topic, payload, priority, queued at)."""
+        now = time.monotonic()
+        messages, self._messages = self._messages, OrderedDict()
+        fresh = [
+            (topic, *message)
+            for topic, message in messages.items()
+            if now - message[2] <= self.ttl
+        ]
+        self.expired += len(messages) - len(fresh)
+        return fresh
+
+    def as_dict(self):
+        return {
+            "depth": len(self._messages),
+            "queued": self.queued,
+            "replaced": self.replaced,
+            "overflow": self.overflow,
+            "expired": self.expired,
+            "flushed": self.flushed,
+        }
+
+
+class MQTTClientWrapper:
+    def __init__(self, hass, host, port, ssl_context, client_id):
+        self.hass = hass
+        self.host = host
+        self.port = port
+        self.ssl_context = ssl_context
+        self.client_id = client_id
+        self.client = None
+        self._message_callback = None
+        self._reconnect_callback = None
+        self._loop_task = None
+        self._reconnect_task = None
+        self._flush_task = None
+        # authoritative subscription set, replayed on every (re)connect
+        self._subscriptions = {}
+        # latest message per topic while disconnected, flushed on connect
+        self.offline = OfflineQueue()
+        # drained for the running flush but not sent yet: topic -> (payload, priority, queued at)
+        self._flushing = {}
+        self.reconnects = 0
+        self.published = 0
+        # per-connection and per-device publish budgets with priority lanes
+        self.limiter = PublishLimiter()
+
+    @property
+    def connected(self):
+        return self.client is not None
+
+    def _backoff(self, attempt):
+        delay = min(RECONNECT_MAX_DELAY, RECONNECT_MIN_DELAY * 2 ** attempt)
+        return random.uniform(delay / 2, delay)
+
+    async def _connect_and_run(self):
+        """Keep a connection up: connect, resubscribe, pump messages, back off on failure."""
+        attempt = 0
+        first = True
+        while True:
+            try:
+                async with Client(
+                    hostname=self.host,
+                    port=self.port,
+                    identifier=self.client_id,
+                    tls_context=self.ssl_context,
+                    clean_session=True,
+                    keepalive=MQTT_KEEPALIVE,
+                ) as client:
+                    self.client = client
+                    attempt = 0
+
+                    # clean session: the broker forgot our subscriptions
+                    await self._subscribe_batches(client, list(self._subscriptions))
+
+                    # Send what was queued while offline in the background: at the
+                    # rate limit a full queue takes ~25s, the message pump can't wait
+                    self._flush_task = asyncio.create_task(self._flush_offline(client))
+
+                    if not first:
+                        self.reconnects += 1
+                        _LOGGER.info("Reconnected to Lepro MQTT broker %s", self.host)
+                        self._on_reconnect()
+                    first = False
+
+                    # Start message loop
+                    async for message in client.messages:
+                        if self._message_callback:
+                            try:
+                                await self._message_callback(message)
+                            except Exception as e:
+                                _LOGGER.error("Error in MQTT message callback: %s", e)
+            except MqttError as e:
+                _LOGGER.warning("MQTT connection to %s lost: %s", self.host, e)
+            except Exception as e:
+                _LOGGER.error("Unexpected MQTT error: %s", e)
+            finally:
+                self.client = None
+                await self._cancel_flush()
+
+            delay = self._backoff(attempt)
+            attempt += 1
+            _LOGGER.debug("Reconnecting to Lepro MQTT broker in %.1fs", delay)
+            await asyncio.sleep(delay)
+
+    async def _flush_offline(self, client):
+        messages = self.offline.drain()
+        if not messages:
+            return
+        _LOGGER.debug("Flushing %d queued MQTT messages", len(messages))
+        self._flushing = {topic: message for topic, *message in messages}
+
+        async def send(topic, priority):
+            await self.limiter.acquire(priority, _topic_key(topic), topic)
+            message = self._flushing.pop(topic, None)
+            if message is None:
+                # folded into a live publish meanwhile
+                return
+            await client.publish(topic, message[0])
+            self.published += 1
+            self.offline.flushed += 1
+
+        try:
+            results = await asyncio.gather(
+                *(send(topic, priority) for topic, _, priority, _ in messages), return_exceptions=True
+            )
+        except asyncio.CancelledError:
+            # connection lost mid-flush: what hadn't gone out waits for the next one
+            for topic, message in self._flushing.items():
+                self.offline.restore(topic, *message)
+            raise
+        finally:
+            self._flushing = {}
+        for (topic, *_), result in zip(messages, results):
+            if isinstance(result, BaseException):
+                _LOGGER.error("MQTT publish to %s failed: %s", topic, result)
+
+    def _fold_queued(self, topic, payload, priority):
+        """A live publish supersedes anything still queued for its topic; prp/set data is merged in."""
+        for message in (self._flushing.pop(topic, None), self.offline.take(topic)):
+            if message is None:
+                continue
+            self.offline.replaced += 1
+            if topic.endswith("/prp/set"):
+                payload = _merge_payloads(message[0], payload)
+            priority = min(priority, message[1])
+        return payload, priority
+
+    async def _cancel_flush(self):
+        task, self._flush_task = self._flush_task, None
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def _on_reconnect(self):
+        if not self._reconnect_callback:
+            return
+        # a newer reconnect supersedes an unfinished refresh
+        if self._reconnect_task and not self._reconnect_task.done():
+            self._reconnect_task.cancel()
+        self._reconnect_task = asyncio.create_task(self._reconnect_callback())
+
+    async def connect(self):
+        if self._loop_task and not self._loop_task.done():
+            return
+
+        self._loop_task = asyncio.create_task(self._connect_and_run())
+
+    def has_subscription(self, topic):
+        return topic in self._subscriptions
+
+    async def subscribe(self, topic):
+        self._subscriptions[topic] = None
+        if self.client:
+            try:
+                await self.client.subscribe(topic)
+            except MqttError as e:
+                # replayed on the next reconnect
+                _LOGGER.warning("MQTT subscribe to %s failed: %s", topic, e)
+        elif not self._loop_task or self._loop_task.done():
+            await self.connect()
+
+    async def subscribe_many(self, topics):
+        """Subscribe to many topics with multi-topic SUBSCRIBE packets sent back-to-back."""
+        topics = [t for t in topics if t not in self._subscriptions]
+        for topic in topics:
+            self._subscriptions[topic] = None
+        if self.client:
+            try:
+                await self._subscribe_batches(self.client, topics)
+            except MqttError as e:
+                # replayed on the next reconnect
+                _LOGGER.warning("MQTT subscribe failed: %s", e)
+        elif not self._loop_task or self._loop_task.done():
+            await self.connect()
+
+    async def _subscribe_batches(self, client, topics):
+        # all batches are in flight at once: one round trip for the whole fleet
+        await asyncio.gather(*(
+            client.subscribe([(topic, 0) for topic in topics[i:i + SUBSCRIBE_BATCH_SIZE]])
+            for i in range(0, len(topics), SUBSCRIBE_BATCH_SIZE)
+        ))
+
+    async def unsubscribe(self, topic):
+        if self._subscriptions.pop(topic, False) is None and self.client:
+            try:
+                await self.client.unsubscribe(topic)
+            except MqttError as e:
+                _LOGGER.warning("MQTT unsubscribe from %s failed: %s", topic, e)
+
+    async def publish(self, topic, payload, priority=PRIORITY_EFFECT):
+        """Publish now, or queue while disconnected; returns True if the message went out."""
+        if self.client:
+            payload, priority = self._fold_queued(topic, payload, priority)
+            await self.limiter.acquire(priority, _topic_key(topic), topic)
+        # the connection may have dropped while waiting for budget
+        if self.client:
+            await self.client.publish(topic, payload)
+            self.published += 1
+            return True
+        self.offline.put(topic, payload, priority)
+        if not self._loop_task or self._loop_task.done():
+            await self.connect()
+        return False
+
+    async def publish_many(self, messages, priority=PRIORITY_EFFECT):
+        """Publish (topic, payload) pairs in one pipelined burst.
+
+        All publishes are issued together instead of awaiting each in turn;
+        they still pass the rate limiter, whose burst covers typical groups.
+        Returns the perf_counter time each message went out, None for a
+        message that failed or was queued while disconnected.
+        """
+        client = self.client
+        if client is None:
+            for topic, payload in messages:
+                await self.publish(topic, payload, priority)
+            return [None] * len(messages)
+
+        async def send(topic, payload):
+            # the group keeps one lane so its messages go out together
+            payload, _ = self._fold_queued(topic, payload, priority)
+            await self.limiter.acquire(priority, _topic_key(topic), topic)
+            await client.publish(topic, payload)
+            self.published += 1
+            return time.perf_counter()
+
+        results = await asyncio.gather(*(send(t, p) for t, p in messages), return_exceptions=True)
+        sent = []
+        for (topic, _), result in zip(messages, results):
+            if isinstance(result, BaseException):
+                _LOGGER.error("MQTT publish to %s failed: %s", topic, result)
+                result = None
+            sent.append(result)
+        return sent
+
+    def set_message_callback(self, callback):
+        self._message_callback = callback
+
+    def set_reconnect_callback(self, callback):
+        """Coroutine function run (as a task) after every successful reconnect."""
+        self._reconnect_callback = callback
+
+    async def disconnect(self):
+        self.limiter.cancel()
+        await self._cancel_flush()
+        for task in (self._reconnect_task, self._loop_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
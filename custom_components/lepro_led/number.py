@@ -39,12 +39,9 @@ class LeproSpeedNumber(NumberEntity):
         new_speed = max(0, min(100, int(round(value))))
         self._light._speed = new_speed
 
+        # slider drags are merged into one publish by the light's coalescer
         try:
-            if getattr(self._light, "_effect", None) in getattr(self._light, "SPECIAL_EFFECTS", []):
-                await self._light._send_special_effect_command(self._light._effect)
-            else:
-                await self._light._send_effect_command()
-                
+            self._light._schedule_state_command()
         except Exception as e:
             _LOGGER.error("Error applying speed change for %s: %s", self._light.name, e)
 
@@ -79,11 +76,7 @@ class LeproSensitivityNumber(NumberEntity):
         new_sens = max(0, min(100, int(round(value))))
         self._light._sensitivity = new_sens
         try:
-            if getattr(self._light, "_effect", None) in getattr(self._light, "SPECIAL_EFFECTS", []):
-                await self._light._send_special_effect_command(self._light._effect)
-            else:
-                await self._light._send_effect_command()
-                
+            self._light._schedule_state_command()
         except Exception as e:
             _LOGGER.error("Error applying sensitivity change for %s: %s", self._light.name, e)
 
@@ -113,27 +106,28 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_e
         _LOGGER.warning("Lepro LED: no lights found for entry %s — no number entities created", entry.entry_id)
         return
 
-    numbers = []
-    for light in lights:
-        
-        if not hasattr(light, "_did"):
-            _LOGGER.debug("Skipping number for segment or non-parent entity: %s", getattr(light, "name", "unknown"))
-            continue
+    def add_numbers(lights):
+        """Create, register and add the numbers for the given lights."""
+        numbers = []
+        for light in lights:
             
-        try:
-            numbers.append(LeproSpeedNumber(light))
-            numbers.append(LeproSensitivityNumber(light))
-        except Exception as e:
-            _LOGGER.error("Failed to create speed number for %s: %s", getattr(light, "name", "unknown"), e)
-
-    if numbers:
-        # NEW: register numbers so light.py can refresh their state on MQTT updates
-        store = hass.data.setdefault(DOMAIN, {}).setdefault(entry.entry_id, {})
-        numbers_map = store.setdefault("numbers", {})  # { did: [NumberEntity, ...] }
-
-        for num in numbers:
-            did = getattr(num._light, "_did", None)
-            if did:
-                numbers_map.setdefault(did, []).append(num)
-
-        async_add_entities(numbers)
+            if not hasattr(light, "_did"):
+                _LOGGER.debug("Skipping number for segment or non-parent entity: %s", getattr(light, "name", "unknown"))
+                continue
+                
+            try:
+                numbers.append(LeproSpeedNumber(light))
+                numbers.append(LeproSensitivityNumber(light))
+            except Exception as e:
+                _LOGGER.error("Failed to create speed number for %s: %s", getattr(light, "name", "unknown"), e)
+
+        if numbers:
+            # register numbers on their light so it can refresh them when speed/sensitivity change
+            for num in numbers:
+                num._light._numbers[num._attr_translation_key] = num
+
+            async_add_entities(numbers)
+
+    add_numbers(lights)
+    # devices added later by the background sync get their numbers through this
+    data["add_numbers"] = add_numbers
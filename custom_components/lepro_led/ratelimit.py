@@ -0,0 +1,182 @@
+"""Outbound publish rate limiting: token buckets per connection and per device, with priority lanes."""
+
+from __future__ import annotations
+import asyncio
+from collections import deque
+
+from .metrics import Histogram
+
+# Lanes, served in this order
+PRIORITY_INTERACTIVE = 0  # on/off and brightness
+PRIORITY_EFFECT = 1  # colours, segments, effects
+PRIORITY_BACKGROUND = 2  # prp/get state refreshes
+PRIORITY_NAMES = ("interactive", "effect", "background")
+
+# Publishes per second (sustained) and burst size for the whole connection ...
+CONNECTION_RATE = 20
+CONNECTION_BURST = 40
+# ... and for a single device
+DEVICE_RATE = 10
+DEVICE_BURST = 10
+
+# Queue wait buckets (ms); the first one counts publishes that didn't wait
+WAIT_BUCKETS_MS = (0, 10, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class TokenBucket:
+    """Classic token bucket; time is supplied by the caller (loop time)."""
+
+    __slots__ = ("rate", "capacity", "tokens", "stamp")
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.stamp = now
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def ready(self, now):
+        self._refill(now)
+        return self.tokens >= 1
+
+    def take(self):
+        """Consume a token; only valid right after ready() returned True."""
+        self.tokens -= 1
+
+    def delay(self, now):
+        """Seconds until a token is available."""
+        self._refill(now)
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class PublishLimiter:
+    """Admit publishes within the connection and device budgets, higher lanes first.
+
+    acquire() returns immediately while nobody is queued and both budgets have
+    a token; otherwise the caller waits in its lane. Within a lane, a device
+    that is out of budget doesn't hold up the other devices behind it.
+    Publishes to one topic still go out in order: a waiting one is moved up
+    to the lane of a later publish to its topic rather than overtaken by it.
+    """
+
+    def __init__(
+        self,
+        rate=CONNECTION_RATE,
+        burst=CONNECTION_BURST,
+        device_rate=DEVICE_RATE,
+        device_burst=DEVICE_BURST,
+    ):
+        self._loop = asyncio.get_running_loop()
+        self._bucket = TokenBucket(rate, burst, self._loop.time())
+        self._device_rate = device_rate
+        self._device_burst = device_burst
+        self._devices = {}  # key -> TokenBucket
+        self._lanes = tuple(deque() for _ in PRIORITY_NAMES)  # (key, topic, future, enqueued at)
+        self._timer = None
+        self.admitted = [0] * len(PRIORITY_NAMES)
+        self.delayed = [0] * len(PRIORITY_NAMES)
+        self.wait_time = tuple(Histogram(WAIT_BUCKETS_MS) for _ in PRIORITY_NAMES)
+
+    @property
+    def queued(self):
+        return sum(len(lane) for lane in self._lanes)
+
+    def _device_bucket(self, key, now):
+        bucket = self._devices.get(key)
+        if bucket is None:
+            bucket = self._devices[key] = TokenBucket(self._device_rate, self._device_burst, now)
+        return bucket
+
+    async def acquire(self, priority=PRIORITY_EFFECT, key=None, topic=None):
+        """Wait until a publish for device key (to topic) may go out."""
+        now = self._loop.time()
+        device = self._device_bucket(key, now)
+        if not self.queued and self._bucket.ready(now) and device.ready(now):
+            self._bucket.take()
+            device.take()
+            self.admitted[priority] += 1
+            self.wait_time[priority].record(0)
+            return
+
+        future = self._loop.create_future()
+        if topic is not None:
+            self._promote(topic, priority)
+        self._lanes[priority].append((key, topic, future, now))
+        self.delayed[priority] += 1
+        self._dispatch()
+        await future
+
+    def _promote(self, topic, priority):
+        """Move the publishes to topic waiting in lower lanes up to priority, oldest first."""
+        earlier = []
+        for lane in self._lanes[priority + 1:]:
+            for entry in [e for e in lane if e[1] == topic]:
+                lane.remove(entry)
+                earlier.append(entry)
+        earlier.sort(key=lambda entry: entry[3])
+        self._lanes[priority].extend(earlier)
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        now = self._loop.time()
+        retry_in = None
+        for priority, lane in enumerate(self._lanes):
+            for entry in list(lane):
+                key, _, future, enqueued = entry
+                if future.done():
+                    # waiter cancelled
+                    lane.remove(entry)
+                    continue
+                if not self._bucket.ready(now):
+                    self._schedule(self._bucket.delay(now))
+                    return
+                device = self._device_bucket(key, now)
+                if not device.ready(now):
+                    delay = device.delay(now)
+                    retry_in = delay if retry_in is None else min(retry_in, delay)
+                    continue
+                self._bucket.take()
+                device.take()
+                lane.remove(entry)
+                self.admitted[priority] += 1
+                self.wait_time[priority].record((now - enqueued) * 1000)
+                future.set_result(None)
+        if retry_in is not None:
+            self._schedule(retry_in)
+
+    def _schedule(self, delay):
+        when = self._loop.time() + delay
+        if self._timer is not None:
+            if self._timer.when() <= when:
+                return
+            self._timer.cancel()
+        self._timer = self._loop.call_at(when, self._dispatch)
+
+    def cancel(self):
+        """Fail every queued publish (connection shut down)."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        for lane in self._lanes:
+            while lane:
+                future = lane.popleft()[2]
+                future.cancel()
+
+    def as_dict(self):
+        return {
+            "queued": self.queued,
+            "lanes": {
+                name: {
+                    "admitted": self.admitted[i],
+                    "delayed": self.delayed[i],
+                    "queued": len(self._lanes[i]),
+                    "wait_ms": self.wait_time[i].as_dict(),
+                }
+                for i, name in enumerate(PRIORITY_NAMES)
+            },
+        }
@@ -0,0 +1,150 @@
+"""Periodic prp/get reconciliation: staggered, adaptive per device, capped per minute."""
+
+from __future__ import annotations
+import asyncio
+import logging
+import random
+
+from .ratelimit import TokenBucket
+
+_LOGGER = logging.getLogger(__name__)
+
+# How often due devices are looked for (s)
+TICK_INTERVAL = 5
+# Startup / reconnect polls are spread over at least this window (s)
+SPREAD_WINDOW = 30
+# Poll interval of a device that answers but is otherwise quiet (s) ...
+QUIET_INTERVAL = 600
+# ... doubled after every poll of a device that also sent rpt traffic, up to
+LIVE_INTERVAL = 3600
+# First retry (s) after an unanswered poll, doubled per miss up to QUIET_INTERVAL
+STALE_INTERVAL = 60
+# Random +/- fraction applied to every interval, so devices don't line up again
+JITTER = 0.2
+# Cap on prp/get requests for the whole entry
+MAX_POLLS_PER_MINUTE = 60
+POLL_BURST = 5
+
+
+class _Device:
+    __slots__ = ("entity", "interval", "next_due", "pending", "misses", "reports", "polls")
+
+    def __init__(self, entity, next_due):
+        self.entity = entity
+        self.interval = QUIET_INTERVAL
+        self.next_due = next_due
+        self.pending = False  # polled, getr not seen yet
+        self.misses = 0  # polls in a row without an answer
+        self.reports = 0  # rpt messages since the last answered poll
+        self.polls = 0
+
+
+def _jitter(delay):
+    return delay * random.uniform(1 - JITTER, 1 + JITTER)
+
+
+class StateReconciler:
+    """Poll every device's state now and then, so a missed report doesn't leave HA out of sync.
+
+    Polls are spread out with jitter instead of going out together. A device
+    that answers and reports by itself is polled less and less often (up to
+    LIVE_INTERVAL), a quiet one every QUIET_INTERVAL, and one that doesn't
+    answer is retried after STALE_INTERVAL, backing off while it stays
+    silent. A token bucket caps the total; devices over budget wait for the
+    next tick.
+    """
+
+    def __init__(self, rate=MAX_POLLS_PER_MINUTE, burst=POLL_BURST):
+        self._loop = asyncio.get_running_loop()
+        self._devices = {}  # did -> _Device
+        self._bucket = TokenBucket(rate / 60, burst, self._loop.time())
+        self._running = False
+        self.polls = 0
+        # due devices left for a later tick by the cap (counted per tick)
+        self.deferred = 0
+
+    def add_device(self, did, entity, window=SPREAD_WINDOW):
+        self._devices[did] = _Device(entity, self._loop.time() + random.uniform(0, window))
+
+    def remove_device(self, did):
+        self._devices.pop(did, None)
+
+    def spread(self, window=SPREAD_WINDOW):
+        """Make every device due once within window (startup, reconnect); widened to fit the cap."""
+        window = max(window, len(self._devices) / self._bucket.rate)
+        now = self._loop.time()
+        for device in self._devices.values():
+            device.next_due = now + random.uniform(0, window)
+            # unanswered polls from before a disconnect say nothing about the device
+            device.pending = False
+
+    async def async_reschedule_all(self):
+        self.spread()
+
+    def on_message(self, did, message_type):
+        """Account for a state message from did (called by the router)."""
+        device = self._devices.get(did)
+        if device is None:
+            return
+        now = self._loop.time()
+        # any traffic means the device is reachable
+        device.misses = 0
+        if message_type == "getr" and device.pending:
+            device.pending = False
+            if device.reports:
+                device.interval = min(device.interval * 2, LIVE_INTERVAL)
+            else:
+                device.interval = QUIET_INTERVAL
+            device.reports = 0
+            device.next_due = now + _jitter(device.interval)
+        elif message_type == "rpt":
+            device.reports += 1
+
+    async def async_tick(self, now=None):
+        """Poll the devices that are due, oldest first, within the budget."""
+        if self._running:
+            return
+        self._running = True
+        try:
+            now = self._loop.time()
+            due = sorted(
+                (device for device in self._devices.values() if device.next_due <= now),
+                key=lambda device: device.next_due,
+            )
+            polled = []
+            for device in due:
+                if not self._bucket.ready(now):
+                    self.deferred += len(due) - len(polled)
+                    break
+                self._bucket.take()
+                self._mark_polled(device, now)
+                polled.append(device)
+            if polled:
+                _LOGGER.debug("Lepro reconcile: polling %d of %d due devices", len(polled), len(due))
+            await asyncio.gather(*(device.entity._request_state_update() for device in polled))
+        finally:
+            self._running = False
+
+    def _mark_polled(self, device, now):
+        if device.pending:
+            device.misses += 1
+        device.pending = True
+        device.polls += 1
+        self.polls += 1
+        # retry if no getr arrives; an answer reschedules with the regular interval
+        backoff = STALE_INTERVAL * 2 ** min(device.misses, 8)
+        device.next_due = now + _jitter(min(backoff, QUIET_INTERVAL))
+
+    def as_dict(self):
+        now = self._loop.time()
+        devices = self._devices.values()
+        return {
+            "devices": len(self._devices),
+            "polls": self.polls,
+            "deferred": self.deferred,
+            "max_per_minute": round(self._bucket.rate * 60),
+            "awaiting_answer": sum(1 for d in devices if d.pending),
+            "stale": sum(1 for d in devices if d.misses),
+            "live": sum(1 for d in devices if not d.misses and d.interval > QUIET_INTERVAL),
+            "next_poll_in": round(min((d.next_due for d in devices), default=now) - now, 1),
+        }
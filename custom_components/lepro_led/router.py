@@ -0,0 +1,124 @@
+"""Inbound MQTT decoding: prebuilt topic dispatch table and per-dp handlers."""
+
+from __future__ import annotations
+import logging
+import time
+
+from homeassistant.util.json import json_loads
+
+from .metrics import PipelineMetrics
+
+_LOGGER = logging.getLogger(__name__)
+
+# Message types carrying device state
+STATE_MESSAGE_TYPES = ("rpt", "set", "getr")
+
+# dps driven by a running transition/animation: their echoes are frames, not state
+STREAM_KEYS = frozenset(("d1", "d2", "d50", "d52"))
+
+
+def _apply_d1(entity, value):
+    entity._is_on = bool(value)
+
+
+def _apply_d2(entity, value):
+    entity._mode = value
+
+
+def _apply_d52(entity, value):
+    entity._brightness = entity._map_device_brightness(value)
+    entity._attr_brightness = entity._brightness
+
+
+def _apply_d50(entity, value):
+    entity._parse_d50(value)
+
+
+def _apply_d60(entity, value):
+    sens, parsed_effect = entity._parse_d60(value)
+    entity._sensitivity = sens
+    # If parser recognizes a special effect code, set it
+    if parsed_effect:
+        entity._effect = parsed_effect
+
+
+# Applied in this order: d60 must come after d50 so a special effect wins
+DP_HANDLERS = (
+    ("d1", _apply_d1),
+    ("d2", _apply_d2),
+    ("d52", _apply_d52),
+    ("d50", _apply_d50),
+    ("d60", _apply_d60),
+)
+
+
+class MessageRouter:
+    """Route le/{did}/prp/{rpt,set,getr} messages straight to their entity.
+
+    Topics are resolved with a single dict lookup on the full topic string;
+    anything not in the table (other devices, act/app/exe, ...) is dropped
+    before the payload is parsed.
+    """
+
+    def __init__(self, ack_tracker=None, metrics=None, reconciler=None):
+        self._routes = {}  # topic -> (did, entity, message_type)
+        self._ack_tracker = ack_tracker
+        self._reconciler = reconciler
+        self._metrics = metrics if metrics is not None else PipelineMetrics()
+
+    def add_device(self, did, entity):
+        for message_type in STATE_MESSAGE_TYPES:
+            self._routes[f"le/{did}/prp/{message_type}"] = (did, entity, message_type)
+
+    def remove_device(self, did):
+        for message_type in STATE_MESSAGE_TYPES:
+            self._routes.pop(f"le/{did}/prp/{message_type}", None)
+
+    async def async_handle_message(self, message):
+        metrics = self._metrics
+        start = time.perf_counter()
+        try:
+            route = self._routes.get(message.topic.value)
+            if route is None:
+                metrics.messages["other"] += 1
+                return
+            did, entity, message_type = route
+            metrics.messages[message_type] += 1
+
+            payload = json_loads(message.payload)
+            debug = _LOGGER.isEnabledFor(logging.DEBUG)
+            if debug:
+                _LOGGER.debug("Received MQTT message: %s - %s", message.topic.value, payload)
+
+            if self._ack_tracker:
+                self._ack_tracker.on_message(did, message_type, payload)
+            if self._reconciler:
+                self._reconciler.on_message(did, message_type)
+
+            data = payload.get("d")
+            if not data:
+                return
+            old_state = entity._state_snapshot()
+            streaming = entity._streaming
+            for key, handler in DP_HANDLERS:
+                if key in data and not (streaming and key in STREAM_KEYS):
+                    handler(entity, data[key])
+
+            # Update effect based on mode (mode==3 indicates special effects)
+            if entity._mode == 3 and entity._effect not in entity.SPECIAL_EFFECTS:
+                # If we have no parsed effect but mode says special, default to flash
+                entity._effect = entity.EFFECT_FLASH
+
+            # only entities whose value changed are written
+            entity._write_changed_states(old_state)
+
+            if debug:
+                _LOGGER.debug(
+                    "Updated state for %s from %s: on=%s, mode=%s, effect=%s, brightness=%s, speed=%s, rgb=%s, sensitivity=%s",
+                    entity.name, message_type, entity._is_on, entity._mode, entity._effect,
+                    entity._brightness, entity._speed, entity._attr_rgb_color, entity._sensitivity,
+                )
+        except Exception as e:
+            _LOGGER.error("Error processing MQTT message: %s", e)
+        finally:
+            metrics.handler_time.record((time.perf_counter() - start) * 1000)
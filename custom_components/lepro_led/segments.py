@@ -0,0 +1,90 @@
+"""Packed per-device segment colour buffer."""
+
+from __future__ import annotations
+from itertools import groupby
+
+from .codec import DEFAULT_COLOR, SEGMENT_COUNT
+
+# Segmented series (matched as a substring of the device series) -> segment count.
+# They get one light entity per segment; other devices keep a single buffer
+# sized from their first d50 report.
+SERIES_SEGMENTS = {
+    "S1-5": 25,
+}
+
+
+def series_segment_count(series):
+    """Segment count of a segmented series, or None."""
+    for key, count in SERIES_SEGMENTS.items():
+        if key in (series or ""):
+            return count
+    return None
+
+
+class SegmentBuffer:
+    """Colours of a strip's segments as packed RGB bytes (3 per segment), updated in place.
+
+    Indexing returns / accepts (r, g, b) tuples. The codec works on the raw
+    bytes through snapshot(), an immutable copy (hashable, for the encode
+    cache and change detection).
+    """
+
+    __slots__ = ("data",)
+
+    def __init__(self, count=SEGMENT_COUNT, color=DEFAULT_COLOR):
+        self.data = bytearray(bytes(color) * count)
+
+    def __len__(self):
+        return len(self.data) // 3
+
+    def _offset(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("segment index out of range")
+        return 3 * index
+
+    def __getitem__(self, index):
+        i = self._offset(index)
+        return tuple(self.data[i:i + 3])
+
+    def __setitem__(self, index, color):
+        i = self._offset(index)
+        self.data[i:i + 3] = bytes(map(int, color))
+
+    def __iter__(self):
+        data = self.data
+        for i in range(0, len(data), 3):
+            yield tuple(data[i:i + 3])
+
+    def fill(self, color):
+        self.data[:] = bytes(map(int, color)) * len(self)
+
+    def paint(self, colors):
+        """Apply colors from the first segment on, repeating a shorter list along the strip."""
+        pattern = b"".join(bytes(map(int, color)) for color in colors)
+        count = len(self.data)
+        self.data[:] = (pattern * (count // len(pattern) + 1))[:count]
+
+    def load(self, raw, resize=False):
+        """Copy packed RGB bytes in; pad with the last colour / truncate unless resize."""
+        if (resize and raw) or len(raw) == len(self.data):
+            self.data[:] = raw
+            return
+        if len(raw) > len(self.data):
+            self.data[:] = raw[:len(self.data)]
+            return
+        last = bytes(raw[-3:]) if raw else bytes(DEFAULT_COLOR)
+        self.data[:] = bytes(raw) + last * ((len(self.data) - len(raw)) // 3)
+
+    def compact(self):
+        """Run-length hex form for a state attribute, e.g. "FF0000x10,00FF00x15"."""
+        data = iter(self.data)
+        runs = []
+        for color, run in groupby(zip(data, data, data)):
+            length = len(list(run))
+            runs.append(bytes(color).hex().upper() + (f"x{length}" if length > 1 else ""))
+        return ",".join(runs)
+
+    def snapshot(self):
+        return bytes(self.data)
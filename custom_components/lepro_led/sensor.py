@@ -0,0 +1,104 @@
+"""Diagnostic sensors exposing the runtime metrics of the Lepro MQTT pipeline."""
+
+from __future__ import annotations
+import asyncio
+import logging
+import time
+from datetime import timedelta
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.components.sensor import SensorEntity, SensorStateClass
+from homeassistant.const import EntityCategory, UnitOfInformation, UnitOfTime
+from homeassistant.helpers.device_registry import DeviceEntryType
+from homeassistant.helpers.entity_platform import AddEntitiesCallback
+from homeassistant.helpers.event import async_track_time_interval
+
+from .const import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+# How often the counters are sampled into rates and the sensors refreshed
+METRICS_INTERVAL = timedelta(seconds=30)
+
+RATE = "1/s"
+
+# key in PipelineMetrics.values -> (unit, state class)
+METRIC_SENSORS = {
+    "messages_rpt_rate": (RATE, SensorStateClass.MEASUREMENT),
+    "messages_set_rate": (RATE, SensorStateClass.MEASUREMENT),
+    "messages_getr_rate": (RATE, SensorStateClass.MEASUREMENT),
+    "messages_other_rate": (RATE, SensorStateClass.MEASUREMENT),
+    "state_writes_rate": (RATE, SensorStateClass.MEASUREMENT),
+    "publishes": (None, SensorStateClass.TOTAL_INCREASING),
+    "pending_messages": (None, SensorStateClass.MEASUREMENT),
+    "offline_dropped": (None, SensorStateClass.TOTAL_INCREASING),
+    "reconnects": (None, SensorStateClass.TOTAL_INCREASING),
+    "publish_queue": (None, SensorStateClass.MEASUREMENT),
+    "interactive_wait_p95": (UnitOfTime.MILLISECONDS, SensorStateClass.MEASUREMENT),
+    "handler_p50": (UnitOfTime.MILLISECONDS, SensorStateClass.MEASUREMENT),
+    "handler_p95": (UnitOfTime.MILLISECONDS, SensorStateClass.MEASUREMENT),
+    "d50_parse_p95": (UnitOfTime.MILLISECONDS, SensorStateClass.MEASUREMENT),
+    "d50_encode_p95": (UnitOfTime.MILLISECONDS, SensorStateClass.MEASUREMENT),
+    "d50_size_p95": (UnitOfInformation.BYTES, SensorStateClass.MEASUREMENT),
+}
+
+
+class LeproMetricSensor(SensorEntity):
+    """One value of the entry's PipelineMetrics; pushed by the sampling timer."""
+
+    def __init__(self, entry_id, metrics, key, unit, state_class):
+        self._metrics = metrics
+        self._key = key
+        self._attr_has_entity_name = True
+        self._attr_translation_key = key
+        self._attr_unique_id = f"{entry_id}_{key}"
+        self._attr_entity_category = EntityCategory.DIAGNOSTIC
+        self._attr_should_poll = False
+        self._attr_native_unit_of_measurement = unit
+        self._attr_state_class = state_class
+        # all metrics hang off one service device per entry
+        self._attr_device_info = {
+            "identifiers": {(DOMAIN, entry_id)},
+            "name": "Lepro cloud",
+            "manufacturer": "Lepro",
+            "entry_type": DeviceEntryType.SERVICE,
+        }
+
+    @property
+    def native_value(self):
+        return self._metrics.values.get(self._key)
+
+
+async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_entities: AddEntitiesCallback):
+    """Set up the pipeline metric sensors."""
+    # Wait a short while for light platform to populate hass.data, but keep attempts limited.
+    attempts = 6
+    for attempt in range(attempts):
+        data = hass.data.get(DOMAIN, {}).get(entry.entry_id)
+        if data and "metrics" in data:
+            break
+        await asyncio.sleep(0.5)
+
+    data = hass.data.get(DOMAIN, {}).get(entry.entry_id)
+    if not data or "metrics" not in data:
+        _LOGGER.error("Lepro LED: no metrics available in hass.data for entry %s — sensor platform setup aborted", entry.entry_id)
+        return
+
+    metrics = data["metrics"]
+    mqtt_client = data["mqtt_client"]
+    sensors = [
+        LeproMetricSensor(entry.entry_id, metrics, key, unit, state_class)
+        for key, (unit, state_class) in METRIC_SENSORS.items()
+    ]
+    # first sample sets the baseline for the rates
+    metrics.sample(time.monotonic(), mqtt_client)
+    async_add_entities(sensors)
+
+    @callback
+    def sample(now=None):
+        metrics.sample(time.monotonic(), mqtt_client)
+        for sensor in sensors:
+            if sensor.hass is not None:
+                sensor.async_write_ha_state()
+
+    entry.async_on_unload(async_track_time_interval(hass, sample, METRICS_INTERVAL))
@@ -0,0 +1,203 @@
+"""Integration-wide services for Lepro LED."""
+
+from __future__ import annotations
+import asyncio
+import logging
+import time
+import voluptuous as vol
+from homeassistant.core import HomeAssistant, ServiceCall, ServiceResponse, SupportsResponse, callback
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers import config_validation as cv
+from homeassistant.helpers.service import async_extract_entity_ids
+
+from .animation import PATTERNS
+from .const import DOMAIN, DEFAULT_TRANSITION_FPS
+from .ratelimit import PRIORITY_EFFECT, PRIORITY_INTERACTIVE
+
+_LOGGER = logging.getLogger(__name__)
+
+SERVICE_SET_SEGMENTS = "set_segments"
+SERVICE_GROUP_TURN_ON = "group_turn_on"
+SERVICE_PLAY_ANIMATION = "play_animation"
+SERVICE_EXPOSE_SEGMENTS = "expose_segments"
+
+ATTR_RGB_COLOR = "rgb_color"
+ATTR_COLORS = "colors"
+ATTR_SEGMENTS = "segments"
+ATTR_BRIGHTNESS = "brightness"
+ATTR_EFFECT = "effect"
+ATTR_SPEED = "speed"
+ATTR_PATTERN = "pattern"
+ATTR_FPS = "fps"
+ATTR_PERIOD = "period"
+
+RGB_COLOR = vol.All(vol.ExactSequence((cv.byte, cv.byte, cv.byte)), vol.Coerce(tuple))
+
+SET_SEGMENTS_SCHEMA = cv.make_entity_service_schema({
+    vol.Optional(ATTR_COLORS): vol.All(cv.ensure_list, vol.Length(min=1), [RGB_COLOR]),
+    vol.Optional(ATTR_SEGMENTS): vol.Schema({vol.Coerce(int): RGB_COLOR}),
+    vol.Optional(ATTR_BRIGHTNESS): vol.All(vol.Coerce(int), vol.Range(min=0, max=255)),
+    vol.Optional(ATTR_EFFECT): cv.string,
+    vol.Optional(ATTR_SPEED): vol.All(vol.Coerce(int), vol.Range(min=0, max=100)),
+})
+
+PLAY_ANIMATION_SCHEMA = cv.make_entity_service_schema({
+    vol.Required(ATTR_PATTERN): vol.In(PATTERNS),
+    vol.Optional(ATTR_FPS, default=DEFAULT_TRANSITION_FPS): vol.All(vol.Coerce(int), vol.Range(min=1, max=10)),
+    vol.Optional(ATTR_PERIOD, default=4): vol.All(vol.Coerce(float), vol.Range(min=0.5, max=60)),
+    vol.Optional(ATTR_COLORS): vol.All(cv.ensure_list, vol.Length(min=1, max=2), [RGB_COLOR]),
+})
+
+EXPOSE_SEGMENTS_SCHEMA = cv.make_entity_service_schema({
+    vol.Required(ATTR_SEGMENTS): vol.All(cv.ensure_list, vol.Length(min=1), [vol.Coerce(int)]),
+})
+
+GROUP_TURN_ON_SCHEMA = cv.make_entity_service_schema({
+    vol.Optional(ATTR_RGB_COLOR): RGB_COLOR,
+    vol.Optional(ATTR_BRIGHTNESS): vol.All(vol.Coerce(int), vol.Range(min=0, max=255)),
+    vol.Optional(ATTR_EFFECT): cv.string,
+    vol.Optional(ATTR_SPEED): vol.All(vol.Coerce(int), vol.Range(min=0, max=100)),
+})
+
+
+async def async_get_target_lights(hass: HomeAssistant, call: ServiceCall) -> list:
+    """Resolve the call target to parent Lepro lights, one per device."""
+    entity_ids = await async_extract_entity_ids(hass, call)
+    lights = {}
+    for data in hass.data.get(DOMAIN, {}).values():
+        if not isinstance(data, dict):
+            continue
+        for entity in data.get("entities", []):
+            if entity.entity_id not in entity_ids:
+                continue
+            # a targeted segment paints its parent strip
+            light = getattr(entity, "_parent", entity)
+            lights.setdefault(light._did, light)
+    return list(lights.values())
+
+
+async def async_publish_synchronized(lights: list, params: dict) -> dict:
+    """Apply params to every light, then publish all their commands in one burst.
+
+    Every payload is encoded before the first one is sent, and the messages of
+    each MQTT client go out pipelined, so the strips change together. Returns
+    the spread between the first and the last publish.
+    """
+    # validate everything first: a bad argument must not leave half the group applied
+    for light in lights:
+        light._validate_segments(params.get(ATTR_SEGMENTS), params.get(ATTR_EFFECT))
+
+    prepared = []
+    for light in lights:
+        old_state = light._apply_segments(**params)
+        prepared.append((light, old_state, light._prepare_state_command()))
+
+    by_client = {}
+    for item in prepared:
+        if item[2] is not None:
+            by_client.setdefault(item[0]._mqtt_client, []).append(item)
+
+    # on/brightness only changes take the interactive lane
+    if any(key in params for key in (ATTR_COLORS, ATTR_SEGMENTS, ATTR_EFFECT, ATTR_SPEED)):
+        priority = PRIORITY_EFFECT
+    else:
+        priority = PRIORITY_INTERACTIVE
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(
+        client.publish_many([(command[0], command[1]) for _, _, command in items], priority)
+        for client, items in by_client.items()
+    ))
+
+    sent_times = []
+    for items, sent in zip(by_client.values(), results):
+        for (light, _, command), sent_at in zip(items, sent):
+            light._track_command(command, sent_at is not None, priority)
+            if sent_at is not None:
+                sent_times.append(sent_at)
+    for light, old_state, _ in prepared:
+        light._write_changed_states(old_state)
+
+    result = {
+        "devices": len(lights),
+        "published": len(sent_times),
+        "spread_ms": round((max(sent_times) - min(sent_times)) * 1000, 3) if sent_times else None,
+        "duration_ms": round((max(sent_times) - start) * 1000, 3) if sent_times else None,
+    }
+    _LOGGER.debug("Lepro group publish: %s", result)
+    for metrics in {id(light._metrics): light._metrics for light in lights if light._metrics}.values():
+        metrics.last_group_publish = result
+    return result
+
+
+@callback
+def async_setup_services(hass: HomeAssistant) -> None:
+    """Register the Lepro LED services."""
+
+    async def async_set_segments(call: ServiceCall) -> ServiceResponse:
+        lights = await async_get_target_lights(hass, call)
+        if not lights:
+            _LOGGER.warning("set_segments: no Lepro lights matched the target")
+            return None
+        params = {
+            key: call.data[key]
+            for key in (ATTR_COLORS, ATTR_SEGMENTS, ATTR_BRIGHTNESS, ATTR_EFFECT, ATTR_SPEED)
+            if key in call.data
+        }
+        return await async_publish_synchronized(lights, params)
+
+    async def async_group_turn_on(call: ServiceCall) -> ServiceResponse:
+        lights = await async_get_target_lights(hass, call)
+        if not lights:
+            _LOGGER.warning("group_turn_on: no Lepro lights matched the target")
+            return None
+        params = {
+            key: call.data[key]
+            for key in (ATTR_BRIGHTNESS, ATTR_EFFECT, ATTR_SPEED)
+            if key in call.data
+        }
+        if ATTR_RGB_COLOR in call.data:
+            # one colour paints the whole strip, like light.turn_on
+            params[ATTR_COLORS] = [call.data[ATTR_RGB_COLOR]]
+        return await async_publish_synchronized(lights, params)
+
+    async def async_play_animation(call: ServiceCall) -> None:
+        lights = await async_get_target_lights(hass, call)
+        if not lights:
+            _LOGGER.warning("play_animation: no Lepro lights matched the target")
+            return
+        await asyncio.gather(*(
+            light.async_play_animation(
+                call.data[ATTR_PATTERN], call.data[ATTR_FPS], call.data[ATTR_PERIOD], call.data.get(ATTR_COLORS)
+            )
+            for light in lights
+        ))
+
+    async def async_expose_segments(call: ServiceCall) -> ServiceResponse:
+        lights = await async_get_target_lights(hass, call)
+        indices = call.data[ATTR_SEGMENTS]
+        for light in lights:
+            if not light._segmented:
+                raise HomeAssistantError(f"{light.name} has no segments")
+            light._validate_segments(indices)
+        created = 0
+        for light in lights:
+            expose = hass.data[DOMAIN][light._entry_id]["expose_segments"]
+            created += expose(light, [index - 1 for index in indices])
+        return {"created": created}
+
+    hass.services.async_register(
+        DOMAIN, SERVICE_EXPOSE_SEGMENTS, async_expose_segments,
+        schema=EXPOSE_SEGMENTS_SCHEMA, supports_response=SupportsResponse.OPTIONAL,
+    )
+    hass.services.async_register(
+        DOMAIN, SERVICE_PLAY_ANIMATION, async_play_animation, schema=PLAY_ANIMATION_SCHEMA
+    )
+    hass.services.async_register(
+        DOMAIN, SERVICE_SET_SEGMENTS, async_set_segments,
+        schema=SET_SEGMENTS_SCHEMA, supports_response=SupportsResponse.OPTIONAL,
+    )
+    hass.services.async_register(
+        DOMAIN, SERVICE_GROUP_TURN_ON, async_group_turn_on,
+        schema=GROUP_TURN_ON_SCHEMA, supports_response=SupportsResponse.OPTIONAL,
+    )
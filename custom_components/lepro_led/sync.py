@@ -0,0 +1,199 @@
+"""Background device-list sync: add, rename and remove devices without reloading the entry."""
+
+from __future__ import annotations
+import logging
+import time
+
+from homeassistant.helpers import device_registry as dr
+
+from .api import async_get_all_devices
+from .const import DOMAIN
+from .mqtt import WILDCARD_TOPIC, device_topic
+
+_LOGGER = logging.getLogger(__name__)
+
+# Every Nth sync is a full listing, the only way to notice removed devices
+FULL_SYNC_EVERY = 4
+
+# A full listing that would remove more than this share of the known devices
+# (and more than one) is treated as a cloud glitch: nothing is removed
+MAX_REMOVED_SHARE = 0.5
+
+
+class DeviceSync:
+    """Keep the entry's devices in step with the cloud using the timestamp list endpoints.
+
+    Incremental runs pass the timestamp of the last successful sync to the
+    family/device list endpoints and apply the returned devices as upserts;
+    full runs list everything and also drop devices that disappeared.
+    """
+
+    def __init__(self, hass, entry, api, store, devices, create_entities, add_entities, on_change=None):
+        self._hass = hass
+        self._entry = entry
+        self._api = api
+        # hass.data store of the entry: mqtt_client, router, devices, entities, segments
+        self._store = store
+        self._create_entities = create_entities
+        self._add_entities = add_entities
+        self._on_change = on_change
+        self._devices = {str(d["did"]): d for d in devices}
+        self._fids = {d["fid"] for d in devices if d.get("fid") is not None}
+        self.last_timestamp = int(time.time())
+        self.interval = None
+        self.runs = 0
+        self.failures = 0
+        self.api_calls = 0
+        self.added = 0
+        self.removed = 0
+        self.renamed = 0
+        self.skipped_removals = 0
+        self.last_sync = None
+        self.last_error = None
+
+    async def async_sync(self, now=None):
+        """Fetch device changes since the last sync and apply them in place."""
+        self.runs += 1
+        full = self.runs % FULL_SYNC_EVERY == 0
+        started = int(time.time())
+        calls = self._api.request_count
+        try:
+            families = await self._api.async_get_families(started if full else self.last_timestamp)
+            fids = {f["fid"] for f in families if f.get("fid") is not None}
+            if not full:
+                # an unchanged family may be missing from an incremental listing
+                fids |= self._fids
+            devices = await async_get_all_devices(
+                self._api, [{"fid": fid} for fid in fids], timestamp=started if full else self.last_timestamp
+            )
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e)
+            _LOGGER.warning("Lepro device sync failed: %s", e)
+            return
+        finally:
+            self.api_calls += self._api.request_count - calls
+
+        self._fids = fids
+        self.last_timestamp = started
+        self.last_sync = started
+        self.last_error = None
+        await self.async_apply(devices, full)
+
+    async def async_apply(self, devices, full):
+        """Apply a device listing: add new devices, rename changed ones and, if full, remove missing ones."""
+        known = self._store["devices"]
+        seen = set()
+        new = []
+        changed = False
+        registry = dr.async_get(self._hass)
+
+        for device in devices:
+            did = str(device["did"])
+            seen.add(did)
+            if did not in known:
+                new.append(device)
+                continue
+            old = self._devices.get(did, {})
+            self._devices[did] = device
+            name = device.get("name")
+            if name and name != old.get("name"):
+                entry = registry.async_get_device(identifiers={(DOMAIN, did)})
+                if entry:
+                    registry.async_update_device(entry.id, name=name)
+                known[did]._attr_device_info["name"] = name
+                self.renamed += 1
+                changed = True
+
+        if new:
+            await self._async_add(new)
+            changed = True
+
+        if full:
+            missing = [did for did in known if did not in seen]
+            if missing and (not devices or (len(missing) > 1 and len(missing) > MAX_REMOVED_SHARE * len(known))):
+                # removal deletes registry entries (entity ids, areas): don't trust a gutted listing
+                self.skipped_removals += 1
+                _LOGGER.warning(
+                    "Lepro device listing is missing %d of %d devices, not removing any", len(missing), len(known)
+                )
+                missing = []
+            for did in missing:
+                await self._async_remove(did, registry)
+                changed = True
+
+        if changed and self._on_change:
+            await self._on_change(list(self._devices.values()))
+
+    async def _async_add(self, devices):
+        store = self._store
+        parents = []
+        entities = []
+        for device in devices:
+            created = self._create_entities(device)
+            parent = created[0]
+            did = parent._did
+            self._devices[did] = device
+            store["devices"][did] = parent
+            store["entities"].extend(created)
+            if parent._segments:
+                store["segments"][did] = parent._segments
+            store["router"].add_device(did, parent)
+            if "reconciler" in store:
+                store["reconciler"].add_device(did, parent)
+            parents.append(parent)
+            entities.extend(created)
+
+        self._add_entities(entities)
+        add_numbers = store.get("add_numbers")
+        if add_numbers:
+            add_numbers(parents)
+
+        mqtt_client = store["mqtt_client"]
+        if not mqtt_client.has_subscription(WILDCARD_TOPIC):
+            await mqtt_client.subscribe_many([device_topic(p._did) for p in parents])
+
+        self.added += len(parents)
+        _LOGGER.info("Lepro sync added devices: %s", ", ".join(p._did for p in parents))
+
+    async def _async_remove(self, did, registry):
+        store = self._store
+        parent = store["devices"].pop(did)
+        self._devices.pop(did, None)
+        store["router"].remove_device(did)
+        if "reconciler" in store:
+            store["reconciler"].remove_device(did)
+        store["segments"].pop(did, None)
+        parent._coalescer.cancel()
+        if parent._ack_tracker:
+            parent._ack_tracker.cancel(did)
+        await store["mqtt_client"].unsubscribe(device_topic(did))
+
+        for entity in (parent, *parent._segments, *parent._numbers.values()):
+            if entity in store["entities"]:
+                store["entities"].remove(entity)
+            await entity.async_remove()
+
+        # dropping our config entry removes the device and its entities from the registries
+        entry = registry.async_get_device(identifiers={(DOMAIN, did)})
+        if entry:
+            registry.async_update_device(entry.id, remove_config_entry_id=self._entry.entry_id)
+
+        self.removed += 1
+        _LOGGER.info("Lepro sync removed device %s", did)
+
+    def as_dict(self):
+        return {
+            "interval_seconds": self.interval,
+            "runs": self.runs,
+            "failures": self.failures,
+            "api_calls": self.api_calls,
+            "last_timestamp": self.last_timestamp,
+            "last_sync": self.last_sync,
+            "last_error": self.last_error,
+            "added": self.added,
+            "removed": self.removed,
+            "renamed": self.renamed,
+            "skipped_removals": self.skipped_removals,
+            "devices": len(self._store["devices"]),
+        }
@@ -0,0 +1,52 @@
+"""Software transitions: interpolated brightness/colour frames streamed at a bounded rate."""
+
+from __future__ import annotations
+import asyncio
+import math
+
+
+def blend(start, end, progress):
+    """Interpolate between two (brightness, packed RGB bytes) states at progress 0..1."""
+    b0, c0 = start
+    b1, c1 = end
+    brightness = round(b0 + (b1 - b0) * progress)
+    colors = bytes(round(x + (y - x) * progress) for x, y in zip(c0, c1))
+    return brightness, colors
+
+
+class Transition:
+    """Stream frames from start to end over duration, at most max_fps of them per second.
+
+    Frames are due on a fixed grid; when sending a frame takes longer than the
+    frame interval the frames that are already late are skipped rather than
+    queued. The last step is always send_final(brightness, colors) with the
+    exact target state captured at the start.
+    Cancelling the task stops the stream without sending anything more.
+    """
+
+    def __init__(self, start, end, duration, max_fps):
+        self.start = start
+        self.end = end
+        self.duration = duration
+        self.steps = max(1, math.ceil(duration * max_fps))
+        self.frames_sent = 0
+        self.frames_dropped = 0
+
+    async def async_run(self, send_frame, send_final):
+        loop = asyncio.get_running_loop()
+        interval = self.duration / self.steps
+        begin = loop.time()
+        step = 0
+        while True:
+            step += 1
+            await asyncio.sleep(max(0.0, begin + step * interval - loop.time()))
+            # publish path fell behind: jump to the frame due now
+            due = int((loop.time() - begin) / interval)
+            if due > step:
+                self.frames_dropped += min(due, self.steps) - step
+                step = due
+            if step >= self.steps:
+                break
+            await send_frame(*blend(self.start, self.end, step / self.steps))
+            self.frames_sent += 1
+        await send_final(*self.end)
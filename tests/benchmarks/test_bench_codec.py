@@ -0,0 +1,57 @@
+"""d50/d60 codec benchmarks on 25-segment payloads."""
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from lepro_led import codec  # noqa: E402
+
+# realistic: a few colour blocks; worst case: every segment its own group
+THREE_GROUPS = bytes((255, 0, 0)) * 10 + bytes((0, 255, 0)) * 5 + bytes((0, 0, 255)) * 10
+GRADIENT = b"".join(bytes((i * 10, 128, 250 - i * 10)) for i in range(25))
+STRIPS = {"3_groups": THREE_GROUPS, "25_groups": GRADIENT}
+# smooth fades: every segment differs from its neighbour, so the exact encoding has 25 groups
+GRADIENTS = {
+    "red_blue": b"".join(bytes((255 - i * 10, 0, i * 10)) for i in range(25)),
+    "warm_fade": b"".join(bytes((255, 180 + i * 3, 100 + i * 6)) for i in range(25)),
+    "blue_cyan": b"".join(bytes((0, i * 10, 255)) for i in range(25)),
+}
+
+# the caches would turn repeated calls into dict lookups
+decode_d50 = codec.decode_d50.__wrapped__
+decode_d60 = codec.decode_d60.__wrapped__
+
+
+@pytest.mark.parametrize("strip", sorted(STRIPS))
+def test_encode_d50(benchmark, strip):
+    benchmark(codec.format_d50, STRIPS[strip], codec.EFFECT_BREATH, 40)
+
+
+@pytest.mark.parametrize("tolerance", [10, 20, 40])
+@pytest.mark.parametrize("gradient", sorted(GRADIENTS))
+def test_encode_d50_tolerance(benchmark, gradient, tolerance):
+    segments = GRADIENTS[gradient]
+    exact = codec.format_d50(segments, codec.EFFECT_SOLID, None)
+    payload = benchmark(codec.format_d50, segments, codec.EFFECT_SOLID, None, tolerance)
+    # the size win is what the extra encode time buys
+    benchmark.extra_info["exact_bytes"] = len(exact)
+    benchmark.extra_info["payload_bytes"] = len(payload)
+    assert len(payload) <= len(exact)
+    if tolerance >= 20:
+        assert len(payload) < len(exact)
+    assert payload.startswith("N01:P1000") and payload.endswith(";")
+
+
+def test_encode_d50_cached(benchmark):
+    benchmark(codec.encode_d50, GRADIENT, codec.EFFECT_BREATH, 40)
+
+
+@pytest.mark.parametrize("strip", sorted(STRIPS))
+def test_decode_d50(benchmark, strip):
+    d50 = codec.format_d50(STRIPS[strip], codec.EFFECT_BREATH, 40)
+    state = benchmark(decode_d50, d50)
+    assert state.segments == STRIPS[strip]
+
+
+def test_decode_d60(benchmark):
+    benchmark(decode_d60, codec.encode_d60(codec.EFFECT_WAVE2, 70))
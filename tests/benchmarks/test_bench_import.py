@@ -0,0 +1,51 @@
+"""Import time of the light platform, the module Home Assistant loads at setup."""
+
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+pytest.importorskip("homeassistant")
+
+from conftest import PACKAGE_DIR  # noqa: E402
+
+# Fresh interpreter: Home Assistant's own modules are imported first, so the
+# timing covers the integration and what it pulls in beyond them (NumPy used to).
+FRESH_IMPORT = textwrap.dedent(f"""
+    import sys, time, types
+    import aiohttp, homeassistant.components.light, homeassistant.components.number, homeassistant.components.sensor
+    import homeassistant.helpers.storage, homeassistant.helpers.event, homeassistant.helpers.entity_registry
+    package = types.ModuleType("lepro_led")
+    package.__path__ = [{str(PACKAGE_DIR)!r}]
+    sys.modules["lepro_led"] = package
+    start = time.perf_counter()
+    import lepro_led.light
+    print((time.perf_counter() - start) * 1000, "numpy" in sys.modules)
+""")
+
+
+def test_import_light(benchmark):
+    """Re-executes the integration's modules (dependencies stay imported)."""
+    saved = {name: module for name, module in sys.modules.items() if name.startswith("lepro_led.")}
+
+    def purge():
+        for name in [name for name in sys.modules if name.startswith("lepro_led.")]:
+            del sys.modules[name]
+
+    def do_import():
+        __import__("lepro_led.light")
+
+    try:
+        benchmark.pedantic(do_import, setup=purge, rounds=20, warmup_rounds=1)
+    finally:
+        purge()
+        sys.modules.update(saved)
+
+    output = subprocess.run(
+        [sys.executable, "-c", FRESH_IMPORT], capture_output=True, text=True, check=True
+    ).stdout.split()
+    benchmark.extra_info["fresh_import_ms"] = round(float(output[0]), 1)
+    # the speed curve is plain math since the lookup tables replaced NumPy
+    assert output[1] == "False"
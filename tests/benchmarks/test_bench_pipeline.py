@@ -0,0 +1,238 @@
+"""Inbound routing and command publishing benchmarks, offline against emulated devices.
+
+The lights are real LeproLedLight entities that are not added to hass, so
+state writes are attempted and counted as skipped.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+pytest.importorskip("homeassistant")
+
+from emulator import EmulatedBroker, IntegrationStack, device_info, message  # noqa: E402
+
+from lepro_led import codec  # noqa: E402
+from lepro_led.light import LeproLedLight  # noqa: E402
+from lepro_led.ratelimit import PublishLimiter  # noqa: E402
+from lepro_led.router import MessageRouter  # noqa: E402
+
+GRADIENT = b"".join(bytes((i * 10, 128, 250 - i * 10)) for i in range(25))
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def legacy_handler(device_entity_map, segments_map, numbers_map):
+    """The message handler closure from light.async_setup_entry before MessageRouter, kept
+    as a comparison case. Copied as it was; only the hass.data lookup of the number
+    entities is replaced by numbers_map."""
+
+    async def handle_mqtt_message(message):
+        try:
+            topic = message.topic.value
+            payload = json.loads(message.payload.decode())
+            _LOGGER.debug("Received MQTT message: %s - %s", topic, payload)
+
+            parts = topic.split('/')
+            if len(parts) < 4 or parts[0] != "le":
+                return
+
+            did = parts[1]
+            message_type = parts[3]
+            entity = device_entity_map.get(did)
+
+            if not entity:
+                return
+
+            if message_type in ["rpt", "set", "getr"]:
+                data = payload.get('d', {})
+
+                if 'd1' in data:
+                    entity._is_on = bool(data['d1'])
+
+                if 'd2' in data:
+                    entity._mode = data['d2']
+
+                if 'd52' in data:
+                    entity._brightness = entity._map_device_brightness(data['d52'])
+                    entity._attr_brightness = entity._brightness
+
+                if 'd50' in data:
+                    entity._parse_d50(data['d50'])
+
+                if 'd60' in data:
+                    sens, parsed_effect = entity._parse_d60(data['d60'])
+                    entity._sensitivity = sens
+                    if parsed_effect:
+                        entity._effect = parsed_effect
+
+                if entity._mode == 3 and entity._effect not in entity.SPECIAL_EFFECTS:
+                    entity._effect = entity.EFFECT_FLASH
+
+                entity.async_write_ha_state()
+
+                try:
+                    for num in numbers_map.get(did, []):
+                        try:
+                            num.async_write_ha_state()
+                        except Exception:
+                            pass
+                except Exception:
+                    pass
+
+                try:
+                    for seg in segments_map.get(did, []):
+                        seg.async_write_ha_state()
+                except Exception:
+                    pass
+
+                _LOGGER.debug("Updated state for %s: on=%s, mode=%s, effect=%s, brightness=%s, speed=%s, rgb=%s, sensitivity=%s",
+                             entity.name, entity._is_on, entity._mode, entity._effect, entity._brightness, entity._speed, entity._segment_colors[0], entity._sensitivity)
+
+        except Exception as e:
+            _LOGGER.error("Error processing MQTT message: %s", e)
+
+    return handle_mqtt_message
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.mark.parametrize("devices", [1, 100, 1000])
+def test_route_rpt(benchmark, loop, devices):
+    """One rpt per device through MessageRouter: brightness changes, every 4th with a new d50."""
+
+    async def build():
+        router = MessageRouter()
+        for did in range(devices):
+            router.add_device(str(did), LeproLedLight(device_info(str(did)), None, "bench"))
+        return router
+
+    router = loop.run_until_complete(build())
+    rounds = []
+    for n in range(2):
+        d50 = codec.format_d50(GRADIENT if n else bytes(75), codec.EFFECT_SOLID, None)
+        rounds.append([
+            message(f"le/{did}/prp/rpt", {"d": {"d52": 100 + n * 500, **({"d50": d50} if did % 4 == 0 else {})}})
+            for did in range(devices)
+        ])
+    batches = itertools.cycle(rounds)
+
+    async def route(batch):
+        for msg in batch:
+            await router.async_handle_message(msg)
+
+    benchmark(lambda: loop.run_until_complete(route(next(batches))))
+    benchmark.extra_info["messages"] = devices
+
+
+@pytest.mark.parametrize("handler", ["router", "legacy"])
+def test_route_rpt_handlers(benchmark, loop, monkeypatch, handler):
+    """test_route_rpt[1000] through MessageRouter and through the handler it replaced.
+
+    The lights are not in hass; their state writes are made no-ops here, as
+    the old handler gave up on the first failing write.
+    """
+    writes = []
+    monkeypatch.setattr(LeproLedLight, "async_write_ha_state", lambda self: writes.append(self))
+    devices = 1000
+
+    async def build():
+        lights = {str(did): LeproLedLight(device_info(str(did)), None, "bench") for did in range(devices)}
+        if handler == "legacy":
+            return legacy_handler(lights, {}, {})
+        router = MessageRouter()
+        for did, light in lights.items():
+            router.add_device(did, light)
+        return router.async_handle_message
+
+    handle = loop.run_until_complete(build())
+    rounds = []
+    for n in range(2):
+        d50 = codec.format_d50(GRADIENT if n else bytes(75), codec.EFFECT_SOLID, None)
+        rounds.append([
+            message(f"le/{did}/prp/rpt", {"d": {"d52": 100 + n * 500, **({"d50": d50} if did % 4 == 0 else {})}})
+            for did in range(devices)
+        ])
+    batches = itertools.cycle(rounds)
+
+    async def route(batch):
+        for msg in batch:
+            await handle(msg)
+
+    benchmark(lambda: loop.run_until_complete(route(next(batches))))
+    benchmark.extra_info["messages"] = devices
+    # every message changed the brightness, so both handlers wrote every light
+    assert len(writes) >= devices
+
+
+def test_route_unrouted(benchmark, loop):
+    """1000 messages of devices not in the table, dropped before parsing."""
+    router = MessageRouter()
+    batch = [message(f"le/other{n}/prp/rpt", {"d": {"d52": 500}}) for n in range(1000)]
+
+    async def route():
+        for msg in batch:
+            await router.async_handle_message(msg)
+
+    benchmark(lambda: loop.run_until_complete(route()))
+    benchmark.extra_info["messages"] = len(batch)
+
+
+def _stack(loop):
+    async def start():
+        stack = await IntegrationStack(EmulatedBroker(devices=1)).__aenter__()
+        # measure the integration's own work, not the publish budget
+        stack.client.limiter = PublishLimiter(1e9, 1e9, 1e9, 1e9)
+        return stack
+
+    return loop.run_until_complete(start())
+
+
+def test_turn_on_publish(benchmark, loop):
+    """async_turn_on until its prp/set has gone out (no echo or report handled)."""
+    stack = _stack(loop)
+    stack.broker.subscriptions.clear()
+    light = stack.lights["1"]
+    brightness = itertools.cycle((64, 192))
+    benchmark(lambda: loop.run_until_complete(light.async_turn_on(brightness=next(brightness))))
+    loop.run_until_complete(stack.__aexit__(None, None, None))
+
+
+def test_turn_on_round_trip(benchmark, loop):
+    """async_turn_on with a new colour until the device's rpt has been handled and acked."""
+    stack = _stack(loop)
+    light = stack.lights["1"]
+    colors = itertools.cycle(((255, 0, 0), (0, 0, 255)))
+
+    async def round_trip():
+        await light.async_turn_on(rgb_color=next(colors))
+        await stack.wait_idle()
+
+    benchmark(lambda: loop.run_until_complete(round_trip()))
+    assert stack.ack_tracker.stats("1").acked == stack.ack_tracker.stats("1").sent
+    loop.run_until_complete(stack.__aexit__(None, None, None))
+
+
+@pytest.mark.parametrize("devices", [10, 100, 1000])
+def test_time_to_first_state(benchmark, devices):
+    """Startup until every light has its state: create the lights, connect,
+    subscribe (batched), poll every device and handle all the getr answers."""
+
+    async def startup():
+        async with IntegrationStack(EmulatedBroker(devices=devices)) as stack:
+            stack.client.limiter = PublishLimiter(1e9, 1e9, 1e9, 1e9)
+            await asyncio.gather(*(light._request_state_update() for light in stack.lights.values()))
+            await stack.wait_idle()
+            assert stack.metrics.messages["getr"] == devices
+
+    benchmark.pedantic(lambda: asyncio.run(startup()), rounds=5, warmup_rounds=1)
+    benchmark.extra_info["devices"] = devices
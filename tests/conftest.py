@@ -0,0 +1,17 @@
+"""Shared test setup.
+
+The integration's package __init__ imports Home Assistant; the modules under
+test here (codec, segments, ...) don't, so they are imported as submodules of
+a bare ``lepro_led`` package pointing at the integration directory.
+"""
+
+import sys
+import types
+from pathlib import Path
+
+PACKAGE_DIR = Path(__file__).resolve().parents[1] / "custom_components" / "lepro_led"
+
+if "lepro_led" not in sys.modules:
+    package = types.ModuleType("lepro_led")
+    package.__path__ = [str(PACKAGE_DIR)]
+    sys.modules["lepro_led"] = package
@@ -0,0 +1,289 @@
+"""Emulated Lepro devices behind an in-process MQTT broker, for tests and benchmarks.
+
+EmulatedBroker stands in for aiomqtt.Client: patch lepro_led.mqtt.Client with
+EmulatedBroker.client and the integration's own MQTTClientWrapper (rate
+limiter, offline queue, reconnect loop) and MessageRouter run unmodified on
+top of it. Devices apply prp/set the way the firmware does and answer with
+rpt / getr, optionally late, lossy, or with reports of their own.
+No network, pure asyncio.
+"""
+
+from __future__ import annotations
+import asyncio
+import json
+import random
+
+from aiomqtt import Message, MqttError
+
+from lepro_led import codec
+
+WHITE_STRIP = codec.format_d50(bytes(codec.DEFAULT_COLOR) * codec.SEGMENT_COUNT, codec.EFFECT_SOLID, None)
+
+# state of a fresh device: on, static white, full brightness
+DEFAULT_STATE = {
+    "d1": 1,
+    "d2": 2,
+    "d50": WHITE_STRIP,
+    "d52": 1000,
+    "d60": "2000064320000",
+    "online": 1,
+}
+
+_DISCONNECT = object()
+
+
+def message(topic, payload):
+    """An inbound aiomqtt message; payload is a dict (JSON-encoded) or bytes."""
+    if not isinstance(payload, bytes):
+        payload = json.dumps(payload).encode()
+    return Message(topic, payload, 0, False, 0, None)
+
+
+def topic_filters(topic):
+    """Every subscription filter that matches topic: each level itself or +, or # from any level on."""
+    filters = [""]
+    matching = []
+    for level in topic.split("/"):
+        matching += [f"{f}/#" if f else "#" for f in filters]
+        filters = [f"{f}/{x}" if f else x for f in filters for x in (level, "+")]
+    # "a/#" matches "a" too
+    return frozenset(matching + filters + [f"{f}/#" for f in filters])
+
+
+def device_info(did, series="S1-5", **state):
+    """Cloud device listing entry, as passed to LeproLedLight."""
+    return {"did": did, "fid": 1, "name": f"Strip {did}", "series": series, "switch": 1, **state}
+
+
+class EmulatedDevice:
+    """One strip: a dp table updated by prp/set."""
+
+    def __init__(self, did, **state):
+        self.did = str(did)
+        self.state = {**DEFAULT_STATE, **state}
+        self.commands = 0
+
+    def apply(self, data):
+        """Apply a dp dict; returns the dps as reported back in rpt."""
+        data = dict(data)
+        # a colour block switches to static mode, a special effect to music mode
+        if "d50" in data:
+            data.setdefault("d2", 2)
+        elif "d60" in data:
+            data.setdefault("d2", 3)
+        self.state.update(data)
+        return data
+
+    def read(self, keys):
+        return {k: self.state[k] for k in keys if k in self.state}
+
+
+class EmulatedBroker:
+    """In-process broker with a fleet of emulated devices, usable as an aiomqtt.Client.
+
+    latency delays each device answer (s), drop_rate is the share of commands
+    and polls that get no answer, and subscribe_latency is the SUBACK round
+    trip (s). Everything the integration publishes is kept in
+    self.published, and the topics of each SUBSCRIBE packet in
+    self.subscribe_packets.
+    """
+
+    def __init__(self, devices=0, latency=0.0, drop_rate=0.0, seed=0, subscribe_latency=0.0):
+        self.devices = {}
+        self.add_devices(devices)
+        self.latency = latency
+        self.drop_rate = drop_rate
+        self._random = random.Random(seed)
+        self.subscribe_latency = subscribe_latency
+        self.subscriptions = set()
+        self.subscribe_packets = []
+        self.published = []
+        self._filters = {}  # topic -> filters matching it
+        self.connections = 0
+        # messages handed to the client, and device answers still under way
+        self.delivered = 0
+        self.pending = 0
+        self._queue = None
+
+    def add_devices(self, count, first=1):
+        dids = [str(did) for did in range(first, first + count)]
+        for did in dids:
+            self.devices[did] = EmulatedDevice(did)
+        return dids
+
+    # -- aiomqtt.Client -----------------------------------------------------
+
+    def client(self, **kwargs):
+        """Client factory: patch lepro_led.mqtt.Client with this."""
+        return self
+
+    async def __aenter__(self):
+        self.connections += 1
+        # clean session
+        self.subscriptions.clear()
+        self._queue = asyncio.Queue()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._queue = None
+
+    async def subscribe(self, topic, qos=0):
+        topics = [t for t, _ in topic] if isinstance(topic, list) else [topic]
+        self.subscribe_packets.append(topics)
+        if self.subscribe_latency:
+            await asyncio.sleep(self.subscribe_latency)
+        self.subscriptions.update(topics)
+
+    async def unsubscribe(self, topic):
+        self.subscriptions.discard(topic)
+
+    async def publish(self, topic, payload=None, qos=0):
+        if self._queue is None:
+            raise MqttError("not connected")
+        self.published.append((topic, payload))
+        # the broker echoes prp/set to every subscriber, the sender included
+        self.deliver(topic, payload.encode() if isinstance(payload, str) else payload)
+        parts = topic.split("/")
+        device = self.devices.get(parts[1]) if len(parts) == 4 and parts[0] == "le" else None
+        if device is None or parts[2] != "prp":
+            return
+        if self.drop_rate and self._random.random() < self.drop_rate:
+            return
+        request = json.loads(payload)
+        if parts[3] == "set":
+            device.commands += 1
+            answer = ("rpt", device.apply(request.get("d", {})))
+        elif parts[3] == "get":
+            answer = ("getr", device.read(request.get("d", ())))
+        else:
+            return
+        self._answer(device, *answer, request.get("id"))
+
+    @property
+    def messages(self):
+        return self._messages()
+
+    async def _messages(self):
+        queue = self._queue
+        while True:
+            item = await queue.get()
+            if item is _DISCONNECT:
+                raise MqttError("connection lost")
+            yield item
+
+    # -- device side --------------------------------------------------------
+
+    def _answer(self, device, message_type, data, cmd_id=None):
+        payload = {"d": data, "t": 0}
+        if cmd_id is not None:
+            payload["id"] = cmd_id
+        topic = f"le/{device.did}/prp/{message_type}"
+        if self.latency:
+            self.pending += 1
+            asyncio.get_running_loop().call_later(self.latency, self._deliver_late, topic, payload)
+        else:
+            self.deliver(topic, payload)
+
+    def _deliver_late(self, topic, payload):
+        self.pending -= 1
+        self.deliver(topic, payload)
+
+    def deliver(self, topic, payload):
+        """Hand a message to the connected client if it is subscribed to topic."""
+        if self._queue is None:
+            return
+        filters = self._filters.get(topic)
+        if filters is None:
+            filters = self._filters[topic] = topic_filters(topic)
+        if not filters.isdisjoint(self.subscriptions):
+            self.delivered += 1
+            self._queue.put_nowait(message(topic, payload))
+
+    def report(self, did, **data):
+        """Spontaneous rpt, e.g. the strip's own remote or button."""
+        device = self.devices[str(did)]
+        self._answer(device, "rpt", device.apply(data))
+
+    def drop_connection(self):
+        """Make the client's message loop fail, as on a lost connection."""
+        if self._queue is not None:
+            self._queue.put_nowait(_DISCONNECT)
+
+    def commands_for(self, did):
+        topic = f"le/{did}/prp/set"
+        return [json.loads(payload)["d"] for t, payload in self.published if t == topic]
+
+
+class IntegrationStack:
+    """The integration's MQTT pipeline wired like light.async_setup_entry, against a broker.
+
+    One LeproLedLight per device plus the client wrapper, ack tracker,
+    metrics and router; segment_entities adds a LeproSegmentLight per
+    segment, wildcard allows the single le/+/prp/# subscription. Needs Home Assistant installed; the entities are not added to
+    hass, so their state writes count as skipped.
+    """
+
+    def __init__(self, broker, dids=None, segment_entities=False, wildcard=False, **light_options):
+        from lepro_led import mqtt
+        from lepro_led.ack import CommandTracker
+        from lepro_led.light import LeproLedLight, LeproSegmentLight
+        from lepro_led.metrics import PipelineMetrics
+        from lepro_led.router import MessageRouter
+
+        self._mqtt = mqtt
+        self.broker = broker
+        self.client = mqtt.MQTTClientWrapper(None, "broker.test", 8883, None, "test")
+        # reconnect right away instead of after a randomised backoff
+        self.client._backoff = lambda attempt: 0
+        self.ack_tracker = CommandTracker(self.client.publish)
+        self.metrics = PipelineMetrics()
+        self.router = MessageRouter(self.ack_tracker, self.metrics)
+        self.lights = {}
+        for did in dids if dids is not None else broker.devices:
+            device = device_info(did, **broker.devices[did].state)
+            light = LeproLedLight(device, self.client, "test", **light_options)
+            light._ack_tracker = self.ack_tracker
+            light._metrics = self.metrics
+            if segment_entities:
+                light._segments = [LeproSegmentLight(light, i) for i in range(len(light._segment_colors))]
+            self.lights[did] = light
+            self.router.add_device(did, light)
+        self.client.set_message_callback(self.router.async_handle_message)
+        self._wildcard = wildcard
+        self._client_class = None
+
+    async def __aenter__(self):
+        self._client_class, self._mqtt.Client = self._mqtt.Client, self.broker.client
+        await self.client.subscribe_many(
+            self._mqtt.select_subscription_topics(self.lights, "test", self._wildcard)
+        )
+        await self.wait_connected()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.ack_tracker.cancel()
+        for light in self.lights.values():
+            await light.async_will_remove_from_hass()
+        await self.client.disconnect()
+        self._mqtt.Client = self._client_class
+
+    async def wait_connected(self, timeout=5):
+        """Wait until the client is connected and has resubscribed."""
+        async with asyncio.timeout(timeout):
+            while not self.client.connected or not self.broker.subscriptions >= set(self.client._subscriptions):
+                await asyncio.sleep(0)
+
+    def _busy(self):
+        flush = self.client._flush_task
+        return (
+            (self.client.connected and len(self.client.offline))
+            or (flush is not None and not flush.done())
+            or self.broker.pending
+            or sum(self.metrics.messages.values()) < self.broker.delivered
+        )
+
+    async def wait_idle(self, timeout=5):
+        """Wait until the offline queue is flushed and every delivered message handled."""
+        async with asyncio.timeout(timeout):
+            while self._busy():
+                await asyncio.sleep(0.001 if self.broker.pending else 0)
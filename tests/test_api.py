@@ -0,0 +1,201 @@
+"""Cloud discovery and bootstrap against a local stand-in for the Lepro REST API."""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("aiohttp")
+pytest.importorskip("aiofiles")
+
+from aiohttp import web  # noqa: E402
+from aiohttp.test_utils import TestServer  # noqa: E402
+
+from lepro_led import api as lepro_api  # noqa: E402
+from lepro_led.api import (  # noqa: E402
+    DEVICE_LIST_CONCURRENCY,
+    LeproApiError,
+    LeproCloudApi,
+    async_bootstrap,
+    async_get_all_devices,
+)
+
+CLOUD = "https://api-na-iot.lepro.com"
+FAMILIES = 20
+EMPTY_FAMILY = 5
+
+
+class LeproCloud:
+    """Lepro REST stand-in: FAMILIES families of three devices each, device 0 shared by all."""
+
+    def __init__(self, failing_family=None, delay=0.01, auth_error_in_body=False, family_error=None):
+        self.failing_family = failing_family
+        # body of a failed family list request (HTTP 200)
+        self.family_error = family_error
+        # reject a stale token with a 200 and a code in the body instead of a 401
+        self.auth_error_in_body = auth_error_in_body
+        self.delay = delay
+        self.token = "token-1"
+        self.logins = 0
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        app = web.Application()
+        app.router.add_post("/user/login", self.login)
+        app.router.add_get("/user/profile", self.profile)
+        app.router.add_get("/family/list/timestamp/{timestamp}", self.families)
+        app.router.add_get("/v3/device/list/fid/{fid}/timestamp/{timestamp}", self.devices)
+        app.router.add_get("/certs/{name}", self.cert)
+        self.server = TestServer(app)
+
+    def url(self, path=""):
+        return str(self.server.make_url(path))
+
+    def _authorized(self, request):
+        self.requests.append(request.path)
+        return request.headers.get("Authorization") == f"Bearer {self.token}"
+
+    def _unauthorized(self):
+        if self.auth_error_in_body:
+            return web.json_response({"code": 401, "msg": "token invalid", "data": None})
+        return web.json_response({}, status=401)
+
+    async def login(self, request):
+        self.logins += 1
+        return web.json_response({"code": 0, "data": {"token": self.token}})
+
+    async def profile(self, request):
+        if not self._authorized(request):
+            return self._unauthorized()
+        mqtt = {"host": "mqtt.test", "root": self.url("/certs/root"), "cert": self.url("/certs/client")}
+        return web.json_response({"code": 0, "data": {"uid": 42, "mqtt": mqtt}})
+
+    async def families(self, request):
+        if not self._authorized(request):
+            return self._unauthorized()
+        if self.family_error:
+            return web.json_response(self.family_error)
+        families = [{"fid": fid, "name": f"Family {fid}"} for fid in range(1, FAMILIES + 1)]
+        # a family entry without an id is ignored
+        families.append({"name": "broken"})
+        return web.json_response({"code": 0, "data": {"list": families}})
+
+    async def devices(self, request):
+        if not self._authorized(request):
+            return self._unauthorized()
+        fid = int(request.match_info["fid"])
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        if fid == self.failing_family:
+            return web.json_response({}, status=500)
+        if fid == EMPTY_FAMILY:
+            return web.json_response({"code": 0, "data": None})
+        devices = [{"did": 0, "fid": 1, "name": "shared"}]
+        devices += [{"did": fid * 100 + n, "fid": fid, "name": f"Strip {fid}.{n}"} for n in (1, 2)]
+        return web.json_response({"code": 0, "data": {"list": devices}})
+
+    async def cert(self, request):
+        return web.Response(body=f"-- {request.match_info['name']} --".encode())
+
+
+async def start(cloud, monkeypatch, session_holder):
+    import aiohttp
+
+    await cloud.server.start_server()
+    for name in ("LOGIN_URL", "FAMILY_LIST_URL", "USER_PROFILE_URL", "DEVICE_LIST_URL"):
+        monkeypatch.setattr(lepro_api, name, getattr(lepro_api, name).replace(CLOUD, cloud.url().rstrip("/")))
+    session = session_holder.session = aiohttp.ClientSession()
+    return LeproCloudApi(session, "user@example.com", "secret", "00:11:22:33:44:55")
+
+
+def run(cloud, monkeypatch, scenario):
+    async def main():
+        holder = SimpleNamespace()
+        api = await start(cloud, monkeypatch, holder)
+        try:
+            return await scenario(api)
+        finally:
+            await holder.session.close()
+            await cloud.server.close()
+
+    return asyncio.run(main())
+
+
+def test_devices_of_every_family(monkeypatch):
+    cloud = LeproCloud()
+
+    async def scenario(api):
+        families = await api.async_get_families()
+        return families, await async_get_all_devices(api, families)
+
+    families, devices = run(cloud, monkeypatch, scenario)
+    assert len(families) == FAMILIES + 1
+    dids = [str(device["did"]) for device in devices]
+    # two per family except the empty one, plus the shared device listed once
+    assert len(dids) == len(set(dids)) == 2 * (FAMILIES - 1) + 1
+    assert str(EMPTY_FAMILY * 100 + 1) not in dids
+    assert cloud.requests.count("/user/profile") == 0
+    assert cloud.logins == 1
+    assert 1 < cloud.max_in_flight <= DEVICE_LIST_CONCURRENCY
+
+
+def test_failing_family_fails_discovery(monkeypatch):
+    cloud = LeproCloud(failing_family=3)
+
+    async def scenario(api):
+        families = await api.async_get_families()
+        with pytest.raises(LeproApiError, match="500"):
+            await async_get_all_devices(api, families)
+        # the remaining requests were cancelled, not left running
+        await asyncio.sleep(0.05)
+        return cloud.in_flight
+
+    assert run(cloud, monkeypatch, scenario) == 0
+    assert len([path for path in cloud.requests if "/device/list/" in path]) < FAMILIES
+
+
+@pytest.mark.parametrize("auth_error_in_body", [False, True])
+def test_expired_token_logs_in_again(monkeypatch, auth_error_in_body):
+    cloud = LeproCloud(auth_error_in_body=auth_error_in_body)
+
+    async def scenario(api):
+        api.token = "stale-token-from-cache"
+        return await async_get_all_devices(api, await api.async_get_families())
+
+    devices = run(cloud, monkeypatch, scenario)
+    assert len(devices) == 2 * (FAMILIES - 1) + 1
+    assert cloud.logins == 1
+
+
+def test_bootstrap(monkeypatch, tmp_path):
+    cloud = LeproCloud()
+    # the SSL context is built from the downloaded files; the stand-in's aren't real certs
+    monkeypatch.setattr(lepro_api, "create_ssl_context", lambda *paths: ("ssl", paths))
+
+    async def scenario(api):
+        loop = asyncio.get_running_loop()
+        hass = SimpleNamespace(async_add_executor_job=lambda func, *args: loop.run_in_executor(None, func, *args))
+        paths = [tmp_path / name for name in ("root.pem", "client.pem", "client.key")]
+        return await async_bootstrap(hass, api, *map(str, paths))
+
+    result = run(cloud, monkeypatch, scenario)
+    assert result.mqtt_info["host"] == "mqtt.test"
+    assert len(result.devices) == 2 * (FAMILIES - 1) + 1
+    assert result.ssl_context[0] == "ssl"
+    assert (tmp_path / "root.pem").read_text() == "-- root --"
+    assert (tmp_path / "client.pem").read_text() == "-- client --"
+    assert {"login", "profile", "family_list", "device_list", "total"} <= set(result.timings)
+
+
+def test_error_code_in_body_fails(monkeypatch):
+    cloud = LeproCloud(family_error={"code": 500, "msg": "server busy", "data": None})
+
+    async def scenario(api):
+        with pytest.raises(LeproApiError, match="server busy"):
+            await api.async_get_families()
+
+    run(cloud, monkeypatch, scenario)
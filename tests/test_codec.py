@@ -0,0 +1,163 @@
+"""Tests for the d50/d60 codec."""
+
+import pytest
+
+from lepro_led.codec import (
+    D50_EFFECT_TAILS,
+    EFFECT_SOLID,
+    SPECIAL_EFFECT_TO_D60_PREFIX,
+    color_distance,
+    decode_d50,
+    decode_d60,
+    encode_d50,
+    encode_d60,
+    format_d50,
+    hex_to_speed,
+    quantize_segments,
+    speed_to_hex,
+)
+
+RED = (255, 0, 0)
+GREEN = (0, 255, 0)
+BLUE = (0, 0, 255)
+
+
+def packed(*runs):
+    """Packed RGB bytes from (color, length) runs."""
+    return b"".join(bytes(color) * length for color, length in runs)
+
+
+STRIP = packed((RED, 10), (GREEN, 5), (BLUE, 10))
+
+
+@pytest.mark.parametrize("speed", range(101))
+def test_speed_hex_round_trip(speed):
+    assert hex_to_speed(speed_to_hex(speed)) == speed
+
+
+@pytest.mark.parametrize("effect", sorted(D50_EFFECT_TAILS))
+@pytest.mark.parametrize("speed", range(101))
+def test_d50_round_trip(effect, speed):
+    state = decode_d50(format_d50(STRIP, effect, speed))
+    assert state.segments == STRIP
+    assert state.effect == effect
+    assert state.speed == (None if effect == EFFECT_SOLID else speed)
+
+
+def test_d50_known_payload():
+    d50 = format_d50(STRIP, EFFECT_SOLID, None)
+    assert d50 == "N01:P10003FF000000FF000000FFF210003000A0005000AU3V3000640000E1;"
+    assert encode_d50(STRIP, EFFECT_SOLID, None) == d50
+
+
+def test_d50_without_color_block_keeps_colors():
+    state = decode_d50("N01:U3V300164" + speed_to_hex(30) + "E1;")
+    assert state.segments is None
+    assert state.effect == "clockwise"
+    assert state.speed == 30
+
+
+def test_d50_unknown_tail_is_solid():
+    state = decode_d50(format_d50(STRIP, "no_such_effect", 50))
+    assert state.segments == STRIP
+    assert state.effect == EFFECT_SOLID
+    assert state.speed is None
+
+
+@pytest.mark.parametrize("groups", [1, 9, 10, 25, 99, 100, 150])
+def test_d50_group_count_width(groups):
+    # num_groups is written in decimal without padding: 1..3 digits, told
+    # apart from the colours by the colour block length modulo 6
+    colors = [(i, 255 - i, i % 7) for i in range(groups)]
+    segments = packed(*((color, i % 3 + 1) for i, color in enumerate(colors)))
+    d50 = format_d50(segments, EFFECT_SOLID, None)
+    assert d50.startswith(f"N01:P1000{groups}")
+    assert decode_d50(d50).segments == segments
+
+
+@pytest.mark.parametrize(
+    "d50",
+    [
+        # no length block
+        "N01:P10001FF0000U3V3000640000E1;",
+        # colour block one hex digit short
+        "N01:P10002FF000000FF0F210002000A000FU3V3000640000E1;",
+        # group count says 3, two colours follow
+        "N01:P10003FF000000FF00F210003000A000FU3V3000640000E1;",
+        # group count not a number
+        "N01:P1000XFF0000F21000X0019U3V3000640000E1;",
+        # lengths cut off
+        "N01:P10002FF000000FF00F210002000AU3V3000640000E1;",
+        # bad colour hex
+        "N01:P10001GG0000F2100010019U3V3000640000E1;",
+    ],
+)
+def test_d50_malformed(d50):
+    with pytest.raises(ValueError):
+        decode_d50(d50)
+
+
+def test_d50_encode_accepts_memoryview():
+    assert format_d50(memoryview(bytearray(STRIP)), EFFECT_SOLID, None) == format_d50(STRIP, EFFECT_SOLID, None)
+
+
+def test_quantize_zero_tolerance_is_exact_runs():
+    assert quantize_segments(STRIP, 0) == [(RED, 10), (GREEN, 5), (BLUE, 10)]
+
+
+def test_quantize_merges_close_colors():
+    segments = packed(((250, 0, 0), 4), ((255, 5, 0), 4), ((245, 0, 5), 4), (BLUE, 3))
+    groups = quantize_segments(segments, 40)
+    assert [length for _, length in groups] == [12, 3]
+    assert groups[1] == (BLUE, 3)
+    assert color_distance(groups[0][0], (250, 2, 2)) < 10
+
+
+def test_quantize_keeps_distant_colors_apart():
+    assert len(quantize_segments(STRIP, 100)) == 3
+
+
+@pytest.mark.parametrize("tolerance", [0, 10, 30, 80])
+def test_quantize_bounds_error(tolerance):
+    # a smooth gradient: every segment differs from the next
+    segments = packed(*(((i * 10, 0, 255 - i * 10), 1) for i in range(25)))
+    groups = quantize_segments(segments, tolerance)
+    assert sum(length for _, length in groups) == 25
+    pos = 0
+    for color, length in groups:
+        for i in range(pos, pos + length):
+            assert color_distance(segments[3 * i:3 * i + 3], color) <= tolerance
+        pos += length
+    # a larger tolerance never needs more groups
+    assert len(groups) <= len(quantize_segments(segments, max(0, tolerance - 10)))
+
+
+def test_quantize_picks_fewest_runs():
+    # one run can't hold all four (mean 30 is 60 away from both ends), two can
+    segments = packed(((0, 0, 0), 1), ((0, 20, 0), 1), ((0, 40, 0), 1), ((0, 60, 0), 1))
+    groups = quantize_segments(segments, 45)
+    assert len(groups) == 2
+    assert sum(length for _, length in groups) == 4
+
+
+def test_encode_with_tolerance_round_trips_within_tolerance():
+    segments = packed(((250, 0, 0), 12), ((0, 0, 250), 1), ((0, 5, 255), 12))
+    state = decode_d50(format_d50(segments, EFFECT_SOLID, None, tolerance=30))
+    assert len(state.segments) == len(segments)
+    for i in range(0, len(segments), 3):
+        assert color_distance(state.segments[i:i + 3], segments[i:i + 3]) <= 30
+
+
+@pytest.mark.parametrize("effect", sorted(SPECIAL_EFFECT_TO_D60_PREFIX))
+@pytest.mark.parametrize("sensitivity", [0, 1, 25, 50, 99, 100])
+def test_d60_round_trip(effect, sensitivity):
+    d60 = encode_d60(effect, sensitivity)
+    decoded_sensitivity, decoded_effect = decode_d60(d60)
+    assert decoded_effect == effect
+    assert abs(decoded_sensitivity - sensitivity) <= 1
+
+
+def test_d60_unknown():
+    assert encode_d60("solid", 50) is None
+    assert decode_d60("") == (50, None)
+    assert decode_d60("9999999320000")[1] is None
@@ -0,0 +1,93 @@
+"""Diagnostics counters, read from a pipeline running against emulated devices."""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("homeassistant")
+
+from emulator import EmulatedBroker, IntegrationStack  # noqa: E402
+
+from lepro_led import codec  # noqa: E402
+from lepro_led.const import DOMAIN  # noqa: E402
+from lepro_led.diagnostics import async_get_config_entry_diagnostics  # noqa: E402
+from lepro_led.segments import SegmentBuffer  # noqa: E402
+
+
+async def diagnostics(stack):
+    entry = SimpleNamespace(entry_id="test", data={}, options={})
+    hass = SimpleNamespace(data={DOMAIN: {"test": {
+        "devices": stack.lights,
+        "mqtt_client": stack.client,
+        "ack_tracker": stack.ack_tracker,
+        "metrics": stack.metrics,
+    }}})
+    return await async_get_config_entry_diagnostics(hass, entry)
+
+
+def test_command_coalescing():
+    async def scenario():
+        broker = EmulatedBroker(devices=2)
+        async with IntegrationStack(broker, command_window=0.01) as stack:
+            light = stack.lights["1"]
+            # a slider drag: five changes inside one window
+            for speed in range(10, 60, 10):
+                light._speed = speed
+                light._coalescer.schedule()
+            await asyncio.sleep(0.05)
+            await stack.lights["2"].async_turn_on(brightness=10)
+            await stack.wait_idle()
+            assert len(broker.commands_for("1")) == 1
+            assert (await diagnostics(stack))["command_coalescing"] == {
+                "requested": 6,
+                "published": 2,
+                "suppressed": 4,
+            }
+
+    asyncio.run(scenario())
+
+
+def test_state_writes_per_entity():
+    async def scenario():
+        broker = EmulatedBroker(devices=1)
+        async with IntegrationStack(broker, segment_entities=True) as stack:
+            light = stack.lights["1"]
+            written = []
+            for entity in (light, *light._segments):
+                entity.async_write_ha_state = lambda entity=entity: written.append(entity.unique_id)
+            colors = SegmentBuffer()
+            colors.load(light._segment_colors.snapshot())
+            colors[3] = (255, 0, 0)
+            d50 = codec.format_d50(colors.snapshot(), light._effect, light._speed)
+            # segment 4 changes colour, then a report that changes nothing
+            broker.report("1", d50=d50)
+            broker.report("1", d50=d50)
+            await stack.wait_idle()
+            stats = (await diagnostics(stack))["state_writes"]["1"]
+            assert stats["1"] == {"written": 0, "skipped": 2}
+            assert stats["1_segment_04"] == {"written": 1, "skipped": 1}
+            assert stats["1_segment_05"] == {"written": 0, "skipped": 2}
+            assert written == ["1_segment_04"]
+
+    asyncio.run(scenario())
+
+
+def test_state_write_rate_survives_device_removal():
+    async def scenario():
+        broker = EmulatedBroker(devices=2)
+        async with IntegrationStack(broker) as stack:
+            light = stack.lights["2"]
+            light.async_write_ha_state = lambda: None
+            broker.report("2", d1=0)
+            await stack.wait_idle()
+            stack.metrics.sample(0, stack.client)
+            # the device is removed (background sync); its writes stay counted
+            stack.router.remove_device("2")
+            del stack.lights["2"]
+            stack.metrics.sample(1, stack.client)
+            assert stack.metrics.state_writes == 1
+            assert stack.metrics.values["state_writes_rate"] == 0
+            assert (await diagnostics(stack))["pipeline"]["state_writes"] == 1
+
+    asyncio.run(scenario())
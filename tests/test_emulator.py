@@ -0,0 +1,260 @@
+"""The MQTT pipeline (client wrapper, router, light, ack tracking) against emulated devices."""
+
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("homeassistant")
+
+from emulator import EmulatedBroker, IntegrationStack  # noqa: E402
+
+from lepro_led import codec  # noqa: E402
+from lepro_led.mqtt import SUBSCRIBE_BATCH_SIZE  # noqa: E402
+from lepro_led.ratelimit import PRIORITY_INTERACTIVE, PublishLimiter  # noqa: E402
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_turn_on_is_confirmed_by_the_device():
+    async def scenario():
+        broker = EmulatedBroker(devices=2)
+        async with IntegrationStack(broker) as stack:
+            light = stack.lights["1"]
+            await light.async_turn_on(brightness=128, rgb_color=(255, 0, 0))
+            await stack.wait_idle()
+            device = broker.devices["1"].state
+            assert device["d1"] == 1
+            assert device["d52"] == 501
+            assert codec.decode_d50(device["d50"]).segments == bytes((255, 0, 0)) * 25
+            assert broker.devices["2"].commands == 0
+            assert stack.ack_tracker.stats("1").acked == 1
+            assert stack.metrics.messages["rpt"] == 1
+            assert stack.metrics.messages["set"] == 1
+
+    run(scenario())
+
+
+def test_device_report_updates_the_light():
+    async def scenario():
+        broker = EmulatedBroker(devices=1)
+        async with IntegrationStack(broker) as stack:
+            broker.report("1", d1=0)
+            await stack.wait_idle()
+            assert stack.lights["1"]._is_on is False
+
+            broker.report("1", d1=1, d52=250, d50=codec.format_d50(bytes((0, 0, 255)) * 25, "breath", 40))
+            await stack.wait_idle()
+            light = stack.lights["1"]
+            assert light._is_on is True
+            assert light._brightness == 63
+            assert light._effect == "breath"
+            assert light._speed == 40
+            assert light._segment_colors[24] == (0, 0, 255)
+
+    run(scenario())
+
+
+def test_poll_reads_device_state():
+    async def scenario():
+        broker = EmulatedBroker(devices=1)
+        # changed behind the integration's back (no report)
+        broker.devices["1"].state["d1"] = 0
+        async with IntegrationStack(broker) as stack:
+            await stack.lights["1"]._request_state_update()
+            await stack.wait_idle()
+            assert stack.metrics.messages["getr"] == 1
+            assert stack.lights["1"]._is_on is False
+
+    run(scenario())
+
+
+def test_unanswered_command_is_retried():
+    async def scenario():
+        broker = EmulatedBroker(devices=1, drop_rate=1.0)
+        async with IntegrationStack(broker) as stack:
+            stack.ack_tracker.deadline = 0.05
+            await stack.lights["1"].async_turn_on(brightness=255)
+            await asyncio.sleep(0.3)
+            assert len(broker.commands_for("1")) == 2
+            stats = stack.ack_tracker.stats("1")
+            assert (stats.acked, stats.retried, stats.timed_out) == (0, 1, 1)
+            assert stats.unresponsive
+
+    run(scenario())
+
+
+def test_retry_keeps_the_command_lane():
+    async def scenario():
+        broker = EmulatedBroker(devices=1, drop_rate=1.0)
+        async with IntegrationStack(broker) as stack:
+            stack.ack_tracker.deadline = 0.05
+            await stack.lights["1"].async_turn_off()
+            await asyncio.sleep(0.08)
+            assert len(broker.commands_for("1")) == 2
+            assert stack.client.limiter.admitted[PRIORITY_INTERACTIVE] == 2
+
+    run(scenario())
+
+
+def test_cancel_stops_pending_retries():
+    async def scenario():
+        broker = EmulatedBroker(devices=1, drop_rate=1.0)
+        async with IntegrationStack(broker) as stack:
+            # the device's budget is spent by the command: its republish has to wait
+            stack.client.limiter = PublishLimiter(device_rate=1, device_burst=1)
+            stack.ack_tracker.deadline = 0.05
+            await stack.lights["1"].async_turn_on(brightness=255)
+            while not stack.ack_tracker.stats("1").retried:
+                await asyncio.sleep(0.001)
+            stack.ack_tracker.cancel()
+            await asyncio.sleep(1.1)
+            assert len(broker.commands_for("1")) == 1
+            assert stack.ack_tracker.stats("1").timed_out == 0
+
+    run(scenario())
+
+
+def test_transition_stops_tracking_earlier_commands():
+    async def scenario():
+        broker = EmulatedBroker(devices=1, drop_rate=1.0)
+        async with IntegrationStack(broker) as stack:
+            stack.ack_tracker.deadline = 0.05
+            light = stack.lights["1"]
+            await light.async_turn_on(brightness=100)
+            broker.drop_rate = 0
+            await light.async_turn_on(brightness=255, transition=0.2)
+            await light._stream
+            await stack.wait_idle()
+            # the unanswered brightness=100 is not republished in the middle of the fade
+            stats = stack.ack_tracker.stats("1")
+            assert (stats.retried, stats.timed_out, stats.acked) == (0, 0, 1)
+            assert [c.get("d52") for c in broker.commands_for("1")].count(392) == 1
+            assert broker.devices["1"].state["d52"] == 1000
+
+    run(scenario())
+
+
+def test_commands_while_disconnected_are_sent_on_reconnect():
+    async def scenario():
+        broker = EmulatedBroker(devices=3, latency=0.01)
+        async with IntegrationStack(broker) as stack:
+            broker.drop_connection()
+            while stack.client.connected:
+                await asyncio.sleep(0)
+            for light in stack.lights.values():
+                await light.async_turn_on(rgb_color=(0, 255, 0))
+            await stack.lights["1"].async_turn_off()
+            assert len(stack.client.offline) == 3
+
+            await stack.wait_connected()
+            await stack.wait_idle()
+            assert broker.connections == 2
+            assert len(stack.client.offline) == 0
+            # the queued turn_on and turn_off of device 1 went out merged
+            assert [json.loads(p)["d"]["d1"] for t, p in broker.published if t == "le/1/prp/set"] == [0]
+            assert broker.devices["1"].state["d1"] == 0
+            assert broker.devices["2"].state["d1"] == 1
+
+    run(scenario())
+
+
+def test_commands_to_a_device_keep_their_order_across_lanes():
+    async def scenario():
+        broker = EmulatedBroker(devices=1)
+        async with IntegrationStack(broker) as stack:
+            # one publish per device at a time: the later commands have to queue
+            stack.client.limiter = PublishLimiter(device_rate=20, device_burst=1)
+            light = stack.lights["1"]
+            await asyncio.gather(
+                light.async_turn_on(brightness=100),
+                light.async_turn_on(rgb_color=(255, 0, 0)),  # effect lane
+                light.async_turn_off(),  # interactive lane
+            )
+            await stack.wait_idle()
+            assert [c.get("d1") for c in broker.commands_for("1")] == [1, 1, 0]
+            assert broker.devices["1"].state["d1"] == 0
+            assert light._is_on is False
+
+    run(scenario())
+
+
+def test_live_command_supersedes_queued_one_for_its_device():
+    async def scenario():
+        broker = EmulatedBroker(devices=30)
+        async with IntegrationStack(broker) as stack:
+            broker.drop_connection()
+            while stack.client.connected:
+                await asyncio.sleep(0)
+            for light in stack.lights.values():
+                await light.async_turn_on(rgb_color=(0, 0, 255))
+            # the flush (at most 10 publishes at once for the connection) is still
+            # going when the user turns the last strip off
+            stack.client.limiter = PublishLimiter(burst=10)
+            await stack.wait_connected()
+            await stack.lights["30"].async_turn_off()
+            await stack.wait_idle()
+            assert [c["d1"] for c in broker.commands_for("30")] == [0]
+            device = broker.devices["30"].state
+            assert device["d1"] == 0
+            assert codec.decode_d50(device["d50"]).segments == bytes((0, 0, 255)) * 25
+            assert stack.client.offline.flushed == 29
+            assert stack.client.offline.replaced == 1
+
+    run(scenario())
+
+
+@pytest.mark.parametrize("wildcard", [False, True])
+def test_startup_subscribes_in_batches(wildcard):
+    async def scenario():
+        # a slow SUBACK: sequential packets would take 13 round trips
+        broker = EmulatedBroker(devices=100, subscribe_latency=0.05)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        async with IntegrationStack(broker, wildcard=wildcard) as stack:
+            elapsed = loop.time() - start
+            topics = [topic for packet in broker.subscribe_packets for topic in packet]
+            if wildcard:
+                assert broker.subscribe_packets == [["le/test/act/app/exe", "le/+/prp/#"]]
+            else:
+                assert len(topics) == len(set(topics)) == 101
+                assert max(len(packet) for packet in broker.subscribe_packets) == SUBSCRIBE_BATCH_SIZE
+                assert len(broker.subscribe_packets) == 13
+            assert elapsed < 0.05 * 3
+            # every device is reachable
+            broker.report("100", d1=0)
+            await stack.wait_idle()
+            assert stack.lights["100"]._is_on is False
+
+    run(scenario())
+
+
+@pytest.mark.parametrize("devices", [100, 1000])
+def test_fleet_turn_on_over_a_lossy_link(devices):
+    async def scenario():
+        broker = EmulatedBroker(devices=devices, latency=0.005, drop_rate=0.05, seed=devices)
+        async with IntegrationStack(broker) as stack:
+            stack.client.limiter = PublishLimiter(1e9, 1e9, 1e9, 1e9)
+            # long enough for a loop busy with a thousand answers
+            stack.ack_tracker.deadline = 0.5
+            await asyncio.gather(*(light.async_turn_on(rgb_color=(0, 0, 255)) for light in stack.lights.values()))
+            async with asyncio.timeout(10):
+                while stack.ack_tracker.as_dict()["in_flight"]:
+                    await asyncio.sleep(0.01)
+            await stack.wait_idle()
+
+            blue = bytes((0, 0, 255)) * 25
+            stats = {did: stack.ack_tracker.stats(did) for did in broker.devices}
+            # each command is either confirmed by the device or flagged after its retry
+            assert all(s.acked + s.timed_out == 1 for s in stats.values())
+            for did, device in broker.devices.items():
+                applied = codec.decode_d50(device.state["d50"]).segments == blue
+                assert applied == (stats[did].acked == 1)
+                assert stack.lights[did]._segment_colors.snapshot() == blue
+            retried = sum(s.retried for s in stats.values())
+            assert 0 < retried < devices // 4
+            assert len(broker.published) >= devices + retried
+
+    run(scenario())
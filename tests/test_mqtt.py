@@ -0,0 +1,69 @@
+"""Tests for the offline queue."""
+
+import json
+
+from lepro_led.mqtt import OfflineQueue
+
+
+def set_payload(**data):
+    return json.dumps({"d": data})
+
+
+def test_put_keeps_latest_per_topic_and_merges_sets():
+    queue = OfflineQueue()
+    queue.put("le/1/prp/set", set_payload(d1=1, d52=500), 1)
+    queue.put("le/1/prp/set", set_payload(d1=0), 0)
+    queue.put("le/1/prp/get", json.dumps({"d": ["d1"]}), 2)
+    queue.put("le/1/prp/get", json.dumps({"d": ["d52"]}), 2)
+    messages = queue.drain()
+    assert [(topic, json.loads(payload)["d"], priority) for topic, payload, priority, _ in messages] == [
+        ("le/1/prp/set", {"d1": 0, "d52": 500}, 0),
+        ("le/1/prp/get", ["d52"], 2),
+    ]
+    assert (queue.queued, queue.replaced, queue.flushed) == (4, 2, 0)
+
+
+def test_overflow_drops_oldest_topic():
+    queue = OfflineQueue(size=2)
+    for did in range(3):
+        queue.put(f"le/{did}/prp/set", set_payload(d1=1), 1)
+    assert [topic for topic, *_ in queue.drain()] == ["le/1/prp/set", "le/2/prp/set"]
+    assert queue.overflow == 1
+
+
+def test_restore_keeps_age_and_place():
+    queue = OfflineQueue(ttl=60)
+    queue.put("le/1/prp/set", set_payload(d50="red"), 1)
+    queue.put("le/2/prp/set", set_payload(d1=1), 1)
+    queue.put("le/3/prp/set", set_payload(d1=1), 1)
+    first, second, third = queue.drain()
+    queue.restore(*third)
+    # nearly expired when drained: restoring must not make it young again
+    topic, payload, priority, queued_at = first
+    queue.restore(topic, payload, priority, queued_at - 59.5)
+    assert [topic for topic, *_ in queue.drain()] == ["le/1/prp/set", "le/3/prp/set"]
+    queue.restore(topic, payload, priority, queued_at - 61)
+    assert queue.drain() == []
+    assert queue.expired == 1
+    # restoring is not queueing again
+    assert queue.queued == 3
+
+
+def test_restore_under_newer_message():
+    queue = OfflineQueue(ttl=60)
+    queue.put("le/1/prp/set", set_payload(d50="red"), 1)
+    [message] = queue.drain()
+    # queued again meanwhile: the newer data wins, the older is kept under it
+    queue.put("le/1/prp/set", set_payload(d1=0), 0)
+    queue.restore(message[0], message[1], message[2], message[3] - 100)
+    [(_, payload, priority, _)] = queue.drain()
+    assert json.loads(payload)["d"] == {"d50": "red", "d1": 0}
+    assert priority == 0
+
+
+def test_take():
+    queue = OfflineQueue()
+    queue.put("le/1/prp/set", set_payload(d1=1), 1)
+    assert queue.take("le/1/prp/set")[0] == set_payload(d1=1)
+    assert queue.take("le/1/prp/set") is None
+    assert len(queue) == 0
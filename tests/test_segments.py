@@ -0,0 +1,77 @@
+"""Tests for the packed segment colour buffer."""
+
+import tracemalloc
+
+import pytest
+
+from lepro_led import codec
+from lepro_led.segments import SegmentBuffer, series_segment_count
+
+GRADIENT = b"".join(bytes((i * 10, 128, 250 - i * 10)) for i in range(25))
+
+
+def test_index_and_iterate():
+    buffer = SegmentBuffer(3)
+    buffer[0] = (255, 0, 0)
+    buffer[-1] = (0.0, 0.0, 255.0)
+    assert list(buffer) == [(255, 0, 0), tuple(codec.DEFAULT_COLOR), (0, 0, 255)]
+    assert buffer[2] == (0, 0, 255)
+    with pytest.raises(IndexError):
+        buffer[3]
+
+
+def test_load_pads_and_truncates():
+    buffer = SegmentBuffer(4)
+    buffer.load(bytes((1, 2, 3, 4, 5, 6)))
+    assert list(buffer) == [(1, 2, 3), (4, 5, 6), (4, 5, 6), (4, 5, 6)]
+    buffer.load(bytes(range(15)))
+    assert len(buffer) == 4 and buffer[3] == (9, 10, 11)
+    buffer.load(bytes(range(6)), resize=True)
+    assert len(buffer) == 2
+
+
+def test_paint_repeats_and_compact():
+    buffer = SegmentBuffer(5)
+    buffer.paint([(255, 0, 0), (0, 255, 0)])
+    assert buffer.compact() == "FF0000,00FF00,FF0000,00FF00,FF0000"
+    buffer.fill((0, 0, 255))
+    assert buffer.compact() == "0000FFx5"
+    assert buffer.snapshot() == bytes((0, 0, 255)) * 5
+
+
+def test_series_segment_count():
+    assert series_segment_count("S1-5-EU") == 25
+    assert series_segment_count(None) is None
+
+
+def allocated(build, devices):
+    """Bytes still allocated by build() run once per device."""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        kept = [build() for _ in range(devices)]
+        size = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    del kept
+    return size
+
+
+@pytest.mark.parametrize("devices", [100, 1000])
+def test_segment_state_memory(devices):
+    # a decoded 25-segment gradient, kept per device
+    segments = codec.decode_d50(codec.format_d50(GRADIENT, codec.EFFECT_SOLID, None)).segments
+
+    def packed():
+        buffer = SegmentBuffer()
+        buffer.load(segments)
+        return buffer
+
+    def tuples():
+        # the former layout: a list of (r, g, b) tuples
+        data = iter(segments)
+        return [tuple(color) for color in zip(data, data, data)]
+
+    per_device = allocated(packed, devices) / devices
+    assert per_device < 256
+    assert allocated(tuples, devices) / devices > 5 * per_device